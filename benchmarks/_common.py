@@ -0,0 +1,66 @@
+"""Helpers shared by the benchmark scripts"""
+import argparse
+import json
+import os
+import pathlib
+import platform
+import statistics
+import sys
+import time
+
+SRC_DIRECTORY = pathlib.Path(__file__).resolve().parent.parent / 'src'
+
+# Make the package importable when it is run from a checkout without being installed
+if str(SRC_DIRECTORY) not in sys.path:
+    sys.path.insert(0, str(SRC_DIRECTORY))
+
+
+def get_env():
+    """Environment for subprocesses so that they import the package from the checkout"""
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([str(SRC_DIRECTORY)] + [p for p in [env.get('PYTHONPATH')] if p])
+    return env
+
+
+def get_parser(description):
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--repeat', type=int, default=5, help='Number of runs per measurement (median is reported)')
+    parser.add_argument('--output', help='Also write the result to this json file')
+    return parser
+
+
+class Timer:
+    """Context manager measuring wall time in seconds"""
+
+    def __enter__(self):
+        self._t0 = time.perf_counter()
+        self.elapsed = None
+        return self
+
+    def __exit__(self, *args):
+        self.elapsed = time.perf_counter() - self._t0
+
+
+def measure(func, repeat):
+    """Calls func repeat times. Returns dict with median, min and max in milliseconds"""
+    times = []
+    for _ in range(repeat):
+        with Timer() as t:
+            func()
+        times.append(t.elapsed * 1000)
+    return dict(median_ms=statistics.median(times), min_ms=min(times), max_ms=max(times), runs=len(times))
+
+
+def emit(benchmark, results, output=None, **extra):
+    """Prints the results as json (and writes them to output). Returns the document"""
+    document = dict(benchmark=benchmark,
+                    timestamp=time.strftime('%Y-%m-%dT%H:%M:%S'),
+                    python=platform.python_version(),
+                    platform=platform.platform(),
+                    results=results,
+                    **extra)
+    text = json.dumps(document, indent=2)
+    print(text)
+    if output:
+        pathlib.Path(output).write_text(text)
+    return document
@@ -0,0 +1,189 @@
+"""
+Benchmarks package discovery, file list filtering, content check, statistics, selection and delivery on synthetic
+archives of different sizes.
+
+    python benchmarks/bench_scaling.py --sizes 1000 10000 100000 --output scaling.json
+
+An archive is generated in a temporary directory for each size (see generate_archive.py), or
+use --archive-directory to keep them between runs. Steps that need a dependency that is not
+installed (file_explorer for grouping, ctd_processing for delivery) are reported as skipped.
+"""
+import pathlib
+import shutil
+import statistics
+import sys
+import tempfile
+
+import _common
+import generate_archive
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+DEFAULT_DELIVER_LIMIT = 50
+SELECTION_CHANGE = 0.1  # Part of the selection that is changed in the selection benchmark
+
+
+def _skipped(e):
+    return dict(skipped=f'Missing dependency: {e}')
+
+
+def bench_discovery(root_directory, repeat):
+    from sharktools_data_delivery.scanner import list_files
+    from sharktools_data_delivery.scanner import iter_package_batches
+
+    results = dict(list_files=_common.measure(lambda: list_files(root_directory), repeat))
+    packs = []
+
+    def scan():
+        packs.clear()
+        for done, total, batch in iter_package_batches(root_directory):
+            packs.extend(batch)
+
+    try:
+        import file_explorer
+    except ImportError as e:
+        results['scan'] = _skipped(e)
+        return results, None
+    results['scan'] = _common.measure(scan, repeat)
+    results['scan']['nr_packages'] = len(packs)
+    return results, list(packs)
+
+
+def bench_filter(root_directory, repeat):
+    """Builds the filter index of the file list and times a search per keystroke"""
+    from sharktools_data_delivery.filter_index import PackageFilterIndex
+    from sharktools_data_delivery.scanner import list_files
+
+    paths = [path for path in list_files(root_directory) if path.suffix == '.txt']
+    index = PackageFilterIndex()
+
+    def build():
+        index.clear()
+        for path in paths:
+            index.add(path.stem, file_name=path.name)
+
+    results = dict(build=_common.measure(build, repeat))
+    results['build']['nr_keys'] = len(index)
+    year = (index.get_years() or [''])[-1]
+    ship = (index.get_ships(year) or [''])[0]
+    text = f'{year} {ship.lower()} 01'
+    times = []
+    nr_matches = 0
+    for _ in range(repeat):
+        index.add('SBE09_0000_20000101_0000_00XX_00_0000')  # Clears the cache of earlier searches
+        for i in range(1, len(text) + 1):
+            with _common.Timer() as t:
+                keys = index.search(text[:i])
+            times.append(t.elapsed * 1000)
+            nr_matches = len(keys or [])
+    results['keystroke'] = dict(median_ms=statistics.median(times), min_ms=min(times), max_ms=max(times),
+                                runs=len(times), text=text, nr_matches=nr_matches)
+    return results
+
+
+def bench_check_content(packs, repeat):
+    try:
+        from sharktools_data_delivery.gui.page_ctd import PageCTD
+    except ImportError as e:
+        return _skipped(e)
+    return _common.measure(lambda: PageCTD._check_packs_content(packs), repeat)
+
+
+def bench_statistics(packs, repeat):
+    from sharktools_data_delivery.statistics import get_package_statistics
+    from sharktools_data_delivery.statistics import get_statistics_for_packs
+    from sharktools_data_delivery.statistics import SuffixStatistics
+
+    results = dict(get_statistics_for_packs=_common.measure(lambda: get_statistics_for_packs(packs), repeat))
+
+    package_statistics = {pack.key: get_package_statistics(pack) for pack in packs}
+    keys = list(package_statistics)
+    selected = set(keys[::2])
+    nr_changed = max(1, int(len(selected) * SELECTION_CHANGE))
+    new_selected = set(keys[nr_changed * 2::2]) | set(keys[1:nr_changed * 2:2])
+
+    def select():
+        # Same update as PageCTD._on_select_files: only the difference is added and removed
+        stat = SuffixStatistics()
+        for key in selected:
+            stat.add(key, package_statistics[key])
+        with _common.Timer() as t:
+            for key in selected - new_selected:
+                stat.remove(key)
+            for key in new_selected - selected:
+                stat.add(key, package_statistics[key])
+            stat.total_nr_files
+        times.append(t.elapsed * 1000)
+
+    times = []
+    for _ in range(repeat):
+        select()
+    results['selection_change'] = dict(median_ms=statistics.median(times), min_ms=min(times),
+                                       max_ms=max(times), runs=len(times),
+                                       nr_selected=len(selected), nr_changed=len(selected ^ new_selected))
+    return results
+
+
+def bench_delivery(packs, deliver_limit, repeat):
+    from sharktools_data_delivery.delivery import DeliveryEngine
+
+    results = {}
+    with tempfile.TemporaryDirectory() as output_dir:
+        engine = DeliveryEngine(output_dir, incremental=True)
+        results['plan'] = _common.measure(lambda: engine.plan(packs), repeat)
+        try:
+            import ctd_processing
+        except ImportError as e:
+            results['deliver'] = _skipped(e)
+            return results
+        subset = [pack for pack in packs if pack['txt']][:deliver_limit]
+        engine = DeliveryEngine(output_dir, overwrite=True)
+        with _common.Timer() as t:
+            errors = engine.deliver(subset)
+        results['deliver'] = dict(total_ms=t.elapsed * 1000, nr_packages=len(subset), nr_errors=len(errors),
+                                  ms_per_package=t.elapsed * 1000 / max(1, len(subset)))
+    return results
+
+
+def bench_size(nr_files, archive_directory, deliver_limit, repeat):
+    root_directory = pathlib.Path(archive_directory, f'archive_{nr_files}')
+    if not root_directory.exists():
+        with _common.Timer() as t:
+            archive = generate_archive.generate_archive(root_directory, nr_files=nr_files)
+        archive['generate_ms'] = t.elapsed * 1000
+    else:
+        archive = dict(reused=True)
+
+    results = dict(archive=archive)
+    results['filter'] = bench_filter(root_directory, repeat)
+    results['discovery'], packs = bench_discovery(root_directory, repeat)
+    if packs is None:
+        for name in ['check_content', 'statistics', 'delivery']:
+            results[name] = dict(skipped='No packages (scan skipped)')
+        return results
+    results['check_content'] = bench_check_content(packs, repeat)
+    results['statistics'] = bench_statistics(packs, repeat)
+    results['delivery'] = bench_delivery(packs, deliver_limit, repeat)
+    return results
+
+
+def main(argv=None):
+    parser = _common.get_parser(__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='Number of files per archive')
+    parser.add_argument('--archive-directory', help='Directory where the archives are generated and kept')
+    parser.add_argument('--deliver-limit', type=int, default=DEFAULT_DELIVER_LIMIT,
+                        help='Number of packages delivered in the delivery benchmark')
+    args = parser.parse_args(argv)
+
+    archive_directory = args.archive_directory or tempfile.mkdtemp(prefix='sharktools_dd_bench_')
+    try:
+        results = {str(nr_files): bench_size(nr_files, archive_directory, args.deliver_limit, args.repeat)
+                   for nr_files in args.sizes}
+    finally:
+        if not args.archive_directory:
+            shutil.rmtree(archive_directory, ignore_errors=True)
+    _common.emit('scaling', results, output=args.output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,163 @@
+"""
+Measures the import time of the package and the startup time of the GUI and fails (exit code 1)
+if a time budget is exceeded.
+
+    python benchmarks/bench_startup.py --import-budget-ms 300 --startup-budget-ms 3000
+
+The GUI startup needs a display. On a machine without one, run under a virtual display:
+
+    xvfb-run python benchmarks/bench_startup.py
+
+Budgets can also be set with the environment variables SHARKTOOLS_DD_IMPORT_BUDGET_MS and
+SHARKTOOLS_DD_STARTUP_BUDGET_MS. Parts that can not run (no display, SHARKtools not installed)
+are reported as skipped. A skipped part fails the benchmark with --require-measurement, which is
+the default when the environment variable CI is set (as on most CI services), so that a budget is
+not silently left unchecked. Use --no-require-measurement to allow skipped parts.
+"""
+import argparse
+import functools
+import logging
+import os
+import pathlib
+import statistics
+import subprocess
+import sys
+import tempfile
+import types
+
+import _common
+
+IMPORT_MODULES = ['sharktools_data_delivery', 'sharktools_data_delivery.cli']
+DEFAULT_IMPORT_BUDGET_MS = float(os.environ.get('SHARKTOOLS_DD_IMPORT_BUDGET_MS', 300))
+DEFAULT_STARTUP_BUDGET_MS = float(os.environ.get('SHARKTOOLS_DD_STARTUP_BUDGET_MS', 3000))
+DEFAULT_REQUIRE_MEASUREMENT = bool(os.environ.get('CI'))
+NR_SLOWEST_MODULES = 10
+
+
+def parse_importtime(stderr):
+    """Returns {module: (self_us, cumulative_us)} from the output of python -X importtime"""
+    result = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        result[name.strip()] = (int(self_us), int(cumulative_us))
+    return result
+
+
+def run_importtime(code):
+    return subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                          capture_output=True, text=True, env=_common.get_env())
+
+
+def measure_import(module, repeat):
+    # Modules imported by the interpreter itself are not part of the cost of the module
+    baseline = set(parse_importtime(run_importtime('pass').stderr))
+    times = []
+    modules = {}
+    for _ in range(repeat):
+        proc = run_importtime(f'import {module}')
+        if proc.returncode:
+            return dict(error=proc.stderr.strip().splitlines()[-1])
+        modules = parse_importtime(proc.stderr)
+        times.append(modules[module][1] / 1000)
+    modules = {name: us for name, us in modules.items() if name not in baseline}
+    slowest = sorted(modules.items(), key=lambda item: item[1][0], reverse=True)[:NR_SLOWEST_MODULES]
+    return dict(median_ms=statistics.median(times),
+                min_ms=min(times),
+                max_ms=max(times),
+                runs=len(times),
+                slowest_modules_self_ms={name: us[0] / 1000 for name, us in slowest})
+
+
+def _timed(phases, name, func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with _common.Timer() as t:
+            result = func(*args, **kwargs)
+        phases[name] = phases.get(name, 0) + t.elapsed * 1000
+        return result
+    return wrapper
+
+
+def measure_startup():
+    """Runs App.startup in a Tk root and returns the time for the startup and its phases"""
+    try:
+        import tkinter as tk
+        root = tk.Tk()
+    except Exception as e:
+        return dict(skipped=f'No display: {e}')
+    try:
+        from sharktools_data_delivery.app import App
+        from sharktools_data_delivery.gui.page_ctd import PageCTD
+    except ImportError as e:
+        root.destroy()
+        return dict(skipped=f'Missing dependency: {e}')
+
+    phases = {}
+    App.startup_pages = _timed(phases, 'startup_pages', App.startup_pages)
+    PageCTD.startup = _timed(phases, 'PageCTD.startup', PageCTD.startup)
+    PageCTD._build = _timed(phases, 'PageCTD._build', PageCTD._build)
+
+    with tempfile.TemporaryDirectory() as directory:
+        # Only the attributes that App uses from the SHARKtools main app
+        main_app = types.SimpleNamespace(info_popup=None,
+                                         root_directory=directory,
+                                         log_directory=str(pathlib.Path(directory, 'log')),
+                                         logger=logging.getLogger('bench_startup'),
+                                         user_manager=types.SimpleNamespace(user=None),
+                                         user=None)
+        try:
+            with _common.Timer() as t_init:
+                app = App(root, main_app)
+            with _common.Timer() as t_startup:
+                app.startup()
+                root.update_idletasks()
+        except Exception as e:
+            return dict(error=f'{e.__class__.__name__}: {e}')
+        finally:
+            root.destroy()
+    return dict(total_ms=(t_init.elapsed + t_startup.elapsed) * 1000,
+                init_ms=t_init.elapsed * 1000,
+                startup_ms=t_startup.elapsed * 1000,
+                phases_ms=phases)
+
+
+def main(argv=None):
+    parser = _common.get_parser(__doc__.strip().splitlines()[0])
+    parser.add_argument('--import-budget-ms', type=float, default=DEFAULT_IMPORT_BUDGET_MS,
+                        help='Budget for the median import time of each module')
+    parser.add_argument('--startup-budget-ms', type=float, default=DEFAULT_STARTUP_BUDGET_MS,
+                        help='Budget for App construction and startup')
+    parser.add_argument('--require-measurement', action=argparse.BooleanOptionalAction,
+                        default=DEFAULT_REQUIRE_MEASUREMENT,
+                        help='Fail if a measurement is skipped (default on if the environment variable CI is set)')
+    args = parser.parse_args(argv)
+
+    results = {f'import {module}': measure_import(module, args.repeat) for module in IMPORT_MODULES}
+    results['startup'] = measure_startup()
+
+    failures = []
+    for name, result in results.items():
+        if 'error' in result:
+            failures.append(f'{name}: {result["error"]}')
+        elif 'skipped' in result and args.require_measurement:
+            failures.append(f'{name}: skipped ({result["skipped"]})')
+    for module in IMPORT_MODULES:
+        median = results[f'import {module}'].get('median_ms')
+        if median is not None and median > args.import_budget_ms:
+            failures.append(f'import {module}: {median:.1f} ms > {args.import_budget_ms} ms')
+    total = results['startup'].get('total_ms')
+    if total is not None and total > args.startup_budget_ms:
+        failures.append(f'startup: {total:.1f} ms > {args.startup_budget_ms} ms')
+
+    _common.emit('startup', results, output=args.output,
+                 budgets=dict(import_ms=args.import_budget_ms, startup_ms=args.startup_budget_ms),
+                 require_measurement=args.require_measurement,
+                 failures=failures,
+                 ok=not failures)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
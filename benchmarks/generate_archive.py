@@ -0,0 +1,95 @@
+"""
+Generates a synthetic CTD archive for benchmarks.
+
+    python benchmarks/generate_archive.py <directory> --nr-files 10000 --seed 1
+
+The archive is laid out as <year>/<data|cnv|raw> with one cast (package) per key
+on the form SBE09_1387_<yyyymmdd>_<hhmm>_<ship>_<cruise>_<serno>. Each cast gets each suffix
+with the probability in SUFFIX_PROBABILITY, so some casts lack the standard format (.txt)
+or metadata files, as in a real archive. The same seed gives the same archive.
+"""
+import argparse
+import datetime
+import pathlib
+import random
+import sys
+
+# Probability that a cast has a file with the suffix and the subdirectory it is placed in
+SUFFIX_PROBABILITY = {
+    '.txt': 0.95,
+    '.cnv': 0.95,
+    '.hex': 1.0,
+    '.hdr': 1.0,
+    '.bl': 0.8,
+    '.btl': 0.8,
+    '.ros': 0.8,
+    '.xmlcon': 1.0,
+    '.deliverynote': 0.9,
+    '.metadata': 0.9,
+    '.sensorinfo': 0.9,
+    '.jpg': 0.05,
+}
+SUFFIX_DIRECTORY = {'.txt': 'data', '.deliverynote': 'data', '.metadata': 'data', '.sensorinfo': 'data',
+                    '.cnv': 'cnv'}
+DEFAULT_DIRECTORY = 'raw'
+# Approximate file sizes in bytes
+SUFFIX_SIZE = {'.hex': 4096, '.cnv': 2048, '.txt': 2048}
+DEFAULT_SIZE = 256
+SHIPS = ['77SE', '34AR', '26DA', '77SN']
+YEARS = [2020, 2021, 2022, 2023]
+EXPECTED_FILES_PER_CAST = sum(SUFFIX_PROBABILITY.values())
+
+
+def get_key(rnd, serno):
+    year = rnd.choice(YEARS)
+    date = datetime.date(year, 1, 1) + datetime.timedelta(days=rnd.randrange(365))
+    return f'SBE09_1387_{date:%Y%m%d}_{rnd.randrange(24):02d}{rnd.randrange(60):02d}_' \
+           f'{rnd.choice(SHIPS)}_{rnd.randrange(20):02d}_{serno:04d}', year
+
+
+def generate_archive(directory, nr_files=1000, seed=1, scale_size=1.0):
+    """
+    Creates about nr_files files in directory.
+    :return: dict with nr_casts, nr_files and nr_bytes actually written
+    """
+    rnd = random.Random(seed)
+    directory = pathlib.Path(directory)
+    nr_casts = max(1, round(nr_files / EXPECTED_FILES_PER_CAST))
+    created_directories = set()
+    used_keys = set()
+    written_files = 0
+    written_bytes = 0
+    for serno in range(nr_casts):
+        key, year = get_key(rnd, serno % 10000)
+        while key in used_keys:
+            key, year = get_key(rnd, serno % 10000)
+        used_keys.add(key)
+        for suffix, probability in SUFFIX_PROBABILITY.items():
+            if rnd.random() > probability:
+                continue
+            sub_directory = directory / str(year) / SUFFIX_DIRECTORY.get(suffix, DEFAULT_DIRECTORY)
+            if sub_directory not in created_directories:
+                sub_directory.mkdir(parents=True, exist_ok=True)
+                created_directories.add(sub_directory)
+            size = int(SUFFIX_SIZE.get(suffix, DEFAULT_SIZE) * scale_size)
+            path = sub_directory / f'{key}{suffix}'
+            path.write_bytes(rnd.randbytes(size))
+            written_files += 1
+            written_bytes += size
+    return dict(nr_casts=nr_casts, nr_files=written_files, nr_bytes=written_bytes)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('directory')
+    parser.add_argument('--nr-files', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--scale-size', type=float, default=1.0, help='Factor for the file sizes')
+    args = parser.parse_args(argv)
+    result = generate_archive(args.directory, nr_files=args.nr_files, seed=args.seed, scale_size=args.scale_size)
+    print(f'{result["nr_files"]} files in {result["nr_casts"]} casts written to {args.directory}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,9 +1,7 @@
 # Copyright (c) 2018 SMHI, Swedish Meteorological and Hydrological Institute
 # License: MIT License (see LICENSE.txt or http://opensource.org/licenses/mit).
 
-from . import gui
-from .app import App
-
+import importlib
 
 INFO = dict(title='Data delivery',
             users_directory='users',
@@ -11,4 +9,15 @@ INFO = dict(title='Data delivery',
                             title='CTD')],
             user_page_class='PageUser')  # Must match name in ALL_PAGES in main app
 
-USER_SETTINGS = []
\ No newline at end of file
+USER_SETTINGS = []
+
+
+def __getattr__(name):
+    # The GUI is imported on first use so that the command line interface can run without tkinter and SHARKtools
+    if name == 'App':
+        from .app import App
+        return App
+    if name == 'gui':
+        # import_module since "from . import gui" would call this function again before gui is imported
+        return importlib.import_module('.gui', __name__)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
\ No newline at end of file
@@ -10,15 +10,17 @@ import tkinter as tk
 import shark_tkinter_lib.tkinter_widgets as tkw
 
 from sharktools import core
+from sharktools_data_delivery import events
 from sharktools_data_delivery import gui
 from sharktools.plugin import PluginApp
 
+# Page name and the name of the page class in gui. Pages are imported and created when they are first shown.
 ALL_PAGES = dict()
-ALL_PAGES['PageCTD'] = gui.PageCTD
+ALL_PAGES['PageCTD'] = 'PageCTD'
 
-APP_TO_PAGE = dict()
-for page_name, page in ALL_PAGES.items():
-    APP_TO_PAGE[page] = page_name
+
+def get_page_class(page_name):
+    return getattr(gui, ALL_PAGES[page_name])
 
 
 class App(PluginApp):
@@ -67,6 +69,9 @@ class App(PluginApp):
 
         self._set_frame()
 
+        # Coalesced events and results from threaded handlers are dispatched in the main loop
+        events.bus.attach_tk(self)
+
         self.startup_pages()
 
         self.page_history = ['PageUser']
@@ -91,26 +96,30 @@ class App(PluginApp):
         tkw.grid_configure(self)
 
     def startup_pages(self):
+        # Destroy old pages if called as an update
+        for frame in getattr(self, 'frames', {}).values():
+            try:
+                frame.destroy()
+            except:
+                pass
+
         # Tuple that store all pages
         self.pages_started = dict()
 
-        # Dictionary to store all frame classes
+        # Dictionary to store the frames that have been created. Pages are created in _get_frame when first shown.
         self.frames = {}
-        
-        # Looping all pages to make them active. 
-        for page_name, Page in ALL_PAGES.items():  # Capital P to emphasize class
-            # Destroy old page if called as an update
-            try:
-                self.frames[page_name].destroy()
-            except:
-                pass
+
+        self.container.rowconfigure(0, weight=1)
+        self.container.columnconfigure(0, weight=1)
+
+    def _get_frame(self, page_name):
+        frame = self.frames.get(page_name)
+        if frame is None:
+            Page = get_page_class(page_name)  # Capital P to emphasize class
             frame = Page(self.container, self)
             frame.grid(row=0, column=0, sticky="nsew")
-
-            self.container.rowconfigure(0, weight=1)
-            self.container.columnconfigure(0, weight=1) 
-            
             self.frames[page_name] = frame
+        return frame
 
     def _set_load_frame(self):
         pass
@@ -129,7 +138,7 @@ class App(PluginApp):
         """
 
         load_page = True
-        frame = self.frames[page_name]
+        frame = self._get_frame(page_name)
         # self.withdraw()
         if not self.pages_started.get(page_name, None):
             frame.startup()
@@ -140,11 +149,11 @@ class App(PluginApp):
         if load_page:
             frame.tkraise()
             self.previous_page = self.active_page
-            self.active_page = page
+            self.active_page = page_name
             # Check page history
-            if page in self.page_history:
+            if page_name in self.page_history:
                 self.page_history.pop()
-                self.page_history.append(page)
+                self.page_history.append(page_name)
         self.update()
 
 
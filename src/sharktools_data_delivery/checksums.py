@@ -0,0 +1,184 @@
+import concurrent.futures
+import hashlib
+import logging
+import os
+import pathlib
+import sqlite3
+
+from .statistics import format_bytes
+from .tracing import tracer
+
+logger = logging.getLogger(__file__)
+
+CHECKSUMS_FILE_NAME = 'checksums.sha256'
+HASH_BUFFER_SIZE = 1024 * 1024
+HASH_WORKERS = min(8, os.cpu_count() or 1)
+DEFAULT_CACHE_PATH = pathlib.Path(pathlib.Path(__file__).parent, 'cache', 'checksums.sqlite')
+# Max number of parameters in one sqlite query
+_QUERY_CHUNK_SIZE = 500
+
+
+def sha256_file(path, buffer_size=HASH_BUFFER_SIZE):
+    """Reads the file into one reused buffer. hashlib releases the GIL so several files can be hashed in threads"""
+    sha = hashlib.sha256()
+    buffer = bytearray(buffer_size)
+    view = memoryview(buffer)
+    with open(path, 'rb', buffering=0) as fid:
+        while True:
+            nr_bytes = fid.readinto(buffer)
+            if not nr_bytes:
+                break
+            sha.update(view[:nr_bytes])
+    return sha.hexdigest()
+
+
+class ChecksumCache:
+    """
+    sha256 of files keyed by path, size and mtime in a sqlite database. A checksum is only
+    returned if the file has the same size and mtime as when the checksum was computed.
+    """
+
+    def __init__(self, file_path=None):
+        self.file_path = pathlib.Path(file_path or DEFAULT_CACHE_PATH)
+        self.file_path.parent.mkdir(parents=True, exist_ok=True)
+        con = self._connect()
+        try:
+            with con:
+                con.execute('CREATE TABLE IF NOT EXISTS checksums '
+                            '(path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, sha256 TEXT)')
+        finally:
+            con.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.file_path, timeout=30)
+
+    def get_many(self, states):
+        """
+        :param states: dict {path: (size, mtime_ns)}
+        :return: dict {path: sha256} for the paths with a valid checksum
+        """
+        paths = list(states)
+        checksums = {}
+        con = self._connect()
+        try:
+            for i in range(0, len(paths), _QUERY_CHUNK_SIZE):
+                chunk = paths[i:i + _QUERY_CHUNK_SIZE]
+                rows = con.execute(f'SELECT path, size, mtime_ns, sha256 FROM checksums '
+                                   f'WHERE path IN ({",".join("?" * len(chunk))})', chunk)
+                for path, size, mtime_ns, sha in rows:
+                    if tuple(states[path]) == (size, mtime_ns):
+                        checksums[path] = sha
+        finally:
+            con.close()
+        return checksums
+
+    def set_many(self, items):
+        """:param items: iterable of (path, size, mtime_ns, sha256)"""
+        con = self._connect()
+        try:
+            with con:
+                con.executemany('INSERT OR REPLACE INTO checksums VALUES (?, ?, ?, ?)', items)
+        finally:
+            con.close()
+
+
+class ChecksumReport:
+    """Result of create_checksum_file"""
+
+    def __init__(self, file_path=None):
+        self.file_path = file_path
+        self.checksums = {}
+        self.nr_known = 0
+        self.nr_cached = 0
+        self.nr_hashed = 0
+        self.nr_bytes_hashed = 0
+        self.errors = {}
+
+    def summary(self):
+        parts = [f'{self.nr_cached} från cache', f'{self.nr_hashed} beräknade ({format_bytes(self.nr_bytes_hashed)} lästa)']
+        if self.nr_known:
+            parts.insert(0, f'{self.nr_known} beräknade vid placering')
+        return f'{len(self.checksums)} filer: {", ".join(parts)}'
+
+
+def get_file_states(paths):
+    """:return: dict {path: (size, mtime_ns)}. Files that have been removed are left out"""
+    states = {}
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        states[str(path)] = (stat.st_size, stat.st_mtime_ns)
+    return states
+
+
+def compute_checksums(paths, workers=HASH_WORKERS, cache=None, known=None, report=None):
+    """
+    Computes the sha256 of the files in a thread pool. Checksums in known ({path: sha256}, e.g.
+    computed while the file was copied) and valid checksums in cache are used without reading the files.
+    :return: ChecksumReport
+    """
+    report = report or ChecksumReport()
+    states = get_file_states(paths)
+    checksums = {path: sha for path, sha in (known or {}).items() if path in states}
+    report.nr_known = len(checksums)
+    if cache is not None:
+        checksums.update(cache.get_many({path: state for path, state in states.items() if path not in checksums}))
+    report.nr_cached = len(checksums) - report.nr_known
+    to_hash = [path for path in states if path not in checksums]
+    with tracer.span('checksums', nr_files=len(states), nr_to_hash=len(to_hash)) as span:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            futures = {executor.submit(sha256_file, path): path for path in to_hash}
+            for future in concurrent.futures.as_completed(futures):
+                path = futures[future]
+                try:
+                    checksums[path] = future.result()
+                except OSError as e:
+                    logger.error(f'Could not compute checksum for {path}: {e}')
+                    report.errors[path] = str(e)
+                    continue
+                report.nr_hashed += 1
+                report.nr_bytes_hashed += states[path][0]
+        span.set(nr_bytes=report.nr_bytes_hashed)
+    if cache is not None:
+        cache.set_many((path, *states[path], sha) for path, sha in checksums.items())
+    report.checksums = {path: checksums[path] for path in states if path in checksums}
+    return report
+
+
+def list_directory_files(directory, exclude_names=(), exclude_directories=()):
+    """Files under directory. exclude_directories are names of directories directly under directory"""
+    directory = str(directory)
+    files = []
+    for root, directories, names in os.walk(directory):
+        if root == directory:
+            directories[:] = [name for name in directories if name not in exclude_directories]
+        for name in names:
+            if name in exclude_names:
+                continue
+            files.append(os.path.join(root, name))
+    return files
+
+
+def create_checksum_file(directory, file_name=CHECKSUMS_FILE_NAME, workers=HASH_WORKERS, cache=None, known=None,
+                         exclude_names=(), exclude_directories=()):
+    """
+    Computes the sha256 of all files in directory and writes them to file_name in directory in the
+    format of sha256sum, so the files can be checked with "sha256sum -c checksums.sha256".
+    :return: ChecksumReport
+    """
+    file_path = pathlib.Path(directory, file_name)
+    temp_path = file_path.with_name(file_path.name + '.tmp')
+    # Only the checksum file and its own temp file (left if an earlier run was interrupted) are excluded,
+    # other .tmp files may be part of the delivery
+    paths = list_directory_files(directory, exclude_names=set(exclude_names) | {file_name, temp_path.name},
+                                 exclude_directories=exclude_directories)
+    report = compute_checksums(paths, workers=workers, cache=cache, known=known, report=ChecksumReport(file_path))
+    lines = [f'{sha}  {pathlib.Path(path).relative_to(directory).as_posix()}\n'
+             for path, sha in sorted(report.checksums.items())]
+    with open(temp_path, 'w', newline='\n') as fid:
+        fid.writelines(lines)
+    os.replace(temp_path, file_path)
+    logger.info(f'Checksums written to {file_path}: {report.summary()}')
+    return report
@@ -0,0 +1,187 @@
+"""
+Command line interface for creating data deliveries without starting the GUI.
+
+Example:
+    sharktools-data-delivery D:/ctd/2023 D:/leverans --mprog "SMHI CTD" --contact "Namn Namnsson" --filter "*_77SE_*"
+"""
+import argparse
+import fnmatch
+import logging
+import pathlib
+import sys
+
+from .delivery import DEFAULT_WORKERS
+from .delivery import DeliveryEngine
+from .mirror import DEFAULT_MIRROR_DIRECTORY
+from .mirror import MirrorCache
+from .package_index import PackageIndex
+from .scanner import iter_package_batches_for_roots
+from .sharkweb import SharkwebIndex
+from .validation import validate_packages
+
+logger = logging.getLogger(__file__)
+
+METADATA_FIELDS = ['mprog', 'description', 'contact', 'comment']
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(prog='sharktools-data-delivery',
+                                     description='Skapar leverans till Datavärdskapet för CTD-paket i en rotmapp.')
+    parser.add_argument('root_dir', type=pathlib.Path, help='Lokal rotmapp (källmapp)')
+    parser.add_argument('output_dir', type=pathlib.Path, help='Exportmapp')
+    parser.add_argument('--root', dest='extra_roots', type=pathlib.Path, action='append', default=[],
+                        help='Ytterligare rotmapp. Kan anges flera gånger. Finns samma paket i flera rotmappar '
+                             'används det från den som anges först (root_dir först).')
+    parser.add_argument('--server-root', type=pathlib.Path,
+                        help='Rotmapp på server. Nya och ändrade filer kopieras till en lokal spegel som söks '
+                             'igenom efter de lokala rotmapparna. Går servern inte att nå används den senast '
+                             'synkade spegeln.')
+    parser.add_argument('--mirror-dir', type=pathlib.Path, default=DEFAULT_MIRROR_DIRECTORY,
+                        help='Mapp för den lokala spegeln av serverrotmappen')
+    parser.add_argument('--mirror-checksum', action='store_true',
+                        help='Jämför filer på server och i spegeln med kontrollsumma i stället för storlek och tid')
+    parser.add_argument('--sharkweb-file', type=pathlib.Path, help='Sökväg till SHARKweb-uttag (radformat)')
+    parser.add_argument('--mprog', help='Mätprogram')
+    parser.add_argument('--description', help='Beskrivning')
+    parser.add_argument('--contact', help='Kontaktperson')
+    parser.add_argument('--comment', help='Kommentar')
+    parser.add_argument('--filter', dest='filters', action='append', default=[],
+                        help='Mönster (glob) för paketnycklar som ska levereras. Kan anges flera gånger.')
+    parser.add_argument('--overwrite', action='store_true', help='Skriv över filer')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Leverera endast paket som är nya eller har ändrats sedan förra leveransen till exportmappen')
+    parser.add_argument('--placement', choices=['auto', 'reflink', 'hardlink', 'copy'], default='auto',
+                        help='Ersätt kopior av källfiler i leveransen med reflink eller hårdlänk (auto använder reflink där '
+                             'filsystemet stöder det, hårdlänk görs endast med hardlink)')
+    parser.add_argument('--no-checksums', action='store_true',
+                        help='Skriv inte checksummor (SHA-256) för filerna i exportmappen')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='Antal parallella jobb')
+    parser.add_argument('--processes', action='store_true', help='Använd separata processer')
+    parser.add_argument('--no-index', action='store_true', help='Använd inte paketindex vid sökning')
+    parser.add_argument('--strict', action='store_true',
+                        help='Avbryt om kontrollen av paketen (filer och SHARKweb-uttag) hittar brister')
+    parser.add_argument('--list', action='store_true', help='Lista paketen som skulle levereras utan att skapa leverans')
+    parser.add_argument('--verbose', '-v', action='store_true')
+    return parser
+
+
+def filter_packages(packs, filters):
+    if not filters:
+        return list(packs)
+    return [pack for pack in packs if any(fnmatch.fnmatch(pack.key, pattern) for pattern in filters)]
+
+
+def scan_packages(root_dirs, index=None):
+    """
+    Scans the root directories (a path or a list of paths in order of precedence) and returns
+    the packages that have standard format (txt).
+    :return: tuple (packages, keys_missing_txt)
+    """
+    if not isinstance(root_dirs, (list, tuple)):
+        root_dirs = [root_dirs]
+    packs = {}
+    for done, total, batch in iter_package_batches_for_roots(root_dirs, index=index):
+        logger.debug(f'Scanned {done} of {total} directories')
+        for pack in batch:
+            packs[pack.key] = pack
+    ok_packs = [pack for pack in packs.values() if pack['txt']]
+    missing_txt = [pack.key for pack in packs.values() if not pack['txt']]
+    return ok_packs, missing_txt
+
+
+def get_metadata(args):
+    meta = {}
+    for key in METADATA_FIELDS:
+        value = (getattr(args, key) or '').strip()
+        if not value:
+            continue
+        meta[key] = value
+    return meta
+
+
+def main(argv=None):
+    args = get_parser().parse_args(argv)
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO,
+                        format='%(asctime)s %(levelname)s %(message)s')
+
+    root_dirs = [args.root_dir] + args.extra_roots
+    for root_dir in root_dirs:
+        if not root_dir.is_dir():
+            logger.error(f'Källmapp saknas: {root_dir}')
+            return 2
+    if args.sharkweb_file and not args.sharkweb_file.is_file():
+        logger.error(f'SHARKweb-uttag saknas: {args.sharkweb_file}')
+        return 2
+
+    if args.server_root:
+        mirror = MirrorCache(args.server_root, mirror_directory=args.mirror_dir,
+                             compare='checksum' if args.mirror_checksum else 'size_mtime')
+        try:
+            errors = [path for done, total, path, error in mirror.sync() if error]
+            if errors:
+                logger.warning(f'{len(errors)} filer kunde inte kopieras från {args.server_root}')
+            if mirror.placement_report:
+                logger.info(f'Spegel: {mirror.placement_report.summary()}')
+        except OSError as e:
+            if not mirror.local_root.is_dir():
+                logger.error(f'Serverrotmapp går inte att nå och det finns ingen lokal spegel: {e}')
+                return 2
+            logger.warning(f'Serverrotmapp går inte att nå: {e}. Senast synkade kopian i {mirror.local_root} används')
+        root_dirs.append(mirror.local_root)
+
+    index = None if args.no_index else PackageIndex()
+    packs, missing_txt = scan_packages(root_dirs, index=index)
+    if missing_txt:
+        logger.warning(f'Det saknas standardformat för: {", ".join(missing_txt)}. Dessa kommer inte att inkluderas')
+    packs = filter_packages(packs, args.filters)
+    logger.info(f'{len(packs)} paket att leverera')
+    if not packs:
+        logger.error('Inga paket att leverera')
+        return 1
+
+    sharkweb_index = SharkwebIndex(args.sharkweb_file) if args.sharkweb_file else None
+    report = validate_packages(packs, sharkweb_index=sharkweb_index)
+    if not report.ok:
+        logger.warning(report.get_message(max_rows=len(packs)))
+        if args.strict:
+            return 1
+
+    if args.list:
+        for pack in packs:
+            print(pack.key)
+        return 0
+
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+    engine = DeliveryEngine(args.output_dir,
+                            overwrite=args.overwrite,
+                            workers=args.workers,
+                            use_processes=args.processes,
+                            incremental=args.incremental,
+                            placement=None if args.placement == 'copy' else args.placement,
+                            checksums=not args.no_checksums,
+                            **get_metadata(args))
+    plan = None
+    total = len(packs)
+    if args.incremental:
+        plan = engine.plan(packs)
+        total = len(plan.to_deliver)
+    errors = {}
+    for nr, (key, error) in enumerate(engine.run(packs, plan=plan), 1):
+        if error:
+            errors[key] = error
+        logger.info(f'{nr}/{total} {key}: {"FEL" if error else "OK"}')
+
+    logger.info(f'{total - len(errors)} av {total} paket levererade till {args.output_dir}')
+    if engine.placer:
+        logger.info(f'Placering av källfiler: {engine.get_placement_summary()}')
+    if engine.checksum_report:
+        logger.info(f'Checksummor i {engine.checksum_report.file_path}: {engine.get_checksum_summary()}')
+    if errors:
+        for key, error in errors.items():
+            logger.error(f'{key}: {error.strip().splitlines()[-1]}')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,320 @@
+import concurrent.futures
+import logging
+import os
+import sqlite3
+import traceback
+
+from .checksums import ChecksumCache
+from .checksums import create_checksum_file
+from .inventory import PackageInventory
+from .manifest import DeliveryManifest
+from .manifest import MANIFEST_FILE_NAME
+from .placement import FilePlacer
+from .placement import LINK_STRATEGIES
+from .placement import PlacementError
+from .placement import get_strategies
+from .staging import DeliveryStaging
+from .staging import WORK_DIRECTORY_NAME
+from .staging import merge_lines
+from .staging import write_atomic
+from .tracing import tracer
+from .worker import WorkerThread
+
+logger = logging.getLogger(__file__)
+
+DEFAULT_WORKERS = min(4, os.cpu_count() or 1)
+MANIFEST_SAVE_INTERVAL = 50  # number of packages
+
+
+class DeliveryMessage:
+    """
+    Message put on the queue of a DeliveryRunner. kind is one of
+    'plan', 'package', 'done', 'cancelled' or 'error'.
+    """
+    def __init__(self, kind, key=None, done=0, total=0, error=None, plan=None, placement=None, checksums=None):
+        self.kind = kind
+        self.key = key
+        self.done = done
+        self.total = total
+        self.error = error
+        self.plan = plan
+        self.placement = placement
+        self.checksums = checksums
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.kind}, {self.key}, {self.done}/{self.total})'
+
+
+def stage_package(pack, staging_dir, **metadata):
+    """
+    Creates the delivery for one package in a staging directory of its own. Module level function so
+    that it can be used in a process pool.
+    :return: error message or None
+    """
+    # Imported here since ctd_processing is slow to import and only needed when delivering
+    import ctd_processing
+    try:
+        os.makedirs(staging_dir, exist_ok=True)
+        ctd_processing.create_dv_delivery_for_packages([pack], staging_dir, overwrite=True, **metadata)
+    except Exception:
+        return traceback.format_exc()
+
+
+class DeliveryEngine:
+    """
+    Creates a delivery for a list of packages. create_dv_delivery_for_packages is run for each package
+    in a thread or process pool, with a staging directory per package (see staging.DeliveryStaging).
+    When a package is finished its files are moved to the output directory. The delivery-level files
+    (delivery note, metadata) of the packages are merged and written when all packages are finished.
+
+    The delivery-level files describe all packages that have been delivered to the output directory
+    and are written again after every delivery. Existing package files are only overwritten with
+    overwrite.
+
+    If incremental is True the source files of the delivered packages are recorded in a
+    manifest in the output directory and only new or changed packages are delivered. The files
+    of the changed packages are overwritten.
+
+    create_dv_delivery_for_packages copies the source files to the staging directory. With
+    placement ('auto', 'reflink' or 'hardlink') a staged copy of a source file is not moved to the
+    output directory but replaced with a reflink or a hardlink to the source file, so that a
+    delivery on the same file system as the root directory takes no extra disk space. This saves
+    disk space only, the copy to the staging directory is still made. A staged file is taken to be
+    a copy of the source file with the same name if it has the same size and mtime (as with
+    shutil.copy2), so no file is read to compare them. 'auto' uses reflink where the file system
+    supports it and keeps the copy otherwise. Hardlinks are only made with 'hardlink'.
+
+    With checksums the sha256 of all files in the output directory are written to
+    checksums.CHECKSUMS_FILE_NAME when the delivery is finished. Checksums of files that have not
+    changed since the last delivery are taken from a cache.
+    """
+
+    def __init__(self, output_dir, overwrite=False, workers=None, use_processes=False, incremental=False,
+                 placement=None, checksums=False, **metadata):
+        self.output_dir = str(output_dir)
+        self.overwrite = overwrite
+        self.workers = max(1, int(workers or DEFAULT_WORKERS))
+        self.use_processes = use_processes
+        self.incremental = incremental
+        self.metadata = metadata
+        self.placer = None
+        if placement:
+            self.placer = FilePlacer(get_strategies(placement, default=LINK_STRATEGIES, fallback=()))
+        self.checksums = checksums
+        self.checksum_report = None
+        self._manifest = None
+
+    @property
+    def manifest(self):
+        if self._manifest is None:
+            self._manifest = DeliveryManifest(self.output_dir)
+        return self._manifest
+
+    def plan(self, packs):
+        """
+        Compares the packages with the manifest from previous deliveries.
+        :return: DeliveryPlan
+        """
+        with tracer.span('delivery_plan', nr_packages=len(packs)) as span:
+            plan = self.manifest.get_plan(packs)
+            # Delivered before the delivery-level files were kept per package (see staging.DeliveryStaging)
+            staging = DeliveryStaging(self.output_dir)
+            missing_parts = [pack for pack in plan.unchanged if not staging.has_parts(pack.key)]
+            if missing_parts:
+                plan.unchanged = [pack for pack in plan.unchanged if staging.has_parts(pack.key)]
+                plan.changed.extend(missing_parts)
+            span.set(nr_added=len(plan.added), nr_changed=len(plan.changed), nr_unchanged=len(plan.unchanged))
+        logger.info(f'Delivery plan: {plan.summary()}')
+        return plan
+
+    def _get_executor(self):
+        if self.use_processes:
+            return concurrent.futures.ProcessPoolExecutor(max_workers=self.workers)
+        return concurrent.futures.ThreadPoolExecutor(max_workers=self.workers)
+
+    def run(self, packs, cancel_event=None, plan=None):
+        """
+        Generator that creates the deliveries. If a plan is given only the new and
+        changed packages in the plan are delivered and the manifest is updated.
+        :return: yields tuples (package_key, error) in the order the packages are finished.
+                 error is None if the delivery of the package succeeded.
+        """
+        changed_keys = set()
+        if plan is not None:
+            packs = plan.to_deliver
+            changed_keys = {pack.key for pack in plan.changed}
+        if not packs or (cancel_event and cancel_event.is_set()):
+            return
+        staging = DeliveryStaging(self.output_dir)
+        # Left over from a delivery that was interrupted
+        staging.clear()
+        delivered = []
+        try:
+            with self._get_executor() as executor:
+                futures = {executor.submit(stage_package, pack, str(staging.get_package_directory(pack.key)),
+                                           **self.metadata): pack for pack in packs}
+                for nr, future in enumerate(concurrent.futures.as_completed(futures), 1):
+                    pack = futures[future]
+                    try:
+                        error = future.result()
+                    except concurrent.futures.CancelledError:
+                        continue
+                    except Exception:
+                        error = traceback.format_exc()
+                    if not error:
+                        # The files of a changed package are its own files from the previous delivery
+                        error = self._move_package_files(staging, pack, self.overwrite or pack.key in changed_keys)
+                    if error:
+                        logger.error(f'Delivery of package {pack.key} failed: {error}')
+                    else:
+                        delivered.append(pack)
+                        if plan is not None:
+                            self.manifest.set_package_state(pack.key, plan.states[pack.key])
+                            if not nr % MANIFEST_SAVE_INTERVAL:
+                                self.manifest.save()
+                    yield pack.key, error
+                    if cancel_event and cancel_event.is_set():
+                        for f in futures:
+                            f.cancel()
+                        break
+        finally:
+            if delivered:
+                self._write_delivery_files(staging)
+            staging.clear()
+            if plan is not None:
+                self.manifest.save()
+            if self.placer and delivered:
+                logger.debug(f'File placement in {self.output_dir}: {self.placer.report.summary()}')
+            if self.checksums and delivered:
+                self.write_checksums()
+
+    def _move_package_files(self, staging, pack, overwrite):
+        """
+        Moves the staged package files to the output directory and the delivery-level files to the parts of the
+        package. Existing files are replaced (not written to), so a hardlink to a source file from an earlier
+        delivery does not change the source file.
+        :return: error message or None
+        """
+        package_files, delivery_files = staging.split(pack)
+        package_directory = staging.get_package_directory(pack.key)
+        targets = {rel_path: os.path.join(self.output_dir, rel_path) for rel_path in package_files}
+        if not overwrite:
+            existing = [target for target in targets.values() if os.path.exists(target)]
+            if existing:
+                return f'Fil finns redan: {existing[0]}'
+        sources = {os.path.basename(path): str(path) for path in pack.files}
+        try:
+            for rel_path, target in targets.items():
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                staged = os.path.join(package_directory, rel_path)
+                if not self._place_file(sources.get(os.path.basename(rel_path)), staged, target):
+                    os.replace(staged, target)
+            staging.store_parts(pack, delivery_files)
+        except OSError as e:
+            return f'Kunde inte flytta filerna till exportmappen: {e}'
+
+    def _write_delivery_files(self, staging):
+        """Merges the delivery-level files of all packages delivered to the output directory and writes them"""
+        for rel_path, paths in sorted(staging.get_parts().items()):
+            target = os.path.join(self.output_dir, rel_path)
+            try:
+                write_atomic(target, merge_lines(paths))
+            except OSError as e:
+                logger.error(f'Could not write {target}: {e}')
+
+    def _place_file(self, source, staged, target):
+        """
+        Places source at target with the placer if staged is a copy of source (same size and mtime).
+        :return: True if the file was placed
+        """
+        if not self.placer or not source:
+            return False
+        target_directory = os.path.dirname(target)
+        try:
+            source_stat = os.stat(source)
+            staged_stat = os.stat(staged)
+            if (source_stat.st_size, source_stat.st_mtime_ns) != (staged_stat.st_size, staged_stat.st_mtime_ns):
+                return False
+            # Both reflinks and hardlinks need the source and the target on the same file system
+            if source_stat.st_dev != os.stat(target_directory).st_dev or \
+                    not self.placer.is_supported(source, target_directory):
+                return False
+            self.placer.place(source, target)
+        except (OSError, PlacementError) as e:
+            logger.debug(f'Keeping the copy of {source}: {e}')
+            return False
+        os.remove(staged)
+        return True
+
+    def write_checksums(self):
+        """
+        Writes the sha256 of all files in the output directory, computed in parallel.
+        :return: ChecksumReport, or None if the checksums could not be written
+        """
+        try:
+            self.checksum_report = create_checksum_file(self.output_dir,
+                                                        workers=self.workers,
+                                                        cache=ChecksumCache(),
+                                                        exclude_names=[MANIFEST_FILE_NAME, f'{MANIFEST_FILE_NAME}.tmp'],
+                                                        exclude_directories=[WORK_DIRECTORY_NAME])
+        except (OSError, sqlite3.Error) as e:
+            logger.error(f'Could not write checksums in {self.output_dir}: {e}')
+            self.checksum_report = None
+        return self.checksum_report
+
+    def get_checksum_summary(self):
+        if not self.checksum_report:
+            return None
+        return self.checksum_report.summary()
+
+    def get_placement_summary(self):
+        if not self.placer:
+            return None
+        return self.placer.report.summary()
+
+    def deliver(self, packs):
+        """
+        Creates the deliveries and blocks until all packages are finished.
+        :return: dict with the package keys that failed and the corresponding error
+        """
+        plan = self.plan(packs) if self.incremental else None
+        return {key: error for key, error in self.run(packs, plan=plan) if error}
+
+
+class DeliveryRunner(WorkerThread):
+    """
+    Runs a DeliveryEngine in a worker thread. The result of every package is put on
+    self.queue as a DeliveryMessage so that the GUI can poll them with after().
+    """
+
+    def __init__(self, engine, packs):
+        WorkerThread.__init__(self)
+        self.engine = engine
+        self.packs = list(packs)
+
+    def run(self):
+        total = len(self.packs)
+        done = 0
+        try:
+            # Packages from the page are compact records. Only the packages to deliver are materialized.
+            with tracer.span('materialize', nr_packages=total):
+                self.packs = PackageInventory.materialize(self.packs)
+            plan = None
+            if self.engine.incremental:
+                plan = self.engine.plan(self.packs)
+                total = len(plan.to_deliver)
+                self.queue.put(DeliveryMessage('plan', total=total, plan=plan))
+            for key, error in self.engine.run(self.packs, cancel_event=self._cancel_event, plan=plan):
+                done += 1
+                self.queue.put(DeliveryMessage('package', key=key, done=done, total=total, error=error))
+        except Exception:
+            logger.error(traceback.format_exc())
+            self.queue.put(DeliveryMessage('error', done=done, total=total, error=traceback.format_exc()))
+            return
+        kind = 'cancelled' if self.cancelled else 'done'
+        self.queue.put(DeliveryMessage(kind, done=done, total=total, placement=self.engine.get_placement_summary(),
+                                       checksums=self.engine.get_checksum_summary()))
@@ -1,7 +1,34 @@
+import collections
+import concurrent.futures
+import itertools
+import logging
+import queue
+import sys
+import threading
+import time
+import traceback
+import weakref
 
-subscribers = dict()
-subscribers_before = dict()
-subscribers_after = dict()
+logger = logging.getLogger(__file__)
+
+BEFORE = -10
+NORMAL = 0
+AFTER = 10
+
+THREAD_WORKERS = 4
+RESULT_POLL_INTERVAL = 50  # milliseconds
+
+# Events that typically come in bursts (typing a path, clicking through a list) and the window in
+# milliseconds within which they are coalesced. Only the latest post in the window is dispatched.
+COALESCE_WINDOWS = dict(change_local_data_path_root=300,
+                        change_local_data_path_raw=300,
+                        change_local_data_path_source=300,
+                        change_server_data_path_root=300,
+                        update_series_local_source=200,
+                        change_year=200)
+
+# Number of latest call durations kept per handler for the percentile in the timing statistics
+TIMING_SAMPLES = 1000
 
 
 class InvalidEventType(Exception):
@@ -31,82 +58,419 @@ class EventTypes:
         return False
 
 
-def _remove_existing(event_type, func):
-    func_part = str(func).split()[2]
-    for sub in [subscribers_before, subscribers, subscribers_after]:
-        for f in list(sub.get(event_type, [])):
-            if func_part == str(f).split()[2]:
-                print('REMOVING:', func_part)
-                sub[event_type].remove(f)
-
-
-def subscribe(event_type, func, before=False, after=False):
-    _remove_existing(event_type, func)
-    # print('ADDING event:', event_type)
-    if event_type not in EventTypes():
-        raise InvalidEventType(event_type)
-    if before:
-        if event_type not in subscribers_before:
-            subscribers_before[event_type] = set()
-        subscribers_before[event_type].add(func)
-    elif after:
-        if event_type not in subscribers_after:
-            subscribers_after[event_type] = set()
-        subscribers_after[event_type].add(func)
-    else:
-        if event_type not in subscribers:
-            subscribers[event_type] = set()
-        subscribers[event_type].add(func)
+def get_handler_key(func):
+    """
+    Returns the key that identifies a handler. Bound methods are identified by the qualified name
+    of the function, so subscribing the same method of a new instance (e.g. a rebuilt page)
+    replaces the old subscription.
+    """
+    func = getattr(func, '__func__', func)
+    return getattr(func, '__module__', None), getattr(func, '__qualname__', None) or repr(func)
+
+
+class Handler:
+    """
+    A subscribed function. Bound methods are held with a weak reference so that a destroyed
+    object does not stay alive because of the subscription. Other callables are held strongly.
+    """
+    __slots__ = ('key', 'priority', 'order', 'threaded', 'on_result', '_ref', '_func')
+
+    def __init__(self, func, priority=NORMAL, order=0, threaded=False, on_result=None):
+        self.key = get_handler_key(func)
+        self.priority = priority
+        self.order = order
+        self.threaded = threaded
+        self.on_result = on_result
+        if hasattr(func, '__self__') and hasattr(func, '__func__'):
+            self._ref = weakref.WeakMethod(func)
+            self._func = None
+        else:
+            self._ref = None
+            self._func = func
+
+    @property
+    def function(self):
+        if self._ref is not None:
+            return self._ref()
+        return self._func
+
+    @property
+    def sort_key(self):
+        return self.priority, self.order
+
+    def __repr__(self):
+        return f'{self.key[1]} (priority={self.priority}{", threaded" if self.threaded else ""})'
+
+
+class Timing:
+    """Call count, cumulative time and the latest durations (seconds) for a handler or an event type"""
+    __slots__ = ('count', 'total', 'max', 'samples')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.
+        self.max = 0.
+        self.samples = collections.deque(maxlen=TIMING_SAMPLES)
+
+    def add(self, duration):
+        self.count += 1
+        self.total += duration
+        if duration > self.max:
+            self.max = duration
+        self.samples.append(duration)
+
+    def get_percentile(self, percent):
+        if not self.samples:
+            return 0.
+        samples = sorted(self.samples)
+        return samples[min(len(samples) - 1, int(len(samples) * percent / 100))]
+
+    def as_dict(self):
+        return dict(count=self.count,
+                    total=self.total,
+                    mean=self.total / self.count if self.count else 0.,
+                    p95=self.get_percentile(95),
+                    max=self.max)
+
+
+class EventBus:
+    """
+    Keeps subscribers for a set of event types.
+
+    Handlers are called in order of priority (lowest first) and then in the order they were
+    subscribed. A handler subscribed with threaded=True is run in a thread pool. Its result is
+    passed to on_result in the tkinter main loop if a widget has been attached with attach_tk,
+    otherwise in the worker thread.
+
+    Event types can be coalesced (set_coalescing). The first post of such an event starts a
+    window and when it has passed the handlers are called once with the data of the latest post.
+    The window is timed with after() on the attached widget, or with a threading.Timer if no
+    widget is attached (handlers are then called in the timer thread).
+
+    Timing of handlers is turned on with set_timing(True). When off, the only cost in post_event
+    is one attribute check.
+    """
+
+    def __init__(self, event_types=None):
+        self.event_types = set(event_types or EventTypes().event_types)
+        self._handlers = {}
+        self._ordered = {}
+        self._counter = itertools.count()
+        self._lock = threading.RLock()
+        self._executor = None
+        self._results = queue.Queue()
+        self._tk_widget = None
+        self._poll_interval = RESULT_POLL_INTERVAL
+        self._coalesce_windows = {}
+        self._pending = {}
+        self._timing_enabled = False
+        self._event_timings = {}
+        self._handler_timings = {}
+
+    def _check_event_type(self, event_type):
+        if event_type not in self.event_types:
+            raise InvalidEventType(event_type)
+
+    def subscribe(self, event_type, func, before=False, after=False, priority=None, threaded=False, on_result=None):
+        self._check_event_type(event_type)
+        if priority is None:
+            priority = BEFORE if before else AFTER if after else NORMAL
+        handler = Handler(func, priority=priority, order=next(self._counter), threaded=threaded, on_result=on_result)
+        with self._lock:
+            handlers = self._handlers.setdefault(event_type, {})
+            if handler.key in handlers:
+                logger.debug(f'Replacing subscriber {handler.key[1]} for event {event_type}')
+            handlers[handler.key] = handler
+            self._ordered.pop(event_type, None)
+
+    def unsubscribe(self, event_type, func):
+        with self._lock:
+            if self._handlers.get(event_type, {}).pop(get_handler_key(func), None):
+                self._ordered.pop(event_type, None)
+
+    def _get_ordered_handlers(self, event_type):
+        with self._lock:
+            ordered = self._ordered.get(event_type)
+            if ordered is None:
+                ordered = sorted(self._handlers.get(event_type, {}).values(), key=lambda h: h.sort_key)
+                self._ordered[event_type] = ordered
+            return ordered
+
+    def _remove_dead(self, event_type, handlers):
+        with self._lock:
+            for handler in handlers:
+                self._handlers.get(event_type, {}).pop(handler.key, None)
+            self._ordered.pop(event_type, None)
+
+    def set_coalescing(self, event_type, window):
+        """Coalesce posts of event_type within window milliseconds. window=None or 0 turns coalescing off"""
+        self._check_event_type(event_type)
+        if window:
+            self._coalesce_windows[event_type] = window
+        else:
+            self._coalesce_windows.pop(event_type, None)
+            self.flush(event_type)
+
+    def post_event(self, event_type, data, **kwargs):
+        window = self._coalesce_windows.get(event_type)
+        if window:
+            self._post_coalesced(event_type, window, data, kwargs)
+            return
+        self._dispatch(event_type, data, kwargs)
+
+    def _post_coalesced(self, event_type, window, data, kwargs):
+        with self._lock:
+            scheduled = event_type in self._pending
+            self._pending[event_type] = (data, kwargs)
+        if scheduled:
+            return
+        if self._tk_widget is not None:
+            self._tk_widget.after(window, self.flush, event_type)
+        else:
+            timer = threading.Timer(window / 1000, self.flush, args=(event_type,))
+            timer.daemon = True
+            timer.start()
+
+    def flush(self, event_type=None):
+        """Dispatches pending coalesced events now. All pending events if event_type is None"""
+        with self._lock:
+            event_types = list(self._pending) if event_type is None else [event_type]
+            pending = [(et, self._pending.pop(et)) for et in event_types if et in self._pending]
+        for et, (data, kwargs) in pending:
+            self._dispatch(et, data, kwargs)
+
+    def _dispatch(self, event_type, data, kwargs):
+        if self._timing_enabled:
+            self._dispatch_timed(event_type, data, kwargs)
+            return
+        dead = []
+        for handler in self._get_ordered_handlers(event_type):
+            func = handler.function
+            if func is None:
+                dead.append(handler)
+                continue
+            if handler.threaded:
+                self._submit(handler, func, data, kwargs)
+            else:
+                func(data, **kwargs)
+        if dead:
+            self._remove_dead(event_type, dead)
+
+    def _dispatch_timed(self, event_type, data, kwargs):
+        dead = []
+        t0 = time.perf_counter()
+        try:
+            for handler in self._get_ordered_handlers(event_type):
+                func = handler.function
+                if func is None:
+                    dead.append(handler)
+                    continue
+                if handler.threaded:
+                    self._submit(handler, self._get_timed_function(event_type, handler, func), data, kwargs)
+                    continue
+                t = time.perf_counter()
+                try:
+                    func(data, **kwargs)
+                finally:
+                    self._add_timing(event_type, handler.key, time.perf_counter() - t)
+        finally:
+            self._add_timing(event_type, None, time.perf_counter() - t0)
+        if dead:
+            self._remove_dead(event_type, dead)
+
+    def _get_timed_function(self, event_type, handler, func):
+        def timed(*args, **kwargs):
+            t = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._add_timing(event_type, handler.key, time.perf_counter() - t)
+        return timed
+
+    def _add_timing(self, event_type, handler_key, duration):
+        with self._lock:
+            if handler_key is None:
+                timings = self._event_timings
+                key = event_type
+            else:
+                timings = self._handler_timings
+                key = (event_type, handler_key)
+            timing = timings.get(key)
+            if timing is None:
+                timing = timings[key] = Timing()
+            timing.add(duration)
+
+    def set_timing(self, enabled=True):
+        """Turns timing of handlers on or off. Collected statistics are kept until reset_timing is called"""
+        self._timing_enabled = bool(enabled)
+
+    @property
+    def timing_enabled(self):
+        return self._timing_enabled
+
+    def reset_timing(self):
+        with self._lock:
+            self._event_timings = {}
+            self._handler_timings = {}
+
+    def get_timing(self):
+        """
+        Returns the timing statistics as a dict:
+            {event_type: dict(count, total, mean, p95, max, handlers={handler_name: dict(count, total, ...)})}
+        Times are in seconds. Threaded handlers are included in the handlers but not in the event time.
+        """
+        with self._lock:
+            result = {}
+            for event_type, timing in self._event_timings.items():
+                result[event_type] = dict(timing.as_dict(), handlers={})
+            for (event_type, handler_key), timing in self._handler_timings.items():
+                item = result.setdefault(event_type, dict(Timing().as_dict(), handlers={}))
+                item['handlers'][handler_key[1]] = timing.as_dict()
+            return result
+
+    def nr_subscribers(self, event_type):
+        return len([h for h in self._get_ordered_handlers(event_type) if h.function is not None])
+
+    def get_subscribers(self):
+        """Returns a dict with the ordered list of handlers for each event type"""
+        return {event_type: [h for h in self._get_ordered_handlers(event_type) if h.function is not None]
+                for event_type in sorted(self._handlers)}
+
+    def _submit(self, handler, func, data, kwargs):
+        with self._lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=THREAD_WORKERS,
+                                                                       thread_name_prefix='event')
+        future = self._executor.submit(func, data, **kwargs)
+        future.add_done_callback(lambda f: self._on_done(handler, f))
+
+    def _on_done(self, handler, future):
+        try:
+            result = future.result()
+        except Exception:
+            logger.error(f'Threaded event handler {handler.key[1]} failed: {traceback.format_exc()}')
+            return
+        if not handler.on_result:
+            return
+        if self._tk_widget is None:
+            handler.on_result(result)
+        else:
+            self._results.put((handler.on_result, result))
+
+    def attach_tk(self, widget, poll_interval=RESULT_POLL_INTERVAL):
+        """Results from threaded handlers are passed on in the main loop of the widget"""
+        self._tk_widget = widget
+        self._poll_interval = poll_interval
+        widget.after(poll_interval, self._poll_results, widget)
+
+    def _poll_results(self, widget):
+        if widget is not self._tk_widget:
+            return
+        while True:
+            try:
+                on_result, result = self._results.get_nowait()
+            except queue.Empty:
+                break
+            on_result(result)
+        try:
+            widget.after(self._poll_interval, self._poll_results, widget)
+        except Exception:
+            # The widget has been destroyed
+            self._tk_widget = None
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+bus = EventBus()
+for _event_type, _window in COALESCE_WINDOWS.items():
+    bus.set_coalescing(_event_type, _window)
+
+
+def subscribe(event_type, func, before=False, after=False, priority=None, threaded=False, on_result=None):
+    bus.subscribe(event_type, func, before=before, after=after, priority=priority, threaded=threaded,
+                  on_result=on_result)
+
+
+def unsubscribe(event_type, func):
+    bus.unsubscribe(event_type, func)
 
 
 def post_event(event_type, data, **kwargs):
-    for sub in [subscribers_before, subscribers, subscribers_after]:
-        if event_type not in sub:
-            continue
-        for func in sub[event_type]:
-            func(data, **kwargs)
+    bus.post_event(event_type, data, **kwargs)
+
+
+def flush(event_type=None):
+    bus.flush(event_type)
 
 
 def nr_subscribers(event_type):
-    return len(subscribers[event_type])
+    return bus.nr_subscribers(event_type)
+
+
+def set_timing(enabled=True):
+    bus.set_timing(enabled)
+
+
+def reset_timing():
+    bus.reset_timing()
+
+
+def get_timing():
+    return bus.get_timing()
 
 
 def print_even_types():
     print('=' * 50)
-    print('Current event_types (before) are:')
-    print('-' * 50)
-    for event_type in sorted(subscribers_before):
-        print(' ' * 4, event_type)
-    print('-' * 50)
     print('Current event_types are:')
     print('-' * 50)
-    for event_type in sorted(subscribers):
+    for event_type in bus.get_subscribers():
         print(' ' * 4, event_type)
     print('=' * 50)
 
 
+def _format_timing(timing):
+    return (f'calls={timing["count"]} total={timing["total"] * 1000:.1f}ms '
+            f'mean={timing["mean"] * 1000:.2f}ms p95={timing["p95"] * 1000:.2f}ms')
+
+
+def dump_subscribers(file=None):
+    """
+    Writes the subscribers in call order for each event type to file (default stdout).
+    Timing statistics are included for handlers that have been timed (see set_timing).
+    """
+    file = file or sys.stdout
+    timings = bus.get_timing()
+    lines = ['=' * 50,
+             f'Current subscribers are (in call order, timing {"on" if bus.timing_enabled else "off"}):',
+             '-' * 50]
+    for event_type, handlers in bus.get_subscribers().items():
+        event_timing = timings.get(event_type)
+        if event_timing and event_timing['count']:
+            lines.append(f'    event_type: {event_type}  {_format_timing(event_timing)}')
+        else:
+            lines.append(f'    event_type: {event_type}')
+        handler_timings = event_timing['handlers'] if event_timing else {}
+        for handler in handlers:
+            handler_timing = handler_timings.get(handler.key[1])
+            if handler_timing:
+                lines.append(f'        {handler}  {_format_timing(handler_timing)}')
+            else:
+                lines.append(f'        {handler}')
+    lines.append('=' * 50)
+    print('\n'.join(lines), file=file)
+
+
 def print_subscribers():
-    print('=' * 50)
-    print('Current subscribers_before are:')
-    print('-' * 50)
-    for event_type in sorted(subscribers_before):
-        print(' ' * 4, 'event_type:', event_type)
-        for func in subscribers_before[event_type]:
-            print(' ' * 8, func)
-    print('-' * 50)
-    print('Current subscribers are:')
-    print('-' * 50)
-    for event_type in sorted(subscribers):
-        print(' ' * 4, 'event_type:', event_type)
-        for func in subscribers[event_type]:
-            print(' ' * 8, func)
-    print('=' * 50)
+    dump_subscribers()
 
 
-def test_subscriber():
+def test_subscriber(data=None, **kwargs):
     print('I am a test subscriber function!')
 
 
 if __name__ == '__main__':
-    subscribe('select_instrument', test_subscriber)
-    et = EventTypes()
+    subscribe('select_platform', test_subscriber)
+    post_event('select_platform', None)
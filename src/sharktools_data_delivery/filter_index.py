@@ -0,0 +1,140 @@
+import bisect
+import re
+
+from .package_key import parse_package_key
+
+ALL = ''
+# Number of search tokens whose matches are kept between keystrokes
+PREFIX_CACHE_SIZE = 256
+_TOKEN_SEPARATOR = re.compile(r'[\s,;]+')
+
+
+class PackageFilterIndex:
+    """
+    Index of package keys for filtering the file list. The keys are parsed once (see
+    package_key.parse_package_key) into a tree year -> ship -> serial number -> keys, and every part
+    of the key (year, date, time, ship, cruise, serial number) as well as the key and the file name
+    are terms in a sorted list. A prefix is looked up with bisect in the sorted terms, so a search
+    does not depend on the number of packages but on the number of matching terms.
+
+    search('2023 77se 01') returns the keys where every token is the prefix of some term.
+    """
+
+    def __init__(self):
+        self._tree = {}
+        self._terms_by_key = {}
+        self._keys_by_term = {}
+        self._sorted_terms = None
+        self._prefix_cache = {}
+
+    def __len__(self):
+        return len(self._terms_by_key)
+
+    def __contains__(self, key):
+        return key in self._terms_by_key
+
+    def clear(self):
+        self.__init__()
+
+    def add(self, key, file_name=None):
+        """Adds (or updates) key. file_name is searchable as well, e.g. the name of the txt file"""
+        if key in self._terms_by_key:
+            self.remove(key)
+        parts = parse_package_key(key)
+        self._tree.setdefault(parts.year, {}).setdefault(parts.ship, {}).setdefault(parts.serno, set()).add(key)
+        terms = {key.lower()}
+        if file_name:
+            terms.add(file_name.lower())
+        terms.update(part.lower() for part in parts[1:] if part)
+        self._terms_by_key[key] = terms
+        for term in terms:
+            keys = self._keys_by_term.get(term)
+            if keys is None:
+                keys = self._keys_by_term[term] = set()
+                self._sorted_terms = None
+            keys.add(key)
+        self._prefix_cache = {}
+
+    def remove(self, key):
+        terms = self._terms_by_key.pop(key, None)
+        if terms is None:
+            return
+        parts = parse_package_key(key)
+        ships = self._tree[parts.year]
+        sernos = ships[parts.ship]
+        sernos[parts.serno].discard(key)
+        if not sernos[parts.serno]:
+            del sernos[parts.serno]
+            if not sernos:
+                del ships[parts.ship]
+                if not ships:
+                    del self._tree[parts.year]
+        for term in terms:
+            keys = self._keys_by_term[term]
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_term[term]
+                self._sorted_terms = None
+        self._prefix_cache = {}
+
+    def get_years(self):
+        """Years in the index. Keys that can not be parsed have no year and are only found with search"""
+        return sorted(year for year in self._tree if year)
+
+    def get_ships(self, year=ALL):
+        if year:
+            return sorted(ship for ship in self._tree.get(year, {}) if ship)
+        return sorted({ship for ships in self._tree.values() for ship in ships if ship})
+
+    def get_sernos(self, year, ship):
+        return sorted(self._tree.get(year, {}).get(ship, {}))
+
+    def get_keys(self, year=ALL, ship=ALL):
+        """Keys for the year and ship. An empty string (ALL) means any year or ship"""
+        years = [year] if year else list(self._tree)
+        keys = set()
+        for y in years:
+            ships = self._tree.get(y, {})
+            for s in ([ship] if ship else list(ships)):
+                for serno_keys in ships.get(s, {}).values():
+                    keys.update(serno_keys)
+        return keys
+
+    def _get_sorted_terms(self):
+        if self._sorted_terms is None:
+            self._sorted_terms = sorted(self._keys_by_term)
+        return self._sorted_terms
+
+    def find_prefix(self, prefix):
+        """Returns the set of keys that have a term starting with prefix (case insensitive). Do not modify it"""
+        prefix = prefix.lower()
+        keys = self._prefix_cache.get(prefix)
+        if keys is not None:
+            return keys
+        terms = self._get_sorted_terms()
+        keys = set()
+        index = bisect.bisect_left(terms, prefix)
+        while index < len(terms) and terms[index].startswith(prefix):
+            keys.update(self._keys_by_term[terms[index]])
+            index += 1
+        if len(self._prefix_cache) >= PREFIX_CACHE_SIZE:
+            self._prefix_cache = {}
+        self._prefix_cache[prefix] = keys
+        return keys
+
+    def search(self, text='', year=ALL, ship=ALL):
+        """
+        Returns the set of keys matching year, ship and all the tokens in text (separated by space,
+        comma or semicolon). Returns None if there is no filter, i.e. all keys match.
+        """
+        # The longest token first as it usually matches the fewest keys
+        tokens = sorted((token for token in _TOKEN_SEPARATOR.split(text.strip()) if token), key=len, reverse=True)
+        if not tokens and not year and not ship:
+            return None
+        keys = self.get_keys(year, ship) if year or ship else None
+        for token in tokens:
+            matches = self.find_prefix(token)
+            keys = set(matches) if keys is None else keys.intersection(matches)
+            if not keys:
+                break
+        return keys
@@ -4,7 +4,16 @@
 # Copyright (c) 2018 SMHI, Swedish Meteorological and Hydrological Institute
 # License: MIT License (see LICENSE.txt or http://opensource.org/licenses/mit).
 
-from .page_user import PageUser
-from .page_ctd import PageCTD
+
+
+def __getattr__(name):
+    # Pages are imported on first use so that importing the plugin does not load the page dependencies
+    if name == 'PageUser':
+        from .page_user import PageUser
+        return PageUser
+    if name == 'PageCTD':
+        from .page_ctd import PageCTD
+        return PageCTD
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
 
 
@@ -4,21 +4,54 @@
 # Copyright (c) 2018 SMHI, Swedish Meteorological and Hydrological Institute
 # License: MIT License (see LICENSE.txt or http://opensource.org/licenses/mit).
 
+import os
+import threading
 import tkinter as tk
 import traceback
 from pathlib import Path
 from tkinter import filedialog
 from tkinter import messagebox
+from tkinter import ttk
 import logging
 
-import ctd_processing
-import file_explorer
 import shark_tkinter_lib.tkinter_widgets as tkw
 
+from .. import events
+from ..delivery import DEFAULT_WORKERS
+from ..delivery import DeliveryEngine
+from ..delivery import DeliveryRunner
+from ..filter_index import ALL
+from ..filter_index import PackageFilterIndex
+from ..inventory import PackageInventory
+from ..mirror import DEFAULT_MIRROR_DIRECTORY
+from ..mirror import MirrorCache
+from ..mirror import MirrorSyncer
+from ..package_index import PackageIndex
 from ..saves import SaveComponents
+from ..scanner import PackageScanner
+from ..sharkweb import SharkwebIndex
+from ..statistics import SuffixStatistics
+from ..tracing import tracer
+from ..validation import validate_packages
+from .widgets import SuffixStatisticsFrame
+from .widgets import VirtualListboxSelectionWidget
 
 logger = logging.getLogger(__file__)
 
+SCAN_POLL_INTERVAL = 100  # milliseconds
+MIRROR_POLL_INTERVAL = 200  # milliseconds
+DELIVERY_POLL_INTERVAL = 200  # milliseconds
+MAX_ERRORS_IN_MESSAGE = 10
+# Separator between the root directories in local_root_dir. Roots earlier in the list take precedence.
+ROOT_SEPARATOR = os.pathsep
+# Text in the year and ship filters for no filter
+FILTER_ALL = 'Alla'
+# Placement of the delivered copies of the source files (see DeliveryEngine)
+PLACEMENT_OPTIONS = {'Automatiskt (reflink där det går)': 'auto',
+                     'Reflink': 'reflink',
+                     'Hårdlänk': 'hardlink',
+                     'Kopiera': None}
+
 
 class StringVar:
     def __init__(self, id_string=None):
@@ -44,28 +77,59 @@ class PageCTD(tk.Frame):
         self.parent_app = parent_app
         self._saves = SaveComponents('ctd')
 
-        self._all_packs_in_source_directory = []
+        # Packages found in the source directory as compact records (see inventory.PackageRecord)
+        self._inventory = PackageInventory()
         self._selected_packs = []
+        self._selected_keys = set()
+        self._file_name_by_key = {}
+        self._key_by_file_name = {}
+        # Year, ship and serial number of the packages in the file list for filtering and search
+        self._filter_index = PackageFilterIndex()
+
+        self._scanner = None
+        self._package_index = None
+        self._delivery_runner = None
+        self._delivery_errors = {}
+        self._delivery_plan = None
+        self._scan_missing_txt = []
+        self._sharkweb_index = None
+        self._sharkweb_index_result = None
+        self._scan_span = None
+        self._delivery_span = None
+        self._mirror_syncer = None
 
         self._stringvars_meta = {}
         self._stringvars_path = {}
-        self._stringvars_stat = {}
-        self._stringvars_stat_all = {}
+        self._stringvars_settings = {}
+
+        self._stat_all = SuffixStatistics()
+        self._stat_selected = SuffixStatistics()
 
     @property
     def user(self):
         return self.parent_app.user
 
+    @property
+    def package_index(self):
+        if self._package_index is None:
+            self._package_index = PackageIndex()
+        return self._package_index
+
     def startup(self):
         self._build()
         self._add_to_save()
+        events.subscribe('change_year', self._on_change_year)
+        events.subscribe('select_platform', self._on_select_platform)
         # self._on_select_local_dir()
 
     def _add_to_save(self):
         self._saves.add_components(*list(self._stringvars_path.values()))
         self._saves.add_components(*list(self._stringvars_meta.values()))
+        self._saves.add_components(*list(self._stringvars_settings.values()))
         self._saves.load()
         self._check_missing_paths()
+        if self._get_paths().get('sharkweb_file'):
+            self._load_sharkweb_index()
 
     def _check_missing_paths(self):
         missing = []
@@ -73,13 +137,23 @@ class PageCTD(tk.Frame):
             string = stringvar.get().strip()
             if not string:
                 missing.append(name)
+            elif name == 'local_root_dir':
+                roots = [root for root in string.split(ROOT_SEPARATOR) if root.strip()]
+                existing = [root for root in roots if Path(root).exists()]
+                if len(existing) != len(roots):
+                    stringvar.set(ROOT_SEPARATOR.join(existing))
+                    self._inventory.clear()
+                if not existing:
+                    missing.append(name)
+            elif name == 'server_root_dir':
+                # Kept when the server can not be reached so that the last synced mirror is used offline
+                if not Path(string).exists():
+                    missing.append(name)
             else:
                 path = Path(string)
                 if not path.exists():
                     stringvar.set('')
                     missing.append(name)
-                    if name == 'local_root_dir':
-                        self._all_packs_in_source_directory = []
         return missing
 
     def _get_paths(self):
@@ -88,11 +162,15 @@ class PageCTD(tk.Frame):
         for name, stringvar in self._stringvars_path.items():
             if name in missing:
                 continue
+            if name == 'local_root_dir':
+                paths[name] = [Path(root) for root in stringvar.get().split(ROOT_SEPARATOR) if root.strip()]
+                continue
             paths[name] = Path(stringvar.get())
         return paths
 
     def _create_stringvars(self):
         self._stringvars_path['local_root_dir'] = StringVar('local_root_dir')
+        self._stringvars_path['server_root_dir'] = StringVar('server_root_dir')
         self._stringvars_path['output_dir'] = StringVar('output_dir')
         self._stringvars_path['sharkweb_file'] = StringVar('sharkweb_file')
 
@@ -101,41 +179,12 @@ class PageCTD(tk.Frame):
         self._stringvars_meta['contact'] = StringVar('contact')
         self._stringvars_meta['comment'] = StringVar('comment')
 
-        self._stringvars_stat['.txt'] = tk.StringVar()
-        self._stringvars_stat['.cnv'] = tk.StringVar()
-        self._stringvars_stat['.hex'] = tk.StringVar()
-        self._stringvars_stat['.hdr'] = tk.StringVar()
-        self._stringvars_stat['.ros'] = tk.StringVar()
-        self._stringvars_stat['.bl'] = tk.StringVar()
-        self._stringvars_stat['.btl'] = tk.StringVar()
-        self._stringvars_stat['.xml'] = tk.StringVar()
-        self._stringvars_stat['.xmlcon'] = tk.StringVar()
-        self._stringvars_stat['.xml'] = tk.StringVar()
-        self._stringvars_stat['.con'] = tk.StringVar()
-        self._stringvars_stat['.zip'] = tk.StringVar()
-        self._stringvars_stat['.jpg'] = tk.StringVar()
-        self._stringvars_stat['.png'] = tk.StringVar()
-        self._stringvars_stat['.deliverynote'] = tk.StringVar()
-        self._stringvars_stat['.metadata'] = tk.StringVar()
-        self._stringvars_stat['.sensorinfo'] = tk.StringVar()
-
-        self._stringvars_stat_all['.txt'] = tk.StringVar()
-        self._stringvars_stat_all['.cnv'] = tk.StringVar()
-        self._stringvars_stat_all['.hex'] = tk.StringVar()
-        self._stringvars_stat_all['.hdr'] = tk.StringVar()
-        self._stringvars_stat_all['.ros'] = tk.StringVar()
-        self._stringvars_stat_all['.bl'] = tk.StringVar()
-        self._stringvars_stat_all['.btl'] = tk.StringVar()
-        self._stringvars_stat_all['.xml'] = tk.StringVar()
-        self._stringvars_stat_all['.xmlcon'] = tk.StringVar()
-        self._stringvars_stat_all['.xml'] = tk.StringVar()
-        self._stringvars_stat_all['.con'] = tk.StringVar()
-        self._stringvars_stat_all['.zip'] = tk.StringVar()
-        self._stringvars_stat_all['.jpg'] = tk.StringVar()
-        self._stringvars_stat_all['.png'] = tk.StringVar()
-        self._stringvars_stat_all['.deliverynote'] = tk.StringVar()
-        self._stringvars_stat_all['.metadata'] = tk.StringVar()
-        self._stringvars_stat_all['.sensorinfo'] = tk.StringVar()
+        self._stringvars_settings['workers'] = StringVar('workers')
+        self._stringvars_settings['workers'].set(str(DEFAULT_WORKERS))
+        self._stringvars_settings['placement'] = StringVar('placement')
+        self._stringvars_settings['placement'].set(list(PLACEMENT_OPTIONS)[0])
+        self._stringvars_settings['mirror_dir'] = StringVar('mirror_dir')
+        self._stringvars_settings['mirror_dir'].set(str(DEFAULT_MIRROR_DIRECTORY))
 
     def _build(self):
         self._create_stringvars()
@@ -171,43 +220,71 @@ class PageCTD(tk.Frame):
         tk.Button(frame, text='Lokal rotmapp (källmapp)', command=self._select_local_root_dir, **opt).grid(row=r, column=0, **grid)
         tk.Label(frame, textvariable=self._stringvars_path['local_root_dir']()).grid(row=r, column=1, **grid, sticky='w')
         tk.Button(frame, text='Uppdatera', command=self._on_select_local_dir).grid(row=r, column=2, **grid)
+        tk.Button(frame, text='Lägg till rotmapp', command=self._add_local_root_dir).grid(row=r, column=3, **grid)
+        r += 1
+        self._progress_scan = ttk.Progressbar(frame, orient='horizontal', mode='determinate', length=300)
+        self._progress_scan.grid(row=r, column=0, **grid, sticky='ew')
+        self._stringvar_scan_status = tk.StringVar()
+        tk.Label(frame, textvariable=self._stringvar_scan_status).grid(row=r, column=1, **grid, sticky='w')
+        self._button_cancel_scan = tk.Button(frame, text='Avbryt', command=self._cancel_scan, state='disabled')
+        self._button_cancel_scan.grid(row=r, column=2, **grid)
+        r += 1
+        tk.Button(frame, text='Serverrotmapp (speglas lokalt)', command=self._select_server_root_dir, **opt).grid(row=r, column=0, **grid)
+        tk.Label(frame, textvariable=self._stringvars_path['server_root_dir']()).grid(row=r, column=1, **grid, sticky='w')
+        self._button_mirror_sync = tk.Button(frame, text='Synka', command=self._start_mirror_sync)
+        self._button_mirror_sync.grid(row=r, column=2, **grid)
+        self._stringvar_mirror_status = tk.StringVar()
+        tk.Label(frame, textvariable=self._stringvar_mirror_status).grid(row=r, column=3, **grid, sticky='w')
+        r += 1
+        tk.Button(frame, text='Mapp för lokal spegel', command=self._select_mirror_dir, **opt).grid(row=r, column=0, **grid)
+        tk.Label(frame, textvariable=self._stringvars_settings['mirror_dir']()).grid(row=r, column=1, **grid, sticky='w')
         r += 1
         tk.Button(frame, text='Exportmapp', command=self._select_output_dir, **opt).grid(row=r, column=0, **grid)
         tk.Label(frame, textvariable=self._stringvars_path['output_dir']()).grid(row=r, column=1, **grid, sticky='w')
         r += 1
         tk.Button(frame, text='Sökväg till SHARKweb-uttag (radformat)', command=self._select_sharkweb_file, **opt).grid(row=r, column=0, **grid)
         tk.Label(frame, textvariable=self._stringvars_path['sharkweb_file']()).grid(row=r, column=1, **grid, sticky='w')
+        self._stringvar_sharkweb_status = tk.StringVar()
+        tk.Label(frame, textvariable=self._stringvar_sharkweb_status).grid(row=r, column=2, **grid, sticky='w')
+        r += 1
+        tk.Button(frame, text='Exportera tidsmätning', command=self._export_trace, **opt).grid(row=r, column=0, **grid)
 
         tkw.grid_configure(frame, nr_rows=r+1, nr_columns=1)
 
     def _build_files_frame(self):
         frame = self._frame_files
-        props = dict(width=45)
-        self._listbox_files = tkw.ListboxSelectionWidget(frame,
-                                                         callback=self._on_select_files,
-                                                         prop_items=props,
-                                                         prop_selected=props,
-                                                         row=0, column=0)
+        grid = dict(padx=5, pady=2)
+        filter_frame = tk.Frame(frame)
+        filter_frame.grid(row=0, column=0, sticky='w')
+        tk.Label(filter_frame, text='År').grid(row=0, column=0, **grid, sticky='e')
+        self._combobox_year = ttk.Combobox(filter_frame, values=[FILTER_ALL], state='readonly', width=8)
+        self._combobox_year.set(FILTER_ALL)
+        self._combobox_year.grid(row=0, column=1, **grid, sticky='w')
+        self._combobox_year.bind('<<ComboboxSelected>>',
+                                 lambda event: events.post_event('change_year', self._get_filter_year()))
+        tk.Label(filter_frame, text='Fartyg').grid(row=0, column=2, **grid, sticky='e')
+        self._combobox_ship = ttk.Combobox(filter_frame, values=[FILTER_ALL], state='readonly', width=8)
+        self._combobox_ship.set(FILTER_ALL)
+        self._combobox_ship.grid(row=0, column=3, **grid, sticky='w')
+        self._combobox_ship.bind('<<ComboboxSelected>>',
+                                 lambda event: events.post_event('select_platform', self._get_filter_ship()))
+        tk.Label(filter_frame, text='Sök').grid(row=0, column=4, **grid, sticky='e')
+        self._stringvar_search = tk.StringVar()
+        tk.Entry(filter_frame, textvariable=self._stringvar_search, width=30).grid(row=0, column=5, **grid, sticky='w')
+        self._stringvar_search.trace_add('write', lambda *args: self._apply_file_filter())
+
+        self._listbox_files = VirtualListboxSelectionWidget(frame,
+                                                            callback=self._on_select_files,
+                                                            width=45,
+                                                            row=1, column=0)
 
     def _build_stat_all_frame(self):
-        frame = self._frame_stat_all
-        grid = dict(padx=5, pady=2)
-        r = 0
-        for suffix, stringvar in self._stringvars_stat_all.items():
-            tk.Label(frame, text=f'Antal {suffix}-filer:').grid(row=r, column=0, **grid, sticky='e')
-            tk.Label(frame, textvariable=stringvar).grid(row=r, column=1, **grid, sticky='w')
-            r += 1
-        tkw.grid_configure(self, nr_rows=r, nr_columns=2)
-        
+        self._stat_frame_all = SuffixStatisticsFrame(self._frame_stat_all)
+        tkw.grid_configure(self._frame_stat_all)
+
     def _build_stat_frame(self):
-        frame = self._frame_stat
-        grid = dict(padx=5, pady=2)
-        r = 0
-        for suffix, stringvar in self._stringvars_stat.items():
-            tk.Label(frame, text=f'Antal {suffix}-filer:').grid(row=r, column=0, **grid, sticky='e')
-            tk.Label(frame, textvariable=stringvar).grid(row=r, column=1, **grid, sticky='w')
-            r += 1
-        tkw.grid_configure(self, nr_rows=r, nr_columns=2)
+        self._stat_frame_selected = SuffixStatisticsFrame(self._frame_stat)
+        tkw.grid_configure(self._frame_stat)
 
     def _build_metadata_frame(self):
         frame = self._frame_metadata
@@ -231,7 +308,34 @@ class PageCTD(tk.Frame):
         self._intvar_overwrite = tk.IntVar()
         tk.Checkbutton(frame, text='Skriv över filer', variable=self._intvar_overwrite).grid(row=r, column=1, **grid, sticky='w')
         r += 1
-        tk.Button(frame, text='Skapa leverans', command=self._create_delivery, bg='#6293e3').grid(row=r, column=0, columnspan=2, **grid, sticky='ew')
+        self._intvar_incremental = tk.IntVar()
+        tk.Checkbutton(frame, text='Leverera endast nya och ändrade paket', variable=self._intvar_incremental).grid(row=r, column=1, **grid, sticky='w')
+        r += 1
+        tk.Label(frame, text='Parallella jobb').grid(row=r, column=0, **grid, sticky='e')
+        tk.Spinbox(frame, from_=1, to=64, width=5, textvariable=self._stringvars_settings['workers']()).grid(row=r, column=1, **grid, sticky='w')
+        r += 1
+        self._intvar_use_processes = tk.IntVar()
+        tk.Checkbutton(frame, text='Använd separata processer', variable=self._intvar_use_processes).grid(row=r, column=1, **grid, sticky='w')
+        r += 1
+        self._intvar_checksums = tk.IntVar(value=1)
+        tk.Checkbutton(frame, text='Skapa checksummor (SHA-256)', variable=self._intvar_checksums).grid(row=r, column=1, **grid, sticky='w')
+        r += 1
+        tk.Label(frame, text='Placering av källfiler').grid(row=r, column=0, **grid, sticky='e')
+        ttk.Combobox(frame, values=list(PLACEMENT_OPTIONS), state='readonly', width=35,
+                     textvariable=self._stringvars_settings['placement']()).grid(row=r, column=1, **grid, sticky='w')
+        r += 1
+        tk.Button(frame, text='Kontrollera valda paket', command=self._validate_selected_packs).grid(row=r, column=0, columnspan=2, **grid, sticky='ew')
+        r += 1
+        self._button_create_delivery = tk.Button(frame, text='Skapa leverans', command=self._create_delivery, bg='#6293e3')
+        self._button_create_delivery.grid(row=r, column=0, columnspan=2, **grid, sticky='ew')
+        r += 1
+        self._progress_delivery = ttk.Progressbar(frame, orient='horizontal', mode='determinate')
+        self._progress_delivery.grid(row=r, column=0, columnspan=2, **grid, sticky='ew')
+        r += 1
+        self._stringvar_delivery_status = tk.StringVar()
+        tk.Label(frame, textvariable=self._stringvar_delivery_status).grid(row=r, column=0, **grid, sticky='w')
+        self._button_cancel_delivery = tk.Button(frame, text='Avbryt', command=self._cancel_delivery, state='disabled')
+        self._button_cancel_delivery.grid(row=r, column=1, **grid, sticky='e')
 
         tkw.grid_configure(frame, nr_rows=r+1, nr_columns=2)
 
@@ -239,9 +343,25 @@ class PageCTD(tk.Frame):
     def overwrite(self):
         return bool(self._intvar_overwrite.get())
 
+    @property
+    def workers(self):
+        try:
+            return max(1, int(self._stringvars_settings['workers'].get()))
+        except ValueError:
+            return DEFAULT_WORKERS
+
+    @property
+    def placement(self):
+        return PLACEMENT_OPTIONS.get(self._stringvars_settings['placement'].get(), 'auto')
+
+    @property
+    def mirror_directory(self):
+        return Path(self._stringvars_settings['mirror_dir'].get().strip() or DEFAULT_MIRROR_DIRECTORY)
+
     def _create_delivery(self):
         missing = self._check_missing_paths()
-        if 'local_root_dir' in missing:
+        mirror = self._get_mirror()
+        if 'local_root_dir' in missing and not (mirror and mirror.local_root.exists()):
             messagebox.showwarning('Skapa leverans', 'Kan inte skapa leverans. Källmapp saknas!')
             return
         if 'output_dir' in missing:
@@ -254,22 +374,95 @@ class PageCTD(tk.Frame):
         msg = self._check_selected_packs_content()
         if msg:
             logger.error(msg)
-            if not messagebox.askyesno('Ofullständing information', msg):
+            if not messagebox.askyesno('Ofullständing information', f'{msg}\n\nVill du gå vidare i alla fall?'):
                 return
         output_dir = self._stringvars_path['output_dir'].get()
         metadata = self._get_metadata()
 
-        logger.info(f'{output_dir=}')
-        logger.info(f'{metadata=}')
-
-        try:
-            ctd_processing.create_dv_delivery_for_packages(self._selected_packs, output_dir, overwrite=self.overwrite, **metadata)
-            messagebox.showinfo('Skapa leverans', 'Leverans har skapats!')
-        except FileExistsError as e:
-            messagebox.showerror('Skapa leverans', f'Fil finns redan: {e}')
-        except:
-            messagebox.showerror('Skapa leverans', f'Internt fel: {traceback.format_exc()}')
-            raise
+        logger.info(f'Creating delivery for {len(self._selected_packs)} packages in {output_dir} '
+                    f'({len(metadata)} metadata fields)')
+
+        engine = DeliveryEngine(output_dir,
+                                overwrite=self.overwrite,
+                                workers=self.workers,
+                                use_processes=bool(self._intvar_use_processes.get()),
+                                incremental=bool(self._intvar_incremental.get()),
+                                placement=self.placement,
+                                checksums=bool(self._intvar_checksums.get()),
+                                **metadata)
+        self._start_delivery(engine, self._selected_packs)
+
+    def _start_delivery(self, engine, packs):
+        self._delivery_errors = {}
+        self._delivery_plan = None
+        self._delivery_span = tracer.begin('delivery', nr_packages=len(packs), nr_bytes=self._stat_selected.total_nr_bytes,
+                                           workers=engine.workers, use_processes=engine.use_processes)
+        self._progress_delivery['maximum'] = len(packs)
+        self._progress_delivery['value'] = 0
+        self._stringvar_delivery_status.set(f'Skapar leverans för {len(packs)} paket...')
+        self._button_create_delivery.config(state='disabled')
+        self._button_cancel_delivery.config(state='normal')
+        self._delivery_runner = DeliveryRunner(engine, packs)
+        self._delivery_runner.start()
+        self.after(DELIVERY_POLL_INTERVAL, self._poll_delivery, self._delivery_runner)
+
+    def _cancel_delivery(self):
+        if self._delivery_runner:
+            self._delivery_runner.cancel()
+
+    def _poll_delivery(self, runner):
+        finished = None
+        for message in runner.get_messages():
+            if message.kind == 'plan':
+                self._delivery_plan = message.plan
+                self._progress_delivery['maximum'] = max(1, message.total)
+                self._stringvar_delivery_status.set(message.plan.summary())
+            elif message.kind == 'package':
+                self._progress_delivery['value'] = message.done
+                self._stringvar_delivery_status.set(f'{message.done} av {message.total} paket klara')
+                if not message.ok:
+                    self._delivery_errors[message.key] = message.error
+            else:
+                finished = message
+        if not finished:
+            self.after(DELIVERY_POLL_INTERVAL, self._poll_delivery, runner)
+            return
+        self._delivery_runner = None
+        self._button_create_delivery.config(state='normal')
+        self._button_cancel_delivery.config(state='disabled')
+        self._on_delivery_finished(finished)
+
+    def _on_delivery_finished(self, message):
+        if self._delivery_span:
+            self._delivery_span.finish(result=message.kind, nr_done=message.done, nr_errors=len(self._delivery_errors))
+            self._delivery_span = None
+        if message.kind == 'error':
+            self._stringvar_delivery_status.set('Leveransen misslyckades')
+            messagebox.showerror('Skapa leverans', f'Internt fel: {message.error}')
+            return
+        nr_ok = message.done - len(self._delivery_errors)
+        status = f'{nr_ok} av {message.total} paket levererade'
+        if self._delivery_plan:
+            status = f'{status} ({self._delivery_plan.summary()})'
+        if message.placement:
+            logger.info(f'Placement of source files: {message.placement}')
+            status = f'{status}\nPlacering av källfiler: {message.placement}'
+        if message.checksums:
+            status = f'{status}\nChecksummor: {message.checksums}'
+        if message.kind == 'cancelled':
+            status = f'Avbruten: {status}'
+        self._stringvar_delivery_status.set(status)
+        if self._delivery_errors:
+            lines = [f'{key}: {error.strip().splitlines()[-1]}' for key, error in
+                     list(self._delivery_errors.items())[:MAX_ERRORS_IN_MESSAGE]]
+            if len(self._delivery_errors) > MAX_ERRORS_IN_MESSAGE:
+                lines.append(f'... och {len(self._delivery_errors) - MAX_ERRORS_IN_MESSAGE} till')
+            messagebox.showerror('Skapa leverans', f'{status}\n\nFel för {len(self._delivery_errors)} paket:\n' + '\n'.join(lines))
+        elif message.kind == 'done':
+            if self._delivery_plan and not self._delivery_plan.to_deliver:
+                messagebox.showinfo('Skapa leverans', f'Inga nya eller ändrade paket att leverera!\n{self._delivery_plan.summary()}')
+                return
+            messagebox.showinfo('Skapa leverans', f'Leverans har skapats!\n{status}')
 
     def _get_metadata(self):
         meta = {}
@@ -282,103 +475,259 @@ class PageCTD(tk.Frame):
 
     def _on_select_local_dir(self):
         try:
-            directory = self._get_paths().get('local_root_dir')
-            if not directory:
-                return
-            self._all_packs_in_source_directory = file_explorer.get_packages_in_directory(directory, exclude_directory='temp', as_list=True)
-            logger.info(f'{ self._all_packs_in_source_directory=}')
-            if not self._all_packs_in_source_directory:
-                msg = f'inga fullständiga paket i rotkatalogen: {directory}'
-                logger.warning(msg)
-                messagebox.showwarning('Filer saknas', msg)
+            directories = list(self._get_paths().get('local_root_dir', []))
+            mirror = self._get_mirror()
+            if mirror and mirror.local_root.exists():
+                # The local copy of the server root has the lowest precedence
+                directories.append(mirror.local_root)
+            if not directories:
                 return
-            ans = self._check_all_packs_content()
-            if ans:
-                nr_files, msg = ans
-                logger.warning(msg)
-                messagebox.showwarning('Otillräcklig information', msg)
-                ans = messagebox.askyesno('Otillräcklig information', f'{nr_files} filer kommer inte komma med i levarensen!\nVill du gå vidare i alla fall?')
-                if not ans:
-                    return
-            self._update_stat_all()
-            self._update_listbox_files()
+            self._start_scan(directories)
         except Exception:
             messagebox.showerror('Något gick fel', traceback.format_exc())
 
-    def _on_select_files(self):
-        selected_names = self._listbox_files.get_selected()
-        keys = [name.split('.')[0] for name in selected_names]
-        self._selected_packs = [pack for pack in self._all_packs_in_source_directory if pack.key in keys]
-        print('Selected packages')
-        print(f'{self._selected_packs}')
+    def _start_scan(self, directories):
+        """Scans the root directories (in order of precedence) concurrently"""
+        self._cancel_scan()
+        self._inventory = PackageInventory()
+        self._selected_packs = []
+        self._selected_keys = set()
+        self._file_name_by_key = {}
+        self._key_by_file_name = {}
+        self._filter_index.clear()
+        self._scan_missing_txt = []
+        self._stat_all.clear()
+        self._stat_selected.clear()
+        self._update_stat_all()
         self._update_stat()
-
-    def _update_listbox_files(self):
-        self._listbox_files.update_items()
-        if not self._all_packs_in_source_directory:
+        self._update_listbox_files()
+        self._progress_scan['value'] = 0
+        self._stringvar_scan_status.set('Söker efter paket...')
+        self._button_cancel_scan.config(state='normal')
+        if self._scan_span:
+            self._scan_span.finish(result='restarted')
+        self._scan_span = tracer.begin('scan', directories=[str(directory) for directory in directories])
+        self._scanner = PackageScanner(directories, index=self.package_index, inventory=self._inventory)
+        self._scanner.start()
+        self.after(SCAN_POLL_INTERVAL, self._poll_scan, self._scanner)
+
+    def _cancel_scan(self):
+        if self._scanner:
+            self._scanner.cancel()
+
+    def _poll_scan(self, scanner):
+        if scanner is not self._scanner:
+            # A new scan has been started
             return
-        file_names = []
-        for pack in self._all_packs_in_source_directory:
-            path = pack.get_file_path(suffix='.txt')
-            if not path:
+        finished = None
+        new_packs = []
+        for message in scanner.get_messages():
+            if message.total:
+                self._progress_scan['maximum'] = message.total
+                self._progress_scan['value'] = message.done
+                self._stringvar_scan_status.set(f'Genomsökt {message.done} av {message.total} mappar')
+            new_packs.extend(message.packages)
+            if message.kind != 'progress':
+                finished = message
+        if new_packs:
+            self._add_scanned_packs(new_packs)
+        if not finished:
+            self.after(SCAN_POLL_INTERVAL, self._poll_scan, scanner)
+            return
+        self._scanner = None
+        self._package_index = None
+        self._button_cancel_scan.config(state='disabled')
+        self._on_scan_finished(scanner, finished)
+
+    def _add_scanned_packs(self, packs):
+        with tracer.span('check_content', nr_packages=len(packs)) as span:
+            packs, missing_txt = self._check_packs_content(packs)
+            span.set(nr_missing_txt=len(missing_txt))
+        for pack in packs:
+            self._inventory.add(pack)
+            self._add_file_name(pack)
+            self._stat_all.add(pack.key, pack.get_statistics())
+        self._scan_missing_txt.extend(missing_txt)
+        # A package replaced by one without standard format (e.g. from a root with higher precedence) is removed
+        for pack in missing_txt:
+            if pack.key not in self._inventory:
                 continue
-            file_names.append(path.name)
-        self._listbox_files.update_items(file_names)
-
-    @staticmethod
-    def _get_statistics_for_packs(packs_list):
-        if not packs_list:
+            self._inventory.remove(pack.key)
+            self._add_file_name(pack)
+            self._stat_all.remove(pack.key)
+            if pack.key in self._selected_keys:
+                self._selected_keys.discard(pack.key)
+                self._selected_packs = [p for p in self._selected_packs if p.key != pack.key]
+                self._stat_selected.remove(pack.key)
+                self._update_stat()
+        regrouped_keys = self._selected_keys.intersection(pack.key for pack in packs)
+        if regrouped_keys:
+            self._selected_packs = [self._inventory.get(pack.key) for pack in self._selected_packs]
+            for key in regrouped_keys:
+                self._stat_selected.add(key, self._inventory.get(key).get_statistics())
+            self._update_stat()
+        self._update_stat_all()
+        self._update_listbox_files()
+
+    def _on_scan_finished(self, scanner, message):
+        directory = ', '.join(str(root) for root in scanner.root_directories)
+        if self._scan_span:
+            self._scan_span.finish(result=message.kind, nr_packages=len(self._inventory),
+                                   nr_missing_txt=len(self._scan_missing_txt), nr_files=self._stat_all.total_nr_files,
+                                   nr_bytes=self._stat_all.total_nr_bytes)
+            self._scan_span = None
+        if message.kind == 'error':
+            self._stringvar_scan_status.set('Sökningen misslyckades')
+            messagebox.showerror('Något gick fel', message.error)
             return
-        nr_files = {}
-        for pack in packs_list:
-            for file in pack.files:
-                nr_files.setdefault(file.suffix, 0)
-                nr_files[file.suffix] += 1
-        return dict(nr_files=nr_files)
-
-    def _get_all_packs_statistics(self):
-        return self._get_statistics_for_packs(self._all_packs_in_source_directory)
-
-    def _get_packs_statistics(self):
-        return self._get_statistics_for_packs(self._selected_packs)
+        if message.kind == 'cancelled':
+            self._stringvar_scan_status.set(f'Avbruten ({len(self._inventory)} paket)')
+            return
+        self._stringvar_scan_status.set(f'Klar ({len(self._inventory)} paket)')
+        logger.info(f'{len(self._inventory)} packages found in {directory}')
+        if not len(self._inventory) and not self._scan_missing_txt:
+            msg = f'inga fullständiga paket i rotkatalogen: {directory}'
+            logger.warning(msg)
+            messagebox.showwarning('Filer saknas', msg)
+            return
+        ans = self._check_all_packs_content()
+        if ans:
+            nr_files, msg = ans
+            logger.warning(msg)
+            messagebox.showwarning('Otillräcklig information', msg)
+            ans = messagebox.askyesno('Otillräcklig information', f'{nr_files} filer kommer inte komma med i levarensen!\nVill du gå vidare i alla fall?')
+            if not ans:
+                self._inventory.clear()
+                self._file_name_by_key = {}
+                self._key_by_file_name = {}
+                self._filter_index.clear()
+                self._stat_all.clear()
+                self._update_stat_all()
+                self._update_listbox_files()
 
-    def _reset_stat_all(self):
-        for stringvar in self._stringvars_stat_all.values():
-            stringvar.set('')
+    def _on_select_files(self):
+        selected_keys = [self._key_by_file_name[name] for name in self._listbox_files.get_selected()]
+        selected_key_set = set(selected_keys)
+        added = selected_key_set - self._selected_keys
+        removed = self._selected_keys - selected_key_set
+        if not added and not removed:
+            return
+        self._selected_keys = selected_key_set
+        self._selected_packs = [self._inventory.get(key) for key in selected_keys]
+        for key in removed:
+            self._stat_selected.remove(key)
+        for key in added:
+            self._stat_selected.add(key, self._inventory.get(key).get_statistics())
+        logger.debug(f'Selection: {len(added)} added, {len(removed)} removed, {len(selected_keys)} selected')
+        with tracer.span('update_stat', nr_added=len(added), nr_removed=len(removed)):
+            self._update_stat()
+
+    def _add_file_name(self, pack):
+        path = pack.get_file_path(suffix='.txt')
+        old_name = self._file_name_by_key.pop(pack.key, None)
+        if old_name:
+            self._key_by_file_name.pop(old_name, None)
+        if not path:
+            self._filter_index.remove(pack.key)
+            return
+        self._file_name_by_key[pack.key] = path.name
+        self._key_by_file_name[path.name] = pack.key
+        self._filter_index.add(pack.key, file_name=path.name)
 
-    def _reset_stat(self):
-        for stringvar in self._stringvars_stat.values():
-            stringvar.set('')
+    def _update_listbox_files(self):
+        with tracer.span('update_listbox', nr_items=len(self._file_name_by_key)):
+            self._listbox_files.update_items(list(self._file_name_by_key.values()))
+        self._update_filter_options()
+        self._apply_file_filter()
+
+    def _get_filter_year(self):
+        year = self._combobox_year.get()
+        return ALL if year == FILTER_ALL else year
+
+    def _get_filter_ship(self):
+        ship = self._combobox_ship.get()
+        return ALL if ship == FILTER_ALL else ship
+
+    def _update_filter_options(self):
+        """Sets the years and the ships of the selected year in the filter. A filter value that is gone is reset"""
+        years = self._filter_index.get_years()
+        self._combobox_year['values'] = [FILTER_ALL] + years
+        if self._get_filter_year() not in [ALL] + years:
+            self._combobox_year.set(FILTER_ALL)
+        ships = self._filter_index.get_ships(self._get_filter_year())
+        self._combobox_ship['values'] = [FILTER_ALL] + ships
+        if self._get_filter_ship() not in [ALL] + ships:
+            self._combobox_ship.set(FILTER_ALL)
+
+    def _on_change_year(self, year):
+        self._combobox_year.set(year or FILTER_ALL)
+        self._update_filter_options()
+        self._apply_file_filter()
+
+    def _on_select_platform(self, ship):
+        self._combobox_ship.set(ship or FILTER_ALL)
+        self._apply_file_filter()
+
+    def _apply_file_filter(self):
+        """Shows the files matching the year, ship and search text. Called for every keystroke in the search field"""
+        text = self._stringvar_search.get()
+        with tracer.span('filter_files', text=text) as span:
+            keys = self._filter_index.search(text, year=self._get_filter_year(), ship=self._get_filter_ship())
+            if keys is None:
+                self._listbox_files.set_filter(None)
+                return
+            self._listbox_files.set_filter(self._file_name_by_key[key] for key in keys if key in self._file_name_by_key)
+            span.set(nr_matches=len(keys))
 
-    def _check_all_packs_content(self):
+    @staticmethod
+    def _check_packs_content(packs):
+        """
+        Splits packs in packs with and without standard format (txt).
+        :return: tuple (packs_with_txt, packs_without_txt)
+        """
+        ok_packs = []
         missing_txt = []
-        new_pack_list = []
-        for pack in self._all_packs_in_source_directory:
+        for pack in packs:
             if not pack['txt']:
-                missing_txt.append(pack.key)
-                missing_txt.append(pack.key)
+                missing_txt.append(pack)
                 continue
-            new_pack_list.append(pack)
-        self._all_packs_in_source_directory = new_pack_list
+            ok_packs.append(pack)
+        return ok_packs, missing_txt
+
+    def _check_all_packs_content(self):
+        missing_txt = {pack.key: pack for pack in self._scan_missing_txt if pack.key not in self._inventory}
         if missing_txt:
-            return len(missing_txt), f'Det saknas standardformat för: {", ".join(missing_txt)}. Dessa kommer inte att inkluderas'
+            nr_files = sum(len(pack) for pack in missing_txt.values())
+            keys = list(missing_txt)[:MAX_ERRORS_IN_MESSAGE]
+            if len(missing_txt) > MAX_ERRORS_IN_MESSAGE:
+                keys.append(f'... och {len(missing_txt) - MAX_ERRORS_IN_MESSAGE} till')
+            return nr_files, f'Det saknas standardformat för {len(missing_txt)} paket: {", ".join(keys)}. ' \
+                             f'Dessa kommer inte att inkluderas'
 
     def _check_selected_packs_content(self):
-        missing_sensorinfo = []
+        with tracer.span('validation', nr_packages=len(self._selected_packs)) as span:
+            report = validate_packages(self._selected_packs, sharkweb_index=self._sharkweb_index)
+            span.set(nr_problems=len(report.problem_keys))
+        msg = report.get_message()
+        if self._get_paths().get('sharkweb_file') and not report.sharkweb_checked:
+            msg = '\n\n'.join([msg, 'SHARKweb-uttaget är inte inläst och har inte kontrollerats.']).strip()
+        return msg
+
+    def _validate_selected_packs(self):
+        if not self._selected_packs:
+            messagebox.showwarning('Kontrollera paket', 'Inga filer valda!')
+            return
+        msg = self._check_selected_packs_content()
+        if msg:
+            messagebox.showwarning('Kontrollera paket', msg)
+        else:
+            messagebox.showinfo('Kontrollera paket', f'Inga brister hittades i de {len(self._selected_packs)} valda paketen')
 
     def _update_stat_all(self):
-        self._reset_stat_all()
-        stat = self._get_all_packs_statistics()
-        for suffix, nr in stat['nr_files'].items():
-            self._stringvars_stat_all[suffix].set(str(nr or 0))
+        self._stat_frame_all.update_statistics(self._stat_all)
 
     def _update_stat(self):
-        self._reset_stat()
-        if not self._selected_packs:
-            return
-        stat = self._get_packs_statistics()
-        for suffix, nr in stat['nr_files'].items():
-            self._stringvars_stat[suffix].set(str(nr or 0))
+        self._stat_frame_selected.update_statistics(self._stat_selected)
 
     def _select_local_root_dir(self):
         directory = filedialog.askdirectory(title='Välj lokal rotmapp')
@@ -387,6 +736,16 @@ class PageCTD(tk.Frame):
         self._stringvars_path['local_root_dir'].set(directory)
         self._on_select_local_dir()
 
+    def _add_local_root_dir(self):
+        directory = filedialog.askdirectory(title='Lägg till lokal rotmapp')
+        if not directory:
+            return
+        roots = [root for root in self._stringvars_path['local_root_dir'].get().split(ROOT_SEPARATOR) if root.strip()]
+        if directory in roots:
+            return
+        self._stringvars_path['local_root_dir'].set(ROOT_SEPARATOR.join(roots + [directory]))
+        self._on_select_local_dir()
+
     def _select_output_dir(self):
         directory = filedialog.askdirectory(title='Välj exportmapp')
         if not directory:
@@ -398,10 +757,134 @@ class PageCTD(tk.Frame):
         if not file:
             return
         self._stringvars_path['sharkweb_file'].set(file)
+        self._load_sharkweb_index()
+
+    def _load_sharkweb_index(self):
+        """Indexes the SHARKweb file in a worker thread"""
+        path = self._get_paths().get('sharkweb_file')
+        self._sharkweb_index = None
+        if not path:
+            self._stringvar_sharkweb_status.set('')
+            return
+        self._stringvar_sharkweb_status.set('Läser in...')
+        result = {}
+
+        def load():
+            try:
+                result['index'] = SharkwebIndex(path)
+            except Exception:
+                logger.error(traceback.format_exc())
+                result['error'] = traceback.format_exc()
+
+        self._sharkweb_index_result = result
+        threading.Thread(target=load, daemon=True).start()
+        self.after(SCAN_POLL_INTERVAL, self._poll_sharkweb_index, result)
+
+    def _poll_sharkweb_index(self, result):
+        if result is not self._sharkweb_index_result:
+            # Another file has been selected
+            return
+        if not result:
+            self.after(SCAN_POLL_INTERVAL, self._poll_sharkweb_index, result)
+            return
+        if 'error' in result:
+            self._stringvar_sharkweb_status.set('Kunde inte läsa filen')
+            messagebox.showerror('SHARKweb-uttag', result['error'])
+            return
+        self._sharkweb_index = result['index']
+        self._stringvar_sharkweb_status.set(f'{len(self._sharkweb_index)} besök')
+
+    def _get_mirror(self):
+        """The mirror of the server root. Returned also when the server can not be reached"""
+        server_root = self._stringvars_path['server_root_dir'].get().strip()
+        if not server_root:
+            return None
+        return MirrorCache(server_root, mirror_directory=self.mirror_directory)
+
+    def _select_server_root_dir(self):
+        directory = filedialog.askdirectory(title='Välj serverrotmapp')
+        if not directory:
+            return
+        self._stringvars_path['server_root_dir'].set(directory)
+        self._start_mirror_sync()
+
+    def _select_mirror_dir(self):
+        directory = filedialog.askdirectory(title='Välj mapp för lokal spegel')
+        if not directory:
+            return
+        self._stringvars_settings['mirror_dir'].set(directory)
+        self._start_mirror_sync()
+
+    def _start_mirror_sync(self):
+        if self._mirror_syncer:
+            return
+        mirror = self._get_mirror()
+        if not mirror:
+            messagebox.showwarning('Synka från server', 'Serverrotmapp saknas!')
+            return
+        if not mirror.server_root.exists():
+            status = 'Servern går inte att nå'
+            if mirror.local_root.exists():
+                status = f'{status}. Senast synkade kopian används'
+            self._stringvar_mirror_status.set(status)
+            return
+        self._stringvar_mirror_status.set('Jämför med server...')
+        self._button_mirror_sync.config(state='disabled')
+        self._mirror_syncer = MirrorSyncer(mirror)
+        self._mirror_syncer.start()
+        self.after(MIRROR_POLL_INTERVAL, self._poll_mirror_sync, self._mirror_syncer)
+
+    def _poll_mirror_sync(self, syncer):
+        finished = None
+        for message in syncer.get_messages():
+            if message.kind == 'plan':
+                self._stringvar_mirror_status.set(message.plan.summary())
+            elif message.kind == 'file':
+                self._stringvar_mirror_status.set(f'Synkar {message.done} av {message.total} filer')
+            else:
+                finished = message
+        if not finished:
+            self.after(MIRROR_POLL_INTERVAL, self._poll_mirror_sync, syncer)
+            return
+        self._mirror_syncer = None
+        self._button_mirror_sync.config(state='normal')
+        if finished.kind == 'error':
+            self._stringvar_mirror_status.set('Synkningen misslyckades')
+            messagebox.showerror('Synka från server', finished.error)
+            return
+        if finished.kind == 'cancelled':
+            self._stringvar_mirror_status.set(f'Avbruten ({finished.done} av {finished.total} filer)')
+            return
+        self._stringvar_mirror_status.set(f'Synkad ({finished.total} filer uppdaterade)')
+        if finished.placement:
+            logger.info(f'Mirror placement: {finished.placement}')
+        if syncer.errors:
+            lines = [f'{path}: {error}' for path, error in list(syncer.errors.items())[:MAX_ERRORS_IN_MESSAGE]]
+            if len(syncer.errors) > MAX_ERRORS_IN_MESSAGE:
+                lines.append(f'... och {len(syncer.errors) - MAX_ERRORS_IN_MESSAGE} till')
+            messagebox.showwarning('Synka från server', f'{len(syncer.errors)} filer kunde inte kopieras:\n' + '\n'.join(lines))
+        self._on_select_local_dir()
 
     def close(self):
+        if self._mirror_syncer:
+            self._mirror_syncer.cancel()
         self._saves.save()
 
     def update_page(self):
-        print('UPDATE')
+        pass
+
+    def _export_trace(self):
+        file_path = filedialog.asksaveasfilename(title='Spara tidsmätning',
+                                                 defaultextension='.json',
+                                                 initialfile='sharktools_data_delivery_trace.json',
+                                                 filetypes=[('Chrome trace', '*.json')])
+        if not file_path:
+            return
+        try:
+            tracer.export_chrome_trace(file_path)
+        except OSError as e:
+            messagebox.showerror('Exportera tidsmätning', f'Kunde inte spara filen: {e}')
+            return
+        messagebox.showinfo('Exportera tidsmätning', f'Tidsmätningen är sparad i {file_path}\n'
+                                                     f'Öppna den i chrome://tracing eller https://ui.perfetto.dev')
 
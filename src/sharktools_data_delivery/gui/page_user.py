@@ -24,8 +24,14 @@ class PageUser(tk.Frame):
         self.user = self.user_manager.user
         self.settings = parent_app.settings
 
-        self.color_list = utils.ColorsList()
-        self.marker_list = utils.MarkerList()
+    @property
+    def color_list(self):
+        # matplotlib is only imported if the lists are used
+        return utils.get_colors_list()
+
+    @property
+    def marker_list(self):
+        return utils.get_marker_list()
 
     def startup(self):
         self._set_frame()
@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+#
+# Copyright (c) 2018 SMHI, Swedish Meteorological and Hydrological Institute
+# License: MIT License (see LICENSE.txt or http://opensource.org/licenses/mit).
+
+import tkinter as tk
+from tkinter import ttk
+
+from ..statistics import format_bytes
+from ..statistics import sort_suffixes
+
+
+class VirtualListbox(tk.Frame):
+    """
+    Listbox that only inserts the rows that are visible in the underlying tk.Listbox.
+    Scrolling moves a window over self.items so the cost of updating the widget does
+    not depend on the number of items. Marked (highlighted) items are kept in a set.
+    """
+
+    def __init__(self, parent, height=20, width=45, on_activate=None, **kwargs):
+        tk.Frame.__init__(self, parent, **kwargs)
+        self.height = height
+        self.items = []
+        self._offset = 0
+        self._marked = set()
+        self._on_activate = on_activate
+
+        self.listbox = tk.Listbox(self, height=height, width=width, selectmode='extended',
+                                  exportselection=False, activestyle='none')
+        self.listbox.grid(row=0, column=0, sticky='nsew')
+        self.scrollbar = ttk.Scrollbar(self, orient='vertical', command=self._on_scroll)
+        self.scrollbar.grid(row=0, column=1, sticky='ns')
+        self.rowconfigure(0, weight=1)
+        self.columnconfigure(0, weight=1)
+
+        self.listbox.bind('<<ListboxSelect>>', self._on_listbox_select)
+        self.listbox.bind('<MouseWheel>', self._on_mousewheel)
+        self.listbox.bind('<Button-4>', lambda event: self.scroll(-3))
+        self.listbox.bind('<Button-5>', lambda event: self.scroll(3))
+        self.listbox.bind('<Double-Button-1>', self._on_double_click)
+        self.listbox.bind('<Return>', lambda event: self._activate())
+
+    def set_items(self, items):
+        self.items = list(items)
+        self._marked.intersection_update(self.items)
+        self._offset = max(0, min(self._offset, len(self.items) - self.height))
+        self._render()
+
+    def get_marked(self):
+        return [item for item in self.items if item in self._marked]
+
+    def mark_all(self):
+        self._marked = set(self.items)
+        self._render()
+
+    def unmark_all(self):
+        self._marked = set()
+        self._render()
+
+    def scroll(self, nr_rows):
+        offset = max(0, min(self._offset + nr_rows, len(self.items) - self.height))
+        if offset == self._offset:
+            return
+        self._offset = offset
+        self._render()
+
+    def _render(self):
+        visible = self.items[self._offset:self._offset + self.height]
+        self.listbox.delete(0, 'end')
+        if visible:
+            self.listbox.insert('end', *visible)
+        for row, item in enumerate(visible):
+            if item in self._marked:
+                self.listbox.selection_set(row)
+        if self.items:
+            first = self._offset / len(self.items)
+            last = min(1.0, (self._offset + self.height) / len(self.items))
+        else:
+            first, last = 0.0, 1.0
+        self.scrollbar.set(first, last)
+
+    def _on_scroll(self, action, value, unit=None):
+        if action == 'moveto':
+            self.scroll(int(float(value) * len(self.items)) - self._offset)
+        elif action == 'scroll':
+            step = self.height if unit == 'pages' else 1
+            self.scroll(int(value) * step)
+
+    def _on_mousewheel(self, event):
+        self.scroll(-3 if event.delta > 0 else 3)
+
+    def _on_listbox_select(self, event=None):
+        selected_rows = set(self.listbox.curselection())
+        for row, item in enumerate(self.items[self._offset:self._offset + self.height]):
+            if row in selected_rows:
+                self._marked.add(item)
+            else:
+                self._marked.discard(item)
+
+    def _on_double_click(self, event):
+        row = self.listbox.nearest(event.y)
+        index = self._offset + row
+        if index >= len(self.items):
+            return
+        self._marked.add(self.items[index])
+        self._activate()
+
+    def _activate(self):
+        if self._on_activate:
+            self._on_activate()
+
+
+class VirtualListboxSelectionWidget(tk.Frame):
+    """
+    Two virtual listboxes where items are moved between "available" (left) and "selected" (right).
+    Has the same basic interface as tkw.ListboxSelectionWidget: update_items, get_selected and a
+    callback that is called without arguments when the selection changes.
+    The available items can be narrowed down with set_filter. Selected items are always shown.
+    """
+
+    def __init__(self, parent, callback=None, width=45, height=20, row=0, column=0, **kwargs):
+        tk.Frame.__init__(self, parent)
+        self.grid(row=row, column=column, sticky='nsew', **kwargs)
+        self._callback = callback
+        self._items = []
+        self._selected = set()
+        self._filter = None
+
+        self._stringvar_nr_items = tk.StringVar()
+        self._stringvar_nr_selected = tk.StringVar()
+        tk.Label(self, textvariable=self._stringvar_nr_items).grid(row=0, column=0, sticky='w')
+        tk.Label(self, textvariable=self._stringvar_nr_selected).grid(row=0, column=2, sticky='w')
+
+        self._listbox_items = VirtualListbox(self, width=width, height=height, on_activate=self.select_marked)
+        self._listbox_items.grid(row=1, column=0, sticky='nsew')
+        self._listbox_selected = VirtualListbox(self, width=width, height=height, on_activate=self.deselect_marked)
+        self._listbox_selected.grid(row=1, column=2, sticky='nsew')
+
+        frame = tk.Frame(self)
+        frame.grid(row=1, column=1)
+        opt = dict(width=4)
+        tk.Button(frame, text='>', command=self.select_marked, **opt).grid(row=0, column=0, pady=2)
+        tk.Button(frame, text='>>', command=self.select_all, **opt).grid(row=1, column=0, pady=2)
+        tk.Button(frame, text='<', command=self.deselect_marked, **opt).grid(row=2, column=0, pady=2)
+        tk.Button(frame, text='<<', command=self.deselect_all, **opt).grid(row=3, column=0, pady=2)
+
+        self.rowconfigure(1, weight=1)
+        self.columnconfigure(0, weight=1)
+        self.columnconfigure(2, weight=1)
+        self._render()
+
+    def update_items(self, items=None):
+        """Sets the available items. Selected items that are still available stay selected"""
+        self._items = list(items or [])
+        old_selected = self._selected
+        self._selected = old_selected.intersection(self._items)
+        self._render()
+        if self._selected != old_selected:
+            self._on_change()
+
+    def get_items(self):
+        return list(self._items)
+
+    def set_filter(self, items=None):
+        """Only the available items in items are shown. items=None shows all"""
+        self._filter = None if items is None else set(items)
+        self._render()
+
+    def get_visible_items(self):
+        if self._filter is None:
+            return [item for item in self._items if item not in self._selected]
+        return [item for item in self._items if item in self._filter and item not in self._selected]
+
+    def get_selected(self):
+        return [item for item in self._items if item in self._selected]
+
+    def set_selected(self, items):
+        self._selected = set(items).intersection(self._items)
+        self._render()
+        self._on_change()
+
+    def select_marked(self):
+        self._selected.update(self._listbox_items.get_marked())
+        self._render()
+        self._on_change()
+
+    def select_all(self):
+        self._selected.update(self.get_visible_items())
+        self._render()
+        self._on_change()
+
+    def deselect_marked(self):
+        self._selected.difference_update(self._listbox_selected.get_marked())
+        self._render()
+        self._on_change()
+
+    def deselect_all(self):
+        self._selected = set()
+        self._render()
+        self._on_change()
+
+    def _render(self):
+        visible_items = self.get_visible_items()
+        self._listbox_items.set_items(visible_items)
+        self._listbox_selected.set_items(self.get_selected())
+        nr_available = len(self._items) - len(self._selected)
+        if len(visible_items) == nr_available:
+            self._stringvar_nr_items.set(f'{nr_available} st')
+        else:
+            self._stringvar_nr_items.set(f'{len(visible_items)} av {nr_available} st')
+        self._stringvar_nr_selected.set(f'{len(self._selected)} st valda')
+
+    def _on_change(self):
+        if self._callback:
+            self._callback()
+
+
+class SuffixStatisticsFrame(tk.Frame):
+    """
+    Shows the number of files (and bytes) per suffix from a SuffixStatistics object.
+    Rows are created the first time a suffix is present.
+    """
+
+    def __init__(self, parent, row=0, column=0, **kwargs):
+        tk.Frame.__init__(self, parent)
+        self.grid(row=row, column=column, sticky='nsew', **kwargs)
+        self._grid = dict(padx=5, pady=2)
+        self._stringvars = {}
+        self._labels = {}
+        self._stringvar_total = tk.StringVar()
+        self._label_total = tk.Label(self, textvariable=self._stringvar_total)
+
+    def _add_row(self, suffix):
+        label = tk.Label(self, text=f'Antal {suffix or "(utan ändelse)"}-filer:')
+        stringvar = tk.StringVar()
+        value_label = tk.Label(self, textvariable=stringvar)
+        self._stringvars[suffix] = stringvar
+        self._labels[suffix] = (label, value_label)
+
+    def _grid_rows(self, suffixes):
+        for r, suffix in enumerate(suffixes):
+            label, value_label = self._labels[suffix]
+            label.grid(row=r, column=0, **self._grid, sticky='e')
+            value_label.grid(row=r, column=1, **self._grid, sticky='w')
+        self._label_total.grid(row=len(suffixes), column=0, columnspan=2, **self._grid, sticky='w')
+
+    def update_statistics(self, statistics):
+        new_suffixes = [suffix for suffix in statistics.suffixes if suffix not in self._stringvars]
+        for suffix in new_suffixes:
+            self._add_row(suffix)
+        if new_suffixes:
+            self._grid_rows(sort_suffixes(self._stringvars))
+        for suffix, stringvar in self._stringvars.items():
+            nr = statistics.nr_files.get(suffix)
+            stringvar.set(str(nr) if nr else '')
+        if len(statistics):
+            self._stringvar_total.set(f'Totalt: {statistics.total_nr_files} filer '
+                                      f'({format_bytes(statistics.total_nr_bytes)})')
+        else:
+            self._stringvar_total.set('')
@@ -0,0 +1,173 @@
+import array
+import os
+import pathlib
+import threading
+
+
+class SymbolTable:
+    """Stores each distinct string once and refers to it with an integer code"""
+
+    def __init__(self):
+        self._codes = {}
+        self._values = []
+
+    def __len__(self):
+        return len(self._values)
+
+    def get_code(self, value):
+        code = self._codes.get(value)
+        if code is None:
+            code = len(self._values)
+            self._codes[value] = code
+            self._values.append(value)
+        return code
+
+    def get_value(self, code):
+        return self._values[code]
+
+
+class PackageRecord:
+    """
+    Compact representation of a package: the key and, per file, the directory code, suffix code,
+    size and mtime in arrays. The file name is only stored if it is not <key><suffix>.
+    Has the parts of the file_explorer package interface that the page, statistics and
+    validation use (key, files, pack['txt'], get_file_path). Use PackageInventory.materialize
+    to get the full package objects for delivery.
+    """
+    __slots__ = ('key', 'directory_codes', 'suffix_codes', 'sizes', 'mtimes', 'names', '_inventory')
+
+    def __init__(self, inventory, key, directory_codes, suffix_codes, sizes, mtimes, names):
+        self._inventory = inventory
+        self.key = key
+        self.directory_codes = directory_codes
+        self.suffix_codes = suffix_codes
+        self.sizes = sizes
+        self.mtimes = mtimes
+        self.names = names
+
+    def __len__(self):
+        return len(self.suffix_codes)
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.key}, {len(self)} files)'
+
+    def __getitem__(self, item):
+        """Paths with the given suffix, e.g. record['txt'], as for a file_explorer package"""
+        suffix = f'.{item}'
+        directories = self._inventory.directories
+        return [pathlib.Path(directories.get_value(self.directory_codes[i]), self._get_name(i, suffix))
+                for i, s in enumerate(self.suffixes) if s == suffix]
+
+    def _get_name(self, i, suffix):
+        name = self.names[i] if self.names else None
+        return name if name is not None else f'{self.key}{suffix}'
+
+    @property
+    def suffixes(self):
+        return [self._inventory.suffixes.get_value(code) for code in self.suffix_codes]
+
+    @property
+    def files(self):
+        directories = self._inventory.directories
+        paths = []
+        for i, suffix in enumerate(self.suffixes):
+            directory = directories.get_value(self.directory_codes[i])
+            paths.append(pathlib.Path(directory, self._get_name(i, suffix)))
+        return paths
+
+    def get_file_path(self, suffix):
+        paths = self[suffix.lstrip('.')]
+        return paths[0] if paths else None
+
+    @property
+    def nr_bytes(self):
+        return sum(self.sizes)
+
+    def get_statistics(self):
+        """
+        Files and bytes per suffix, as statistics.get_package_statistics but without reading the file system.
+        :return: dict {suffix: (nr_files, nr_bytes)}
+        """
+        stat = {}
+        for suffix, size in zip(self.suffixes, self.sizes):
+            nr, nr_bytes = stat.get(suffix, (0, 0))
+            stat[suffix] = (nr + 1, nr_bytes + size)
+        return stat
+
+
+class PackageInventory:
+    """
+    The packages found in a scan as PackageRecord objects. Directories and suffixes are shared
+    between all records, so a large root takes a fraction of the memory of the package objects.
+    Records are created with make_record, which can be called from a worker thread.
+    """
+
+    def __init__(self):
+        self.directories = SymbolTable()
+        self.suffixes = SymbolTable()
+        self._records = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._records)
+
+    def __contains__(self, key):
+        return key in self._records
+
+    def __iter__(self):
+        return iter(list(self._records.values()))
+
+    def keys(self):
+        return self._records.keys()
+
+    def get(self, key, default=None):
+        return self._records.get(key, default)
+
+    def add(self, record):
+        self._records[record.key] = record
+
+    def remove(self, key):
+        self._records.pop(key, None)
+
+    def clear(self):
+        self._records = {}
+
+    def make_record(self, pack):
+        """Creates a PackageRecord from a file_explorer package. Reads size and mtime of the files"""
+        directory_codes = array.array('I')
+        suffix_codes = array.array('H')
+        sizes = array.array('q')
+        mtimes = array.array('q')
+        names = []
+        paths = [pathlib.Path(path) for path in pack.files]
+        for path in paths:
+            try:
+                stat = os.stat(path)
+                sizes.append(stat.st_size)
+                mtimes.append(stat.st_mtime_ns)
+            except OSError:
+                sizes.append(0)
+                mtimes.append(0)
+            names.append(None if path.name == f'{pack.key}{path.suffix}' else path.name)
+        with self._lock:
+            for path in paths:
+                directory_codes.append(self.directories.get_code(str(path.parent)))
+                suffix_codes.append(self.suffixes.get_code(path.suffix))
+        if not any(names):
+            names = None
+        else:
+            names = tuple(names)
+        return PackageRecord(self, pack.key, directory_codes, suffix_codes, sizes, mtimes, names)
+
+    @staticmethod
+    def materialize(records):
+        """
+        Returns the file_explorer package objects for the given records (or packages, which are returned as they are).
+        The files of all records are grouped in one go.
+        """
+        from .scanner import group_files
+        records = list(records)
+        files = [path for record in records if isinstance(record, PackageRecord) for path in record.files]
+        packages = {pack.key: pack for pack in group_files(files)}
+        return [packages.get(record.key, record) if isinstance(record, PackageRecord) else record
+                for record in records]
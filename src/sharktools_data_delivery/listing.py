@@ -0,0 +1,131 @@
+import collections
+import logging
+import os
+import pathlib
+import threading
+import time
+import traceback
+
+logger = logging.getLogger(__file__)
+
+LISTING_CACHE_SIZE = 256
+# A directory changed within this many seconds is listed again even if the mtime is unchanged.
+# Some file systems (FAT, network shares) store mtime with a resolution of one or two seconds.
+MTIME_RESOLUTION = 2.0
+
+
+class DirectoryListing:
+    """
+    Lists the files in directories with os.scandir. Results are kept in an LRU cache and reused as long
+    as the mtime of the directory is unchanged (files added, removed or renamed changes the mtime).
+    An optional metrics hook is called for every listing: hook(directory, suffix, cache_hit, duration).
+    """
+
+    def __init__(self, max_size=LISTING_CACHE_SIZE, metrics_hook=None):
+        self.max_size = max_size
+        self.metrics_hook = metrics_hook
+        self._cache = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_files(self, directory, suffix=None):
+        """Returns the names of the files in directory. If suffix is given only files with that suffix are listed"""
+        t0 = time.perf_counter()
+        directory = str(directory)
+        key = (directory, suffix)
+        try:
+            mtime_ns = os.stat(directory).st_mtime_ns
+        except OSError:
+            with self._lock:
+                self._cache.pop(key, None)
+            return []
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached and cached[0] == mtime_ns:
+                self._cache.move_to_end(key)
+        cache_hit = bool(cached and cached[0] == mtime_ns)
+        if cache_hit:
+            files = cached[1]
+        else:
+            files = self._scan(directory, suffix)
+            if time.time() - mtime_ns / 1e9 > MTIME_RESOLUTION:
+                with self._lock:
+                    self._cache[key] = (mtime_ns, files)
+                    self._cache.move_to_end(key)
+                    while len(self._cache) > self.max_size:
+                        self._cache.popitem(last=False)
+        if self.metrics_hook:
+            self.metrics_hook(directory, suffix, cache_hit, time.perf_counter() - t0)
+        return list(files)
+
+    @staticmethod
+    def _scan(directory, suffix):
+        files = []
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    # Filter on name first, is_file only needs a stat when the file system does not give the type
+                    if suffix and not entry.name.endswith(suffix):
+                        continue
+                    if entry.is_file():
+                        files.append(entry.name)
+        except OSError as e:
+            logger.warning(f'Could not list directory {directory}: {e}')
+        return files
+
+    def invalidate(self, directory=None):
+        """Removes directory (all directories if None) from the cache"""
+        with self._lock:
+            if directory is None:
+                self._cache.clear()
+                return
+            directory = str(directory)
+            for key in [key for key in self._cache if key[0] == directory]:
+                self._cache.pop(key)
+
+
+class ListingMetrics:
+    """
+    Metrics hook for DirectoryListing. Counts calls, cache hits and time per directory.
+    With keep_callers=True the calling functions (within this package) are recorded for each call.
+    """
+
+    def __init__(self, keep_callers=False):
+        self.keep_callers = keep_callers
+        self.calls = collections.Counter()
+        self.hits = collections.Counter()
+        self.time = collections.Counter()
+        self.callers = collections.Counter()
+        self._lock = threading.Lock()
+
+    def __call__(self, directory, suffix, cache_hit, duration):
+        name = pathlib.Path(directory).name
+        caller = None
+        if self.keep_callers:
+            package_directory = str(pathlib.Path(__file__).parent)
+            frames = [frame.name for frame in traceback.extract_stack()[:-2]
+                      if frame.filename.startswith(package_directory)]
+            caller = ' -> '.join(frames + [name])
+        with self._lock:
+            self.calls[directory] += 1
+            self.hits[directory] += cache_hit
+            self.time[directory] += duration
+            if caller:
+                self.callers[caller] += 1
+
+    def get_report(self):
+        lines = ['Directory listings (calls, cache hits, time):']
+        for directory, nr in self.calls.most_common():
+            lines.append(f'    {directory}: {nr}, {self.hits[directory]}, {self.time[directory] * 1000:.1f} ms')
+        if self.callers:
+            lines.append('Callers:')
+            for caller, nr in self.callers.most_common():
+                lines.append(f'    {nr}: {caller}')
+        return '\n'.join(lines)
+
+
+listing = DirectoryListing()
+
+
+def set_metrics_hook(hook):
+    """Sets the metrics hook of the shared listing. None turns metrics off"""
+    listing.metrics_hook = hook
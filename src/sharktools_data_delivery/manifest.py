@@ -0,0 +1,99 @@
+import json
+import logging
+import os
+import pathlib
+
+from .checksums import sha256_file
+
+logger = logging.getLogger(__file__)
+
+MANIFEST_FILE_NAME = 'delivery_manifest.json'
+
+
+class DeliveryPlan:
+    """Result of comparing packages with the manifest of a previous delivery"""
+
+    def __init__(self):
+        self.added = []
+        self.changed = []
+        self.unchanged = []
+        self.states = {}
+
+    @property
+    def to_deliver(self):
+        return self.added + self.changed
+
+    def summary(self):
+        return f'{len(self.added)} nya, {len(self.changed)} ändrade och {len(self.unchanged)} oförändrade paket'
+
+
+class DeliveryManifest:
+    """
+    Keeps track of the source files (size, mtime and sha256) of every package that has been
+    delivered to an output directory. The manifest is stored as json in the output directory.
+    """
+
+    def __init__(self, output_dir):
+        self.file_path = pathlib.Path(output_dir, MANIFEST_FILE_NAME)
+        self.data = {}
+        self._load()
+
+    def _load(self):
+        if not self.file_path.exists():
+            return
+        try:
+            with open(self.file_path) as fid:
+                self.data = json.load(fid)
+        except ValueError:
+            logger.warning(f'Could not read delivery manifest {self.file_path}. All packages will be delivered')
+            self.data = {}
+
+    def save(self):
+        """Writes the manifest to a temporary file that then replaces the manifest"""
+        temp_path = self.file_path.with_name(self.file_path.name + '.tmp')
+        with open(temp_path, 'w') as fid:
+            json.dump(self.data, fid, indent=4, sort_keys=True)
+        os.replace(temp_path, self.file_path)
+
+    def get_package_state(self, pack):
+        """
+        Returns size, mtime and sha256 for the files in the package. The checksum in the manifest
+        is reused for files with the same size and mtime as when the package was delivered.
+        :return: dict {path: [size, mtime_ns, sha256]}
+        """
+        previous = self.data.get(pack.key, {})
+        state = {}
+        for path in pack.files:
+            stat = os.stat(path)
+            path = str(path)
+            old = previous.get(path)
+            if old and old[0] == stat.st_size and old[1] == stat.st_mtime_ns:
+                state[path] = old
+                continue
+            state[path] = [stat.st_size, stat.st_mtime_ns, sha256_file(path)]
+        return state
+
+    def get_plan(self, packs):
+        """
+        Compares the packages with the manifest.
+        :return: DeliveryPlan
+        """
+        plan = DeliveryPlan()
+        for pack in packs:
+            state = self.get_package_state(pack)
+            plan.states[pack.key] = state
+            previous = self.data.get(pack.key)
+            if previous is None:
+                plan.added.append(pack)
+            elif self._checksums(previous) != self._checksums(state):
+                plan.changed.append(pack)
+            else:
+                plan.unchanged.append(pack)
+        return plan
+
+    @staticmethod
+    def _checksums(state):
+        return {path: item[2] for path, item in state.items()}
+
+    def set_package_state(self, key, state):
+        self.data[key] = state
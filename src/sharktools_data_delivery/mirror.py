@@ -0,0 +1,237 @@
+import concurrent.futures
+import hashlib
+import logging
+import os
+import pathlib
+import traceback
+
+from .checksums import sha256_file
+from .placement import AUTO
+from .placement import COPY_STRATEGIES
+from .placement import FilePlacer
+from .placement import PlacementError
+from .placement import get_strategies
+from .scanner import EXCLUDE_DIRECTORY
+from .statistics import format_bytes
+from .tracing import tracer
+from .worker import WorkerThread
+
+logger = logging.getLogger(__file__)
+
+DEFAULT_MIRROR_DIRECTORY = pathlib.Path(pathlib.Path(__file__).parent, 'cache', 'mirror')
+COPY_WORKERS = 4
+# Network shares and FAT store mtime with a resolution of up to two seconds
+MTIME_TOLERANCE_NS = 2 * 10**9
+TEMP_SUFFIX = '.mirror-tmp'
+
+
+def list_tree(root_directory, exclude_directory=EXCLUDE_DIRECTORY, failed_directories=None):
+    """
+    Lists all files under root_directory with os.scandir. An OSError when listing root_directory is
+    raised. Subdirectories that can not be listed are logged and added to failed_directories (relative
+    posix paths) if given.
+    :return: dict {relative posix path: (size, mtime_ns)}
+    """
+    root_directory = str(root_directory)
+    files = {}
+    directories = [root_directory]
+    while directories:
+        current = directories.pop()
+        try:
+            with os.scandir(current) as it:
+                for entry in it:
+                    if entry.is_dir():
+                        if entry.name != exclude_directory:
+                            directories.append(entry.path)
+                    elif entry.is_file() and not entry.name.endswith(TEMP_SUFFIX):
+                        stat = entry.stat()
+                        rel_path = os.path.relpath(entry.path, root_directory).replace(os.sep, '/')
+                        files[rel_path] = (stat.st_size, stat.st_mtime_ns)
+        except OSError as e:
+            if current == root_directory:
+                raise
+            logger.warning(f'Could not list directory {current}: {e}')
+            if failed_directories is not None:
+                failed_directories.append(os.path.relpath(current, root_directory).replace(os.sep, '/'))
+    return files
+
+
+class MirrorPlan:
+    """Files to copy from and remove in the mirror"""
+
+    def __init__(self):
+        self.to_copy = []
+        self.to_remove = []
+        self.failed_directories = []
+        self.nr_unchanged = 0
+        self.nr_bytes = 0
+
+    def summary(self):
+        summary = f'{len(self.to_copy)} nya eller ändrade filer ({format_bytes(self.nr_bytes)}), ' \
+                  f'{len(self.to_remove)} borttagna och {self.nr_unchanged} oförändrade'
+        if self.failed_directories:
+            summary = f'{summary}. {len(self.failed_directories)} mappar på servern kunde inte läsas och behålls som de är'
+        return summary
+
+
+class MirrorCache:
+    """
+    Local copy of a (slow) server root directory. sync() copies only the files that are new or
+    changed on the server and removes files that have been removed on the server, so that scans
+    and deliveries can be made from local_root. Files under a server directory that can not be
+    listed are kept in the mirror. Files are compared on size and mtime, or on
+    checksum with compare='checksum' (reads all files on both sides).
+
+    Files are copied with the first of placement.COPY_STRATEGIES that works between the file
+    systems (reflink, copy_file_range, sendfile or a buffered copy), or with the given placement.
+    placement_report holds the number of files copied with each strategy in the latest sync.
+    """
+
+    def __init__(self, server_root, mirror_directory=DEFAULT_MIRROR_DIRECTORY, compare='size_mtime',
+                 workers=COPY_WORKERS, exclude_directory=EXCLUDE_DIRECTORY, placement=AUTO):
+        if compare not in ['size_mtime', 'checksum']:
+            raise ValueError(f'Unknown compare method: {compare}')
+        self.server_root = pathlib.Path(server_root)
+        self.mirror_directory = pathlib.Path(mirror_directory)
+        self.compare = compare
+        self.workers = max(1, int(workers))
+        self.exclude_directory = exclude_directory
+        self.placement_strategies = get_strategies(placement, default=COPY_STRATEGIES)
+        self._placer = None
+
+    @property
+    def placement_report(self):
+        return self._placer.report if self._placer else None
+
+    @property
+    def local_root(self):
+        """Directory of the mirror. Named after the server root so that several servers can be mirrored"""
+        name = hashlib.sha1(str(self.server_root.absolute()).encode()).hexdigest()[:10]
+        return pathlib.Path(self.mirror_directory, f'{self.server_root.name}_{name}')
+
+    def _is_unchanged(self, rel_path, server_state, local_state):
+        if local_state is None or server_state[0] != local_state[0]:
+            return False
+        if self.compare == 'checksum':
+            return sha256_file(self.server_root / rel_path) == sha256_file(self.local_root / rel_path)
+        return abs(server_state[1] - local_state[1]) <= MTIME_TOLERANCE_NS
+
+    def plan(self):
+        """
+        Compares the server root with the mirror. Raises OSError if the server root can not be listed.
+        :return: MirrorPlan
+        """
+        with tracer.span('mirror_plan', server_root=str(self.server_root)) as span:
+            plan = MirrorPlan()
+            server_files = list_tree(self.server_root, exclude_directory=self.exclude_directory,
+                                     failed_directories=plan.failed_directories)
+            local_files = list_tree(self.local_root, exclude_directory=self.exclude_directory) \
+                if self.local_root.exists() else {}
+            for rel_path, server_state in sorted(server_files.items()):
+                if self._is_unchanged(rel_path, server_state, local_files.get(rel_path)):
+                    plan.nr_unchanged += 1
+                    continue
+                plan.to_copy.append(rel_path)
+                plan.nr_bytes += server_state[0]
+            # Files under a directory that could not be listed are not known to be removed on the server
+            failed_prefixes = tuple(f'{directory}/' for directory in plan.failed_directories)
+            plan.to_remove = sorted(rel_path for rel_path in set(local_files) - set(server_files)
+                                    if not rel_path.startswith(failed_prefixes))
+            span.set(nr_server_files=len(server_files), nr_to_copy=len(plan.to_copy),
+                     nr_to_remove=len(plan.to_remove), nr_bytes=plan.nr_bytes,
+                     nr_failed_directories=len(plan.failed_directories))
+        logger.info(f'Mirror of {self.server_root}: {plan.summary()}')
+        return plan
+
+    def _copy(self, rel_path):
+        target = self.local_root / rel_path
+        target.parent.mkdir(parents=True, exist_ok=True)
+        # The placer keeps the mtime so that the next comparison finds the file unchanged
+        self._placer.place(self.server_root / rel_path, target)
+
+    def _remove(self, rel_path):
+        try:
+            os.remove(self.local_root / rel_path)
+        except FileNotFoundError:
+            pass
+
+    def sync(self, cancel_event=None, plan=None):
+        """
+        Generator that brings the mirror up to date. Files are copied in a thread pool.
+        :return: yields tuples (nr_done, nr_total, relative_path, error). error is None if the file was synced.
+        """
+        plan = plan or self.plan()
+        self._placer = FilePlacer(self.placement_strategies, temp_suffix=TEMP_SUFFIX)
+        total = len(plan.to_copy) + len(plan.to_remove)
+        done = 0
+        for rel_path in plan.to_remove:
+            self._remove(rel_path)
+            done += 1
+            yield done, total, rel_path, None
+        with tracer.span('mirror_copy', nr_files=len(plan.to_copy), nr_bytes=plan.nr_bytes):
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as executor:
+                futures = {executor.submit(self._copy, rel_path): rel_path for rel_path in plan.to_copy}
+                for future in concurrent.futures.as_completed(futures):
+                    rel_path = futures[future]
+                    try:
+                        future.result()
+                        error = None
+                    except concurrent.futures.CancelledError:
+                        continue
+                    except (OSError, PlacementError) as e:
+                        error = str(e)
+                        logger.error(f'Could not copy {rel_path} to mirror: {e}')
+                    done += 1
+                    yield done, total, rel_path, error
+                    if cancel_event and cancel_event.is_set():
+                        for f in futures:
+                            f.cancel()
+                        return
+
+
+class MirrorMessage:
+    """
+    Message put on the queue of a MirrorSyncer. kind is one of
+    'plan', 'file', 'done', 'cancelled' or 'error'.
+    """
+    def __init__(self, kind, done=0, total=0, path=None, error=None, plan=None, placement=None):
+        self.kind = kind
+        self.done = done
+        self.total = total
+        self.path = path
+        self.error = error
+        self.plan = plan
+        self.placement = placement
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.kind}, {self.done}/{self.total})'
+
+
+class MirrorSyncer(WorkerThread):
+    """
+    Syncs a MirrorCache in a worker thread. Progress is put on self.queue as MirrorMessage
+    objects so that the GUI can poll them with after().
+    """
+
+    def __init__(self, mirror):
+        WorkerThread.__init__(self)
+        self.mirror = mirror
+        self.errors = {}
+
+    def run(self):
+        done = total = 0
+        try:
+            plan = self.mirror.plan()
+            total = len(plan.to_copy) + len(plan.to_remove)
+            self.queue.put(MirrorMessage('plan', total=total, plan=plan))
+            for done, total, rel_path, error in self.mirror.sync(cancel_event=self._cancel_event, plan=plan):
+                if error:
+                    self.errors[rel_path] = error
+                self.queue.put(MirrorMessage('file', done=done, total=total, path=rel_path, error=error))
+        except Exception:
+            logger.error(traceback.format_exc())
+            self.queue.put(MirrorMessage('error', done=done, total=total, error=traceback.format_exc()))
+            return
+        kind = 'cancelled' if self.cancelled else 'done'
+        report = self.mirror.placement_report
+        self.queue.put(MirrorMessage(kind, done=done, total=total, placement=report.summary() if report else None))
@@ -0,0 +1,232 @@
+import logging
+import os
+import pathlib
+import pickle
+import sqlite3
+
+from .scanner import EXCLUDE_DIRECTORY
+from .scanner import group_files
+
+logger = logging.getLogger(__file__)
+
+SCHEMA_VERSION = '1'
+
+DEFAULT_INDEX_PATH = pathlib.Path(pathlib.Path(__file__).parent, 'package_index.sqlite')
+
+
+class PackageIndex:
+    """
+    Persistent index of the packages found under one or more root directories. The index
+    stores the files (size and mtime) and sub directories of every directory together with
+    the directory mtime. On a rescan only directories whose mtime has changed are listed
+    again and only the packages with added, changed or removed files are regrouped.
+    get_packages only returns the files in the requested directory, also for packages that
+    have files in other directories in the index.
+
+    Note that modifying a file in place does not change the mtime of its directory.
+    Use rebuild() if files are edited without being replaced.
+    """
+
+    def __init__(self, file_path=None):
+        self.file_path = pathlib.Path(file_path or DEFAULT_INDEX_PATH)
+        self._create_tables()
+
+    def _connect(self):
+        con = sqlite3.connect(self.file_path, timeout=30)
+        return con
+
+    def _create_tables(self):
+        con = self._connect()
+        try:
+            with con:
+                con.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)')
+                row = con.execute("SELECT value FROM meta WHERE name='schema_version'").fetchone()
+                if row and row[0] != SCHEMA_VERSION:
+                    logger.info(f'Package index has old schema version {row[0]}. Rebuilding')
+                    self._drop_tables(con)
+                con.execute('CREATE TABLE IF NOT EXISTS directories '
+                            '(path TEXT PRIMARY KEY, mtime_ns INTEGER, subdirs TEXT)')
+                con.execute('CREATE TABLE IF NOT EXISTS files '
+                            '(path TEXT PRIMARY KEY, directory TEXT, size INTEGER, mtime_ns INTEGER, package_key TEXT)')
+                con.execute('CREATE INDEX IF NOT EXISTS files_directory ON files (directory)')
+                con.execute('CREATE INDEX IF NOT EXISTS files_package_key ON files (package_key)')
+                con.execute('CREATE TABLE IF NOT EXISTS packages (key TEXT PRIMARY KEY, data BLOB)')
+                con.execute("INSERT OR REPLACE INTO meta VALUES ('schema_version', ?)", (SCHEMA_VERSION,))
+        finally:
+            con.close()
+
+    @staticmethod
+    def _drop_tables(con):
+        for table in ['directories', 'files', 'packages']:
+            con.execute(f'DROP TABLE IF EXISTS {table}')
+
+    def rebuild(self):
+        """Removes all content in the index"""
+        con = self._connect()
+        try:
+            with con:
+                self._drop_tables(con)
+        finally:
+            con.close()
+        self._create_tables()
+
+    @staticmethod
+    def _prefix_range(directory):
+        prefix = str(directory).rstrip(os.sep) + os.sep
+        return prefix, prefix[:-1] + chr(ord(os.sep) + 1)
+
+    def get_packages(self, directory, recursive=True, exclude_directory=EXCLUDE_DIRECTORY):
+        """
+        Returns the packages that have files in directory. The index is updated for the
+        directories that have changed since the last call.
+        :return: list of packages
+        """
+        directory = str(pathlib.Path(directory).absolute())
+        con = self._connect()
+        try:
+            with con:
+                new_files, affected_keys = self._update_directories(con, directory, recursive, exclude_directory)
+                self._regroup(con, new_files, affected_keys)
+                return self._load_packages(con, directory, recursive)
+        finally:
+            con.close()
+
+    def _update_directories(self, con, directory, recursive, exclude_directory):
+        """
+        Walks directory and updates the tables for the directories with a changed mtime.
+        :return: tuple (paths of new or modified files, keys of packages that are affected)
+        """
+        new_files = []
+        affected_keys = set()
+        directories = [directory]
+        while directories:
+            current = directories.pop()
+            try:
+                mtime_ns = os.stat(current).st_mtime_ns
+            except FileNotFoundError:
+                affected_keys.update(self._remove_directory(con, current))
+                continue
+            row = con.execute('SELECT mtime_ns, subdirs FROM directories WHERE path=?', (current,)).fetchone()
+            if row and row[0] == mtime_ns:
+                subdirs = row[1].split('\n') if row[1] else []
+            else:
+                subdirs = self._update_directory(con, current, mtime_ns, row, new_files, affected_keys)
+            if not recursive:
+                continue
+            for name in subdirs:
+                if name == exclude_directory:
+                    continue
+                directories.append(os.path.join(current, name))
+        return new_files, affected_keys
+
+    def _update_directory(self, con, directory, mtime_ns, row, new_files, affected_keys):
+        subdirs = []
+        files = {}
+        with os.scandir(directory) as it:
+            for entry in it:
+                if entry.is_dir():
+                    subdirs.append(entry.name)
+                elif entry.is_file():
+                    stat = entry.stat()
+                    files[entry.path] = (stat.st_size, stat.st_mtime_ns)
+        old_files = {path: (size, mtime, key) for path, size, mtime, key in
+                     con.execute('SELECT path, size, mtime_ns, package_key FROM files WHERE directory=?', (directory,))}
+        for path, (size, mtime, key) in old_files.items():
+            if files.get(path) == (size, mtime):
+                continue
+            affected_keys.add(key)
+            con.execute('DELETE FROM files WHERE path=?', (path,))
+        for path, (size, mtime) in files.items():
+            old = old_files.get(path)
+            if old and old[:2] == (size, mtime):
+                continue
+            con.execute('INSERT INTO files VALUES (?, ?, ?, ?, NULL)', (path, directory, size, mtime))
+            new_files.append(path)
+        if row and row[1]:
+            for name in set(row[1].split('\n')) - set(subdirs):
+                affected_keys.update(self._remove_directory(con, os.path.join(directory, name)))
+        con.execute('INSERT OR REPLACE INTO directories VALUES (?, ?, ?)', (directory, mtime_ns, '\n'.join(subdirs)))
+        return subdirs
+
+    def _remove_directory(self, con, directory):
+        """
+        Removes directory and everything below it from the index.
+        :return: keys of the packages that had files in the directory
+        """
+        low, high = self._prefix_range(directory)
+        keys = {key for key, in con.execute('SELECT DISTINCT package_key FROM files WHERE directory=? OR '
+                                             '(path >= ? AND path < ?)', (directory, low, high))}
+        con.execute('DELETE FROM files WHERE directory=? OR (path >= ? AND path < ?)', (directory, low, high))
+        con.execute('DELETE FROM directories WHERE path=? OR (path >= ? AND path < ?)', (directory, low, high))
+        return keys
+
+    def _regroup(self, con, new_files, affected_keys):
+        affected_keys.discard(None)
+        if not new_files and not affected_keys:
+            return
+        new_files = set(new_files)
+        packs = group_files([pathlib.Path(path) for path in sorted(new_files)])
+        # New files can belong to packages that already have files in the index
+        affected_keys.update(pack.key for pack in packs)
+        files = set(new_files)
+        for key in affected_keys:
+            files.update(path for path, in con.execute('SELECT path FROM files WHERE package_key=?', (key,)))
+        if files != new_files:
+            packs = group_files([pathlib.Path(path) for path in sorted(files)])
+        logger.info(f'Regrouping {len(packs)} packages in package index')
+        for pack in packs:
+            affected_keys.discard(pack.key)
+            con.execute('INSERT OR REPLACE INTO packages VALUES (?, ?)', (pack.key, pickle.dumps(pack)))
+            con.executemany('UPDATE files SET package_key=? WHERE path=?',
+                            [(pack.key, str(path)) for path in pack.files])
+        for key in affected_keys:
+            con.execute('DELETE FROM packages WHERE key=?', (key,))
+
+    def _load_packages(self, con, directory, recursive):
+        if recursive:
+            low, high = self._prefix_range(directory)
+            rows = con.execute('SELECT DISTINCT package_key FROM files WHERE directory=? OR '
+                               '(path >= ? AND path < ?)', (directory, low, high))
+        else:
+            rows = con.execute('SELECT DISTINCT package_key FROM files WHERE directory=?', (directory,))
+        packs = []
+        broken_keys = set()
+        for key, in rows.fetchall():
+            if key is None:
+                continue
+            row = con.execute('SELECT data FROM packages WHERE key=?', (key,)).fetchone()
+            try:
+                packs.append(pickle.loads(row[0]))
+            except Exception:
+                broken_keys.add(key)
+        if broken_keys:
+            # Packages that can not be loaded (e.g. stored by another version of file_explorer) are regrouped
+            logger.warning(f'Regrouping {len(broken_keys)} packages that could not be loaded from package index')
+            self._regroup(con, [], set(broken_keys))
+            for key in broken_keys:
+                row = con.execute('SELECT data FROM packages WHERE key=?', (key,)).fetchone()
+                if row:
+                    packs.append(pickle.loads(row[0]))
+        return self._restrict_to_directory(packs, directory, recursive)
+
+    @staticmethod
+    def _restrict_to_directory(packs, directory, recursive):
+        """
+        Packages are stored per key with the files from every directory that has been scanned (e.g.
+        several root directories). Returns the packages with only the files in directory.
+        """
+        prefix = directory.rstrip(os.sep) + os.sep
+        result = []
+        files = []
+        for pack in packs:
+            if recursive:
+                pack_files = [path for path in pack.files if str(path).startswith(prefix)]
+            else:
+                pack_files = [path for path in pack.files if os.path.dirname(str(path)) == directory]
+            if len(pack_files) == len(pack.files):
+                result.append(pack)
+            else:
+                files.extend(pack_files)
+        if files:
+            result.extend(group_files(files))
+        return result
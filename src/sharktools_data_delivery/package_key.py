@@ -0,0 +1,18 @@
+import collections
+
+PackageKey = collections.namedtuple('PackageKey', ['key', 'instrument', 'instrument_serial', 'year', 'date', 'time',
+                                                   'ship', 'cruise', 'serno'])
+
+
+def parse_package_key(key):
+    """
+    Splits a package key on the form <instrument>_<serial>_<yyyymmdd>_<hhmm>_<ship>_<cruise>_<serno>,
+    e.g. SBE09_1387_20230110_1204_77SE_00_0123. Parts that can not be found are set to an empty string.
+    :return: PackageKey
+    """
+    parts = key.split('_')
+    if len(parts) < 7 or not (len(parts[-5]) == 8 and parts[-5].isdigit()):
+        return PackageKey(key, '', '', '', '', '', '', '', '')
+    instrument = '_'.join(parts[:-6])
+    instrument_serial, date, time, ship, cruise, serno = parts[-6:]
+    return PackageKey(key, instrument, instrument_serial, date[:4], date, time, ship.upper(), cruise, serno)
@@ -0,0 +1,197 @@
+import errno
+import logging
+import os
+import shutil
+import sys
+import threading
+
+from .statistics import format_bytes
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows, where reflink is not supported
+    fcntl = None
+
+logger = logging.getLogger(__file__)
+
+AUTO = 'auto'
+HARDLINK = 'hardlink'
+REFLINK = 'reflink'
+COPY_FILE_RANGE = 'copy_file_range'
+SENDFILE = 'sendfile'
+BUFFERED = 'buffered'
+
+# In order of preference. The first strategy that works for a pair of file systems is used for the following files.
+STRATEGIES = [HARDLINK, REFLINK, COPY_FILE_RANGE, SENDFILE, BUFFERED]
+# Strategies where the target is a file of its own that can be changed without changing the source
+COPY_STRATEGIES = [REFLINK, COPY_FILE_RANGE, SENDFILE, BUFFERED]
+# Strategies for AUTO placement of delivered files, that do not copy any data. Hardlink is left out since the
+# target shares its data with the source, so it is only used when chosen explicitly.
+LINK_STRATEGIES = [REFLINK]
+
+BUFFER_SIZE = 1024 * 1024
+COPY_CHUNK_SIZE = 64 * 1024 * 1024
+TEMP_SUFFIX = '.place-tmp'
+FICLONE = 0x40049409  # ioctl from linux/fs.h
+
+# Errors meaning that the strategy is not supported between the file systems, rather than that the file can not be written
+_UNSUPPORTED_ERRORS = {errno.EXDEV, errno.EPERM, errno.EOPNOTSUPP, errno.ENOTSUP, errno.EINVAL, errno.ENOSYS,
+                       errno.ENOTTY, errno.EMLINK}
+
+
+class PlacementError(Exception):
+    pass
+
+
+def _hardlink(source, target):
+    os.link(source, target)
+
+
+def _reflink(source, target):
+    if fcntl is None or not sys.platform.startswith('linux'):
+        raise OSError(errno.ENOTSUP, 'reflink is not supported on this platform')
+    with open(source, 'rb') as src, open(target, 'wb') as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+
+
+def _copy_file_range(source, target):
+    if not hasattr(os, 'copy_file_range'):
+        raise OSError(errno.ENOSYS, 'copy_file_range is not available')
+    with open(source, 'rb') as src, open(target, 'wb') as dst:
+        while os.copy_file_range(src.fileno(), dst.fileno(), COPY_CHUNK_SIZE):
+            pass
+
+
+def _sendfile(source, target):
+    if not hasattr(os, 'sendfile') or not sys.platform.startswith('linux'):
+        # Only Linux can sendfile to a regular file
+        raise OSError(errno.ENOSYS, 'sendfile to a file is not available')
+    with open(source, 'rb') as src, open(target, 'wb') as dst:
+        offset = 0
+        while True:
+            nr_bytes = os.sendfile(dst.fileno(), src.fileno(), offset, COPY_CHUNK_SIZE)
+            if not nr_bytes:
+                break
+            offset += nr_bytes
+
+
+def _buffered(source, target):
+    with open(source, 'rb') as src, open(target, 'wb') as dst:
+        shutil.copyfileobj(src, dst, BUFFER_SIZE)
+
+
+_FUNCTIONS = {HARDLINK: _hardlink,
+              REFLINK: _reflink,
+              COPY_FILE_RANGE: _copy_file_range,
+              SENDFILE: _sendfile,
+              BUFFERED: _buffered}
+
+
+def get_strategies(strategy=AUTO, default=STRATEGIES, fallback=(BUFFERED,)):
+    """
+    Returns the strategies to try for a configured strategy: default for AUTO, otherwise
+    the strategy followed by fallback.
+    """
+    if strategy == AUTO:
+        return list(default)
+    if strategy not in _FUNCTIONS:
+        raise ValueError(f'Unknown placement strategy: {strategy}')
+    return [strategy] + [s for s in fallback if s != strategy]
+
+
+class PlacementReport:
+    """Number of files and bytes placed with each strategy"""
+
+    def __init__(self):
+        self.files = {}
+        self._lock = threading.Lock()
+
+    def add(self, strategy, nr_bytes):
+        with self._lock:
+            nr, total = self.files.get(strategy, (0, 0))
+            self.files[strategy] = (nr + 1, total + nr_bytes)
+
+    def summary(self):
+        if not self.files:
+            return 'Inga filer placerade'
+        return ', '.join(f'{nr} filer med {strategy} ({format_bytes(nr_bytes)})'
+                         for strategy, (nr, nr_bytes) in sorted(self.files.items()))
+
+
+class FilePlacer:
+    """
+    Places (copies or links) files with the first of strategies that works. The strategy that
+    works is remembered per pair of source and target file system (st_dev), so strategies that
+    are not supported are only tried once. Files are written to a temporary file that then
+    replaces the target. Copies keep the mtime of the source (as shutil.copy2).
+
+    Hardlinks share the data with the source: writing to the target changes the source. Use
+    COPY_STRATEGIES where the target is changed later.
+    """
+
+    def __init__(self, strategies=STRATEGIES, temp_suffix=TEMP_SUFFIX):
+        self.strategies = list(strategies)
+        self.temp_suffix = temp_suffix
+        for strategy in self.strategies:
+            if strategy not in _FUNCTIONS:
+                raise ValueError(f'Unknown placement strategy: {strategy}')
+        self.report = PlacementReport()
+        self._strategies_by_devices = {}
+        self._unsupported_devices = set()
+        self._lock = threading.Lock()
+
+    def get_strategy(self, source, target_directory):
+        """Returns the strategy used for the file systems of source and target_directory, or None if not known yet"""
+        strategies = self._strategies_by_devices.get(self._get_devices(source, target_directory))
+        return strategies[0] if strategies else None
+
+    def is_supported(self, source, target_directory):
+        """False if none of the strategies has worked between the file systems of source and target_directory"""
+        return self._get_devices(source, target_directory) not in self._unsupported_devices
+
+    @staticmethod
+    def _get_devices(source, target_directory):
+        return os.stat(source).st_dev, os.stat(target_directory).st_dev
+
+    def place(self, source, target):
+        """
+        Places source at target.
+        :return: the strategy used
+        """
+        source = str(source)
+        target = str(target)
+        target_directory = os.path.dirname(os.path.abspath(target))
+        devices = self._get_devices(source, target_directory)
+        with self._lock:
+            strategies = self._strategies_by_devices.setdefault(devices, list(self.strategies))
+            candidates = list(strategies)
+        temp_path = target + self.temp_suffix
+        for strategy in candidates:
+            try:
+                _FUNCTIONS[strategy](source, temp_path)
+                if strategy != HARDLINK:
+                    shutil.copystat(source, temp_path)
+                os.replace(temp_path, target)
+            except OSError as e:
+                self._remove(temp_path)
+                if e.errno not in _UNSUPPORTED_ERRORS:
+                    raise
+                logger.debug(f'{strategy} not supported from {source} to {target_directory}: {e}')
+                with self._lock:
+                    if strategy in strategies and len(strategies) > 1:
+                        strategies.remove(strategy)
+                continue
+            self.report.add(strategy, os.stat(target).st_size)
+            return strategy
+        with self._lock:
+            self._unsupported_devices.add(devices)
+        raise PlacementError(f'No placement strategy of {", ".join(self.strategies)} works '
+                             f'from {source} to {target_directory}')
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -1,49 +1,181 @@
-
-import yaml
-from yaml.loader import SafeLoader
+import atexit
+import logging
+import os
 import pathlib
 import json
+import threading
+import time
 
+logger = logging.getLogger(__file__)
 
-class Saves:
+SAVES_FILE_PATH = pathlib.Path(pathlib.Path(__file__).parent, 'saves.json')
+SAVE_DELAY = 1.0  # seconds
+LOCK_TIMEOUT = 10  # seconds
+STALE_LOCK_AGE = 60  # seconds
 
-    def __init__(self):
-        self.file_path = pathlib.Path(pathlib.Path(__file__).parent, 'saves.json')
 
-        self.data = {}
+class FileLock:
+    """
+    Lock between processes using a lock file that is created exclusively.
+    A lock file older than stale_after seconds is considered left behind by a crashed process and is removed.
+    """
 
-        self._load()
+    def __init__(self, file_path, timeout=LOCK_TIMEOUT, stale_after=STALE_LOCK_AGE):
+        self.file_path = pathlib.Path(file_path)
+        self.timeout = timeout
+        self.stale_after = stale_after
 
-    def _load(self):
-        """
-        Loads dict from json
-        :return:
-        """
-        if self.file_path.exists():
+    def acquire(self):
+        t0 = time.time()
+        while True:
+            try:
+                fd = os.open(self.file_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                os.write(fd, str(os.getpid()).encode())
+                os.close(fd)
+                return
+            except FileExistsError:
+                self._remove_if_stale()
+            if time.time() - t0 > self.timeout:
+                raise TimeoutError(f'Could not lock {self.file_path}')
+            time.sleep(0.05)
+
+    def _remove_if_stale(self):
+        try:
+            if time.time() - os.stat(self.file_path).st_mtime > self.stale_after:
+                logger.warning(f'Removing stale lock file {self.file_path}')
+                os.remove(self.file_path)
+        except FileNotFoundError:
+            pass
+
+    def release(self):
+        try:
+            os.remove(self.file_path)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+
+class SettingsStore:
+    """
+    Settings shared by everything in the process. The json file is read on first use.
+    Changes are written after SAVE_DELAY seconds so that several updates result in one write.
+    When writing, the file is locked and read again so that keys changed by other
+    SHARKtools instances are kept. The file is replaced atomically.
+    """
+
+    def __init__(self, file_path=SAVES_FILE_PATH, save_delay=SAVE_DELAY):
+        self.file_path = pathlib.Path(file_path)
+        self.save_delay = save_delay
+        self._data = None
+        self._dirty = set()
+        self._timer = None
+        self._lock = threading.RLock()
+        self._file_lock = FileLock(self.file_path.with_name(self.file_path.name + '.lock'))
+
+    def _read_file(self):
+        if not self.file_path.exists():
+            return {}
+        try:
             with open(self.file_path) as fid:
-                self.data = json.load(fid)
+                return json.load(fid)
+        except ValueError:
+            logger.error(f'Could not read settings file {self.file_path}')
+            return {}
+
+    @property
+    def data(self):
+        with self._lock:
+            if self._data is None:
+                self._data = self._read_file()
+            return self._data
 
-    def _save(self):
-        """
-        Writes information to json file.
-        :return:
-        """
-        with open(self.file_path, 'w') as fid:
-            json.dump(self.data, fid, indent=4, sort_keys=True)
+    def get(self, key, default=''):
+        return self.data.get(key, default)
 
     def set(self, key, value):
-        self.data[key] = value
-        self._save()
+        with self._lock:
+            self.data[key] = value
+            self._dirty.add(key)
+            self._schedule_save()
+
+    def _schedule_save(self):
+        if self._timer is not None:
+            return
+        self._timer = threading.Timer(self.save_delay, self.flush)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def flush(self):
+        """Writes pending changes to file"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._dirty:
+                return
+            try:
+                with self._file_lock:
+                    data = self._read_file()
+                    data.update({key: self._data[key] for key in self._dirty})
+                    temp_path = self.file_path.with_name(self.file_path.name + f'.{os.getpid()}.tmp')
+                    with open(temp_path, 'w') as fid:
+                        json.dump(data, fid, indent=4, sort_keys=True)
+                    os.replace(temp_path, self.file_path)
+            except (OSError, TimeoutError) as e:
+                logger.error(f'Could not save settings to {self.file_path}: {e}')
+                return
+            self._data = data
+            self._dirty = set()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Returns the settings store shared by the process"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = SettingsStore()
+            atexit.register(_store.flush)
+        return _store
+
+
+class Saves:
+
+    def __init__(self):
+        self._store = get_store()
+        self.file_path = self._store.file_path
+
+    @property
+    def data(self):
+        return self._store.data
+
+    def set(self, key, value):
+        self._store.set(key, value)
 
     def get(self, key, default=''):
-        return self.data.get(key, default)
+        return self._store.get(key, default)
+
+    def flush(self):
+        self._store.flush()
 
 
 class SaveSelection:
-    _saves = Saves()
     _saves_id_key = ''
     _selections_to_store = []
 
+    @property
+    def _saves(self):
+        return get_store()
+
     def save_selection(self):
         data = {}
         if type(self._selections_to_store) == dict:
@@ -86,7 +218,7 @@ class SaveSelection:
 class SaveComponents:
 
     def __init__(self, key):
-        self._saves = Saves()
+        self._saves = get_store()
         self._saves_id_key = key
         self._components_to_store = set()
 
@@ -116,4 +248,3 @@ class SaveComponents:
                 comp.set(item)
             except:
                 pass
-
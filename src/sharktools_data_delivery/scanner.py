@@ -0,0 +1,279 @@
+import collections
+import logging
+import os
+import pathlib
+import queue
+import threading
+import traceback
+
+from .inventory import PackageInventory
+from .tracing import tracer
+from .worker import WorkerThread
+
+logger = logging.getLogger(__file__)
+
+EXCLUDE_DIRECTORY = 'temp'
+RESULT_WAIT = 0.1  # seconds
+# Directories are split into their sub directories until there are at least this many chunks (or only leaves)
+MIN_SCAN_CHUNKS = 32
+
+
+class ScanError(Exception):
+    pass
+
+
+class ScanMessage:
+    """
+    Message put on the queue of a PackageScanner. kind is one of
+    'progress', 'done', 'cancelled' or 'error'. packages are PackageRecord objects
+    in the inventory of the scanner.
+    """
+    def __init__(self, kind, done=0, total=0, packages=None, error=None):
+        self.kind = kind
+        self.done = done
+        self.total = total
+        self.packages = packages or []
+        self.error = error
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.kind}, {self.done}/{self.total}, {len(self.packages)} packages)'
+
+
+def _get_sub_directories(directory, exclude_directory):
+    with os.scandir(directory) as it:
+        return [pathlib.Path(directory, name) for name in
+                sorted(entry.name for entry in it if entry.is_dir() and entry.name != exclude_directory)]
+
+
+def get_scan_chunks(root_directory, exclude_directory=EXCLUDE_DIRECTORY, min_chunks=MIN_SCAN_CHUNKS):
+    """
+    Splits the root directory into units of work. The files directly in a directory is one chunk
+    and every sub directory (including its sub directories) is one chunk. Sub directories are split
+    in the same way, breadth first, until there are at least min_chunks chunks or all the remaining
+    chunks are leaf directories. A root laid out as <year>/<data|cnv|raw> is thus split into one
+    chunk per year and sub directory.
+    :return: list of tuples (directory, recursive)
+    """
+    root_directory = pathlib.Path(root_directory)
+    chunks = [(root_directory, False)]
+    pending = collections.deque(_get_sub_directories(root_directory, exclude_directory))
+    leaves = []
+    while pending and len(chunks) + len(pending) + len(leaves) < min_chunks:
+        directory = pending.popleft()
+        sub_dirs = _get_sub_directories(directory, exclude_directory)
+        if not sub_dirs:
+            leaves.append(directory)
+            continue
+        chunks.append((directory, False))
+        pending.extend(sub_dirs)
+    chunks.extend((directory, True) for directory in sorted(leaves + list(pending)))
+    return chunks
+
+
+def list_files(directory, recursive=True, exclude_directory=EXCLUDE_DIRECTORY):
+    """
+    Lists all files in directory using os.scandir. Directories named exclude_directory are skipped.
+    :return: list of pathlib.Path
+    """
+    files = []
+    directories = [str(directory)]
+    while directories:
+        current = directories.pop()
+        with os.scandir(current) as it:
+            for entry in it:
+                if entry.is_dir():
+                    if recursive and entry.name != exclude_directory:
+                        directories.append(entry.path)
+                elif entry.is_file():
+                    files.append(pathlib.Path(entry.path))
+    return files
+
+
+def group_files(files):
+    """Groups the given files into packages"""
+    if not files:
+        return []
+    # Imported here since file_explorer is slow to import and only needed when scanning
+    import file_explorer
+    return file_explorer.get_packages_from_file_list(files, as_list=True)
+
+
+class PackageCollector:
+    """
+    Collects packages from several chunks. A package that has files in more than one chunk
+    is regrouped from the combined file list so that it is only represented once.
+    """
+
+    def __init__(self):
+        self.packages = {}
+
+    def add(self, packages):
+        """
+        Adds packages to the collection. All packages that have to be merged are regrouped in one go.
+        :return: list of packages that are new or have been replaced
+        """
+        changed = {}
+        merge_files = {}
+        for pack in packages:
+            existing = self.packages.get(pack.key)
+            if existing is None:
+                self.packages[pack.key] = pack
+                changed[pack.key] = pack
+                continue
+            files = merge_files.setdefault(pack.key, dict.fromkeys(existing.files))
+            files.update(dict.fromkeys(pack.files))
+        if merge_files:
+            files = [path for key_files in merge_files.values() for path in key_files]
+            for merged in group_files(files):
+                if merged.key in merge_files:
+                    self.packages[merged.key] = merged
+                    changed[merged.key] = merged
+        return list(changed.values())
+
+
+def iter_package_batches(root_directory, exclude_directory=EXCLUDE_DIRECTORY, cancel_event=None, index=None):
+    """
+    Generator that scans root_directory chunk by chunk. If a PackageIndex is given
+    only the parts of the directory tree that have changed are listed.
+    :return: yields tuples (nr_chunks_done, nr_chunks_total, new_or_replaced_packages)
+    """
+    chunks = get_scan_chunks(root_directory, exclude_directory=exclude_directory)
+    collector = PackageCollector()
+    total = len(chunks)
+    for nr, (directory, recursive) in enumerate(chunks, 1):
+        if cancel_event and cancel_event.is_set():
+            return
+        with tracer.span('scan_chunk', directory=str(directory)) as span:
+            if index is not None:
+                packages = index.get_packages(directory, recursive=recursive, exclude_directory=exclude_directory)
+            else:
+                packages = group_files(list_files(directory, recursive=recursive, exclude_directory=exclude_directory))
+            packages = collector.add(packages)
+            span.set(nr_packages=len(packages))
+        yield nr, total, packages
+
+
+def get_root_groups(root_directories):
+    """
+    Groups the root directories by device so that roots on the same disk (or share) are scanned
+    one after the other and different devices in parallel.
+    :return: list of lists of tuples (rank, root_directory). rank is the position in root_directories.
+    """
+    groups = {}
+    for rank, root in enumerate(root_directories):
+        try:
+            device = os.stat(root).st_dev
+        except OSError:
+            device = None
+        groups.setdefault(device, []).append((rank, pathlib.Path(root)))
+    return list(groups.values())
+
+
+def iter_package_batches_for_roots(root_directories, exclude_directory=EXCLUDE_DIRECTORY, cancel_event=None,
+                                   index=None):
+    """
+    As iter_package_batches but for several root directories. The roots are scanned concurrently
+    with one worker thread per device. If a package key is found in more than one root the
+    package from the root that comes first in root_directories is used, regardless of which
+    root was scanned first. A package may therefore be yielded again from a root with higher precedence.
+    :return: yields tuples (nr_chunks_done, nr_chunks_total, new_or_replaced_packages)
+    """
+    roots = list(dict.fromkeys(pathlib.Path(root) for root in root_directories))
+    if len(roots) == 1:
+        yield from iter_package_batches(roots[0], exclude_directory=exclude_directory, cancel_event=cancel_event,
+                                        index=index)
+        return
+
+    stop_event = threading.Event()
+    results = queue.Queue()
+
+    def scan_group(group):
+        try:
+            for rank, root in group:
+                for done, total, packages in iter_package_batches(root, exclude_directory=exclude_directory,
+                                                                  cancel_event=stop_event, index=index):
+                    results.put((rank, done, total, packages, None))
+        except Exception:
+            results.put((None, 0, 0, [], traceback.format_exc()))
+        finally:
+            results.put(None)
+
+    groups = get_root_groups(roots)
+    workers = [threading.Thread(target=scan_group, args=(group,), daemon=True) for group in groups]
+    for worker in workers:
+        worker.start()
+
+    progress = {rank: (0, 1) for rank in range(len(roots))}
+    rank_by_key = {}
+    nr_running = len(workers)
+    first_error = None
+    try:
+        while nr_running:
+            if cancel_event and cancel_event.is_set():
+                return
+            try:
+                item = results.get(timeout=RESULT_WAIT)
+            except queue.Empty:
+                continue
+            if item is None:
+                nr_running -= 1
+                continue
+            rank, done, total, packages, error = item
+            if error:
+                # Later items (of other roots) must not replace the error
+                if first_error is None:
+                    first_error = error
+                stop_event.set()
+                continue
+            progress[rank] = (done, total)
+            accepted = []
+            for pack in packages:
+                if rank <= rank_by_key.get(pack.key, rank):
+                    rank_by_key[pack.key] = rank
+                    accepted.append(pack)
+            yield sum(d for d, t in progress.values()), sum(t for d, t in progress.values()), accepted
+    finally:
+        stop_event.set()
+    if first_error:
+        raise ScanError(first_error)
+
+
+class PackageScanner(WorkerThread):
+    """
+    Scans one or more root directories for packages in a worker thread (several roots are scanned
+    concurrently, see iter_package_batches_for_roots). Discovered packages are converted
+    to compact records in inventory and put on self.queue as ScanMessage objects so that the
+    GUI can poll them with after(). The records are added to the inventory by the receiver.
+    """
+
+    def __init__(self, root_directory, exclude_directory=EXCLUDE_DIRECTORY, index=None, inventory=None):
+        WorkerThread.__init__(self)
+        if isinstance(root_directory, (list, tuple)):
+            self.root_directories = [pathlib.Path(root) for root in root_directory]
+        else:
+            self.root_directories = [pathlib.Path(root_directory)]
+        self.root_directory = self.root_directories[0]
+        self.exclude_directory = exclude_directory
+        self.index = index
+        self.inventory = inventory if inventory is not None else PackageInventory()
+
+    def run(self):
+        done = total = 0
+        try:
+            for done, total, packages in iter_package_batches_for_roots(self.root_directories,
+                                                                        exclude_directory=self.exclude_directory,
+                                                                        cancel_event=self._cancel_event,
+                                                                        index=self.index):
+                with tracer.span('inventory', nr_packages=len(packages)) as span:
+                    records = [self.inventory.make_record(pack) for pack in packages]
+                    span.set(nr_files=sum(len(record) for record in records),
+                             nr_bytes=sum(record.nr_bytes for record in records))
+                self.queue.put(ScanMessage('progress', done=done, total=total, packages=records))
+        except Exception:
+            logger.error(traceback.format_exc())
+            self.queue.put(ScanMessage('error', done=done, total=total, error=traceback.format_exc()))
+            return
+        if self.cancelled:
+            self.queue.put(ScanMessage('cancelled', done=done, total=total))
+        else:
+            self.queue.put(ScanMessage('done', done=done, total=total))
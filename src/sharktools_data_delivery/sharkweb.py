@@ -0,0 +1,197 @@
+import hashlib
+import logging
+import os
+import pathlib
+import pickle
+
+from .package_key import parse_package_key
+
+logger = logging.getLogger(__file__)
+
+CACHE_VERSION = 1
+DEFAULT_CACHE_DIRECTORY = pathlib.Path(pathlib.Path(__file__).parent, 'cache')
+
+# Possible column names for the parts of the visit key in a SHARKweb row format extract
+COLUMN_ALTERNATIVES = dict(
+    ship=['platform_code', 'Platform code', 'Provtagningsplattform', 'SHIPC'],
+    station=['station_name', 'Stationsnamn', 'STATN'],
+    date=['sample_date', 'visit_date', 'Provtagningsdatum', 'SDATE'],
+    visit=['visit_id', 'Besöks-ID', 'SERNO'],
+)
+
+
+class SharkwebFormatError(Exception):
+    pass
+
+
+def _normalize(role, value):
+    value = value.strip().strip('"')
+    if role == 'date':
+        return value.replace('-', '')[:8]
+    if role == 'ship':
+        return value.upper()
+    return value
+
+
+class SharkwebIndex:
+    """
+    Index of the visits in a SHARKweb extract in row format (tab separated, one row per value).
+    The file is read line by line and only the visit keys (ship, station, date, visit) are kept
+    together with the byte ranges of their rows, so memory does not grow with the size of the file.
+    The index is cached on disk and reused as long as the size and mtime of the file are unchanged.
+    """
+
+    def __init__(self, file_path, cache_directory=DEFAULT_CACHE_DIRECTORY, delimiter='\t', encoding='cp1252'):
+        self.file_path = pathlib.Path(file_path)
+        self.cache_directory = pathlib.Path(cache_directory) if cache_directory else None
+        self.delimiter = delimiter
+        self.encoding = encoding
+        self.header = []
+        self.columns = {}
+        self._ranges = {}
+        self._keys_by_ship_and_date = None
+        self._load()
+
+    def __len__(self):
+        return len(self._ranges)
+
+    def __contains__(self, key):
+        return key in self._ranges
+
+    def keys(self):
+        return self._ranges.keys()
+
+    @property
+    def _cache_path(self):
+        name = hashlib.sha1(str(self.file_path.absolute()).encode()).hexdigest()
+        return pathlib.Path(self.cache_directory, f'sharkweb_{name}.pickle')
+
+    def _get_file_signature(self):
+        stat = os.stat(self.file_path)
+        return stat.st_size, stat.st_mtime_ns
+
+    def _load(self):
+        signature = self._get_file_signature()
+        if self._load_cache(signature):
+            return
+        self._build()
+        self._save_cache(signature)
+
+    def _load_cache(self, signature):
+        if not self.cache_directory or not self._cache_path.exists():
+            return False
+        try:
+            with open(self._cache_path, 'rb') as fid:
+                data = pickle.load(fid)
+        except Exception:
+            logger.warning(f'Could not read SHARKweb index cache {self._cache_path}')
+            return False
+        if data.get('version') != CACHE_VERSION or data.get('signature') != signature:
+            return False
+        self.header = data['header']
+        self.columns = data['columns']
+        self._ranges = data['ranges']
+        return True
+
+    def _save_cache(self, signature):
+        if not self.cache_directory:
+            return
+        # The index is built, so it is used also if the cache can not be written
+        temp_path = self._cache_path.with_suffix('.tmp')
+        try:
+            self.cache_directory.mkdir(parents=True, exist_ok=True)
+            with open(temp_path, 'wb') as fid:
+                pickle.dump(dict(version=CACHE_VERSION,
+                                 signature=signature,
+                                 header=self.header,
+                                 columns=self.columns,
+                                 ranges=self._ranges), fid, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, self._cache_path)
+        except OSError as e:
+            logger.warning(f'Could not write SHARKweb index cache {self._cache_path}: {e}')
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
+    def _decode(self, line):
+        try:
+            return line.decode('utf-8')
+        except UnicodeDecodeError:
+            return line.decode(self.encoding, errors='replace')
+
+    def _set_columns(self, header_line):
+        self.header = [col.strip().strip('"') for col in self._decode(header_line).rstrip('\r\n').split(self.delimiter)]
+        self.columns = {}
+        for role, alternatives in COLUMN_ALTERNATIVES.items():
+            for col in alternatives:
+                if col in self.header:
+                    self.columns[role] = col
+                    break
+        for role in ['ship', 'date']:
+            if role not in self.columns:
+                raise SharkwebFormatError(f'Hittar ingen kolumn för {role} i {self.file_path}')
+
+    def _build(self):
+        logger.info(f'Indexing SHARKweb file {self.file_path}')
+        ranges = {}
+        with open(self.file_path, 'rb') as fid:
+            header_line = fid.readline()
+            self._set_columns(header_line)
+            col_index = [(role, self.header.index(col)) for role, col in self.columns.items()]
+            roles = ['ship', 'station', 'date', 'visit']
+            delimiter = self.delimiter.encode()
+            offset = len(header_line)
+            for line in fid:
+                start = offset
+                offset += len(line)
+                split_line = line.rstrip(b'\r\n').split(delimiter)
+                if len(split_line) < len(self.header):
+                    continue
+                values = {role: _normalize(role, self._decode(split_line[i])) for role, i in col_index}
+                key = tuple(values.get(role, '') for role in roles)
+                key_ranges = ranges.get(key)
+                if key_ranges and key_ranges[-1][1] == start:
+                    # Rows for the same visit that follow each other are stored as one range
+                    key_ranges[-1] = (key_ranges[-1][0], offset)
+                elif key_ranges:
+                    key_ranges.append((start, offset))
+                else:
+                    ranges[key] = [(start, offset)]
+        self._ranges = ranges
+        logger.info(f'{len(ranges)} visits found in SHARKweb file {self.file_path}')
+
+    def _get_keys_by_ship_and_date(self):
+        if self._keys_by_ship_and_date is None:
+            self._keys_by_ship_and_date = {}
+            for key in self._ranges:
+                ship, station, date, visit = key
+                self._keys_by_ship_and_date.setdefault((ship, date), []).append(key)
+        return self._keys_by_ship_and_date
+
+    def find(self, ship, date, station=None, visit=None):
+        """
+        Returns the visit keys (ship, station, date, visit) that match the given values.
+        Date can be given as yyyymmdd or yyyy-mm-dd.
+        """
+        keys = self._get_keys_by_ship_and_date().get((_normalize('ship', ship), _normalize('date', date)), [])
+        if station is not None:
+            keys = [key for key in keys if key[1] == station.strip()]
+        if visit is not None:
+            keys = [key for key in keys if key[3] == visit.strip()]
+        return keys
+
+    def find_for_package(self, package_key):
+        """Returns the visit keys that match ship and date of the package"""
+        info = parse_package_key(package_key)
+        if not info.ship or not info.date:
+            return []
+        return self.find(info.ship, info.date)
+
+    def iter_rows(self, key):
+        """Reads the rows for the given visit key from the file. Yields dicts {column: value}"""
+        with open(self.file_path, 'rb') as fid:
+            for start, end in self._ranges.get(key, []):
+                fid.seek(start)
+                for line in fid.read(end - start).splitlines():
+                    yield dict(zip(self.header, self._decode(line).split(self.delimiter)))
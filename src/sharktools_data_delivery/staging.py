@@ -0,0 +1,123 @@
+import logging
+import os
+import pathlib
+import shutil
+
+logger = logging.getLogger(__file__)
+
+# Work directory of the DeliveryEngine in the output directory. Left out of checksums and placement.
+WORK_DIRECTORY_NAME = '.delivery'
+TEMP_SUFFIX = '.delivery-tmp'
+
+
+def list_files(directory):
+    """:return: sorted relative posix paths of the files under directory"""
+    directory = str(directory)
+    files = []
+    for root, _, names in os.walk(directory):
+        for name in names:
+            files.append(os.path.relpath(os.path.join(root, name), directory).replace(os.sep, '/'))
+    return sorted(files)
+
+
+def is_package_file(rel_path, pack):
+    """
+    True if the file belongs to the package: the name contains the package key or is the name of a
+    source file. Other files (delivery note, metadata) are delivery-level files shared by all packages.
+    """
+    name = rel_path.split('/')[-1]
+    if pack.key.lower() in name.lower():
+        return True
+    return name in {os.path.basename(path) for path in pack.files}
+
+
+def merge_lines(paths):
+    """
+    Merges text files line by line. Lines are kept in the order they are first found and lines that
+    are in several files (headers, common fields of the delivery note) are only kept once.
+    :return: the merged content as bytes
+    """
+    lines = {}
+    for path in paths:
+        with open(path, 'rb') as fid:
+            for line in fid.read().splitlines():
+                lines.setdefault(line, None)
+    return b''.join(line + b'\n' for line in lines)
+
+
+def write_atomic(path, content):
+    path = pathlib.Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = path.with_name(path.name + TEMP_SUFFIX)
+    with open(temp_path, 'wb') as fid:
+        fid.write(content)
+    os.replace(temp_path, path)
+
+
+class DeliveryStaging:
+    """
+    Staging directories of a delivery. ctd_processing creates the delivery of each package in a directory
+    of its own, so that packages can be delivered in parallel. The package files are then moved to the
+    output directory.
+
+    The delivery-level files of each package are kept in parts/<package key> in the work directory, so that
+    the delivery-level files of the output directory can be merged (see merge_lines) from all packages that
+    have been delivered to it, also those that are not delivered again in an incremental delivery.
+    """
+
+    def __init__(self, output_dir):
+        self.output_dir = pathlib.Path(output_dir)
+        self.directory = pathlib.Path(self.output_dir, WORK_DIRECTORY_NAME, 'staging')
+        self.parts_directory = pathlib.Path(self.output_dir, WORK_DIRECTORY_NAME, 'parts')
+
+    def get_package_directory(self, key):
+        return pathlib.Path(self.directory, key)
+
+    def split(self, pack):
+        """
+        Sorts the staged files of the package.
+        :return: tuple (package files, delivery-level files) as relative posix paths
+        """
+        package_files = []
+        delivery_files = []
+        for rel_path in list_files(self.get_package_directory(pack.key)):
+            if is_package_file(rel_path, pack):
+                package_files.append(rel_path)
+            else:
+                delivery_files.append(rel_path)
+        return package_files, delivery_files
+
+    def store_parts(self, pack, delivery_files):
+        """Moves the staged delivery-level files of the package to its parts, replacing the parts of an earlier delivery"""
+        parts_directory = pathlib.Path(self.parts_directory, pack.key)
+        shutil.rmtree(parts_directory, ignore_errors=True)
+        parts_directory.mkdir(parents=True)
+        package_directory = self.get_package_directory(pack.key)
+        for rel_path in delivery_files:
+            target = pathlib.Path(parts_directory, rel_path)
+            target.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(pathlib.Path(package_directory, rel_path), target)
+
+    def has_parts(self, key):
+        return pathlib.Path(self.parts_directory, key).is_dir()
+
+    def get_parts(self):
+        """:return: dict {relative posix path: [paths of the parts of all packages, sorted by package key]}"""
+        paths_by_rel_path = {}
+        if not self.parts_directory.is_dir():
+            return paths_by_rel_path
+        for key in sorted(os.listdir(self.parts_directory)):
+            parts_directory = pathlib.Path(self.parts_directory, key)
+            for rel_path in list_files(parts_directory):
+                paths_by_rel_path.setdefault(rel_path, []).append(pathlib.Path(parts_directory, rel_path))
+        return paths_by_rel_path
+
+    def clear(self, key=None):
+        """Removes the staging directory of the package, or of all packages if key is None"""
+        directory = self.get_package_directory(key) if key else self.directory
+        shutil.rmtree(directory, ignore_errors=True)
+        try:
+            # The work directory is only left in the output directory if it is used for something else
+            os.rmdir(self.directory.parent)
+        except OSError:
+            pass
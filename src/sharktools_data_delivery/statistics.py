@@ -0,0 +1,99 @@
+import collections
+import os
+
+# Suffixes in the order they are presented. Other suffixes are added in alphabetical order after these.
+SUFFIX_ORDER = ['.txt', '.cnv', '.hex', '.hdr', '.ros', '.bl', '.btl', '.xml', '.xmlcon', '.con', '.zip', '.jpg',
+                '.png', '.deliverynote', '.metadata', '.sensorinfo']
+
+
+def get_package_statistics(pack):
+    """
+    Counts files and bytes per suffix in the package.
+    :return: dict {suffix: (nr_files, nr_bytes)}
+    """
+    stat = {}
+    for path in pack.files:
+        try:
+            size = os.stat(path).st_size
+        except OSError:
+            size = 0
+        nr, nr_bytes = stat.get(path.suffix, (0, 0))
+        stat[path.suffix] = (nr + 1, nr_bytes + size)
+    return stat
+
+
+def sort_suffixes(suffixes):
+    order = {suffix: i for i, suffix in enumerate(SUFFIX_ORDER)}
+    return sorted(suffixes, key=lambda suffix: (order.get(suffix, len(order)), suffix))
+
+
+def format_bytes(nr_bytes):
+    for unit in ['B', 'kB', 'MB', 'GB']:
+        if nr_bytes < 1024 or unit == 'GB':
+            break
+        nr_bytes /= 1024
+    if unit == 'B':
+        return f'{nr_bytes} {unit}'
+    return f'{nr_bytes:.1f} {unit}'
+
+
+class SuffixStatistics:
+    """
+    Number of files and bytes per suffix for a set of packages. Packages are added and removed
+    one by one so that the totals are updated without recounting all packages.
+    """
+
+    def __init__(self):
+        self._packages = {}
+        self.nr_files = collections.Counter()
+        self.nr_bytes = collections.Counter()
+
+    def __contains__(self, key):
+        return key in self._packages
+
+    def __len__(self):
+        return len(self._packages)
+
+    def add(self, key, package_statistics):
+        if key in self._packages:
+            self.remove(key)
+        self._packages[key] = package_statistics
+        for suffix, (nr, nr_bytes) in package_statistics.items():
+            self.nr_files[suffix] += nr
+            self.nr_bytes[suffix] += nr_bytes
+
+    def remove(self, key):
+        package_statistics = self._packages.pop(key, None)
+        if not package_statistics:
+            return
+        for suffix, (nr, nr_bytes) in package_statistics.items():
+            self.nr_files[suffix] -= nr
+            self.nr_bytes[suffix] -= nr_bytes
+
+    def clear(self):
+        self._packages = {}
+        self.nr_files = collections.Counter()
+        self.nr_bytes = collections.Counter()
+
+    @property
+    def suffixes(self):
+        return sort_suffixes(suffix for suffix, nr in self.nr_files.items() if nr)
+
+    @property
+    def total_nr_files(self):
+        return sum(self.nr_files.values())
+
+    @property
+    def total_nr_bytes(self):
+        return sum(self.nr_bytes.values())
+
+
+def get_statistics_for_packs(packs):
+    """
+    Returns statistics for all the given packages.
+    :return: SuffixStatistics
+    """
+    stat = SuffixStatistics()
+    for pack in packs:
+        stat.add(pack.key, get_package_statistics(pack))
+    return stat
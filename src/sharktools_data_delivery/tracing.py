@@ -0,0 +1,145 @@
+import collections
+import contextlib
+import functools
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__file__)
+
+MAX_SPANS = 100000
+
+
+class Span:
+    """
+    A timed operation. Counts such as the number of packages or bytes are added with set()
+    and are shown as args in the trace.
+    """
+    __slots__ = ('name', 'category', 'start', 'end', 'thread_id', 'args', '_tracer')
+
+    def __init__(self, tracer, name, category, args):
+        self._tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+        self.thread_id = threading.get_ident()
+        self.end = None
+        self.start = time.perf_counter()
+
+    def set(self, **kwargs):
+        self.args.update(kwargs)
+
+    @property
+    def duration(self):
+        if self.end is None:
+            return None
+        return self.end - self.start
+
+    def finish(self, **kwargs):
+        if self.end is not None:
+            return
+        self.end = time.perf_counter()
+        self.args.update(kwargs)
+        self._tracer._add(self)
+
+
+class _NoSpan:
+    """Used when tracing is turned off"""
+
+    def set(self, **kwargs):
+        pass
+
+    def finish(self, **kwargs):
+        pass
+
+
+NO_SPAN = _NoSpan()
+
+
+class Tracer:
+    """
+    Keeps the latest MAX_SPANS finished spans. Spans are started with span() as a context manager,
+    or with begin() and Span.finish() for operations that end in another callback (e.g. a scan that
+    is polled with after()). The spans can be exported as a Chrome trace (chrome://tracing, Perfetto).
+    """
+
+    def __init__(self, enabled=True, max_spans=MAX_SPANS):
+        self.enabled = enabled
+        self._spans = collections.deque(maxlen=max_spans)
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+
+    def begin(self, name, category='ctd', **args):
+        if not self.enabled:
+            return NO_SPAN
+        return Span(self, name, category, args)
+
+    @contextlib.contextmanager
+    def span(self, name, category='ctd', **args):
+        span = self.begin(name, category, **args)
+        try:
+            yield span
+        finally:
+            span.finish()
+
+    def _add(self, span):
+        with self._lock:
+            self._spans.append(span)
+        logger.debug(f'{span.name}: {span.duration * 1000:.1f} ms {span.args}')
+
+    def clear(self):
+        with self._lock:
+            self._spans.clear()
+
+    def get_spans(self):
+        with self._lock:
+            return list(self._spans)
+
+    def get_summary(self):
+        """Returns {name: dict(count, total, max)} with times in seconds"""
+        summary = {}
+        for span in self.get_spans():
+            item = summary.setdefault(span.name, dict(count=0, total=0., max=0.))
+            item['count'] += 1
+            item['total'] += span.duration
+            item['max'] = max(item['max'], span.duration)
+        return summary
+
+    def get_chrome_trace(self):
+        pid = os.getpid()
+        events = []
+        for span in self.get_spans():
+            events.append(dict(name=span.name,
+                               cat=span.category,
+                               ph='X',
+                               ts=(span.start - self._origin) * 1e6,
+                               dur=span.duration * 1e6,
+                               pid=pid,
+                               tid=span.thread_id,
+                               args=span.args))
+        return dict(traceEvents=events, displayTimeUnit='ms')
+
+    def export_chrome_trace(self, file_path):
+        """Writes the spans as a Chrome trace json file"""
+        trace = self.get_chrome_trace()
+        with open(file_path, 'w') as fid:
+            json.dump(trace, fid, default=str)
+        logger.info(f'{len(trace["traceEvents"])} spans written to {file_path}')
+
+
+tracer = Tracer()
+
+
+def traced(name=None, category='ctd'):
+    """Decorator that records a span for each call of the function"""
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with tracer.span(span_name, category):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -1,55 +1,12 @@
-import pathlib
+import functools
 import os
-import traceback
+
+from . import listing
 
 
 def get_files_in_directory(directory, suffix=None):
-    files = []
-    directory = pathlib.Path(directory)
-    if not directory.exists():
-        return []
-    for path in directory.iterdir():
-        if not path.is_file():
-            continue
-        if suffix and suffix != path.suffix:
-            continue
-        files.append(path.name)
-    get_files_in_directory.counter.setdefault(directory, 0)
-    get_files_in_directory.counter[directory] += 1
-    print()
-    print()
-    print('='*50)
-    stack = []
-    for line in traceback.format_stack():
-        text = line.strip().replace('\n', ' ')
-        if 'page_start' not in text:
-            continue
-        split_text = text.split(',')
-        line = split_text[1].split()[-1]
-        fn = split_text[2].split()[1]
-        stack.append(fn)
-    stack.append(directory.name)
-    get_files_in_directory.counter.setdefault('stack', [])
-    get_files_in_directory.counter['stack'].append(' -> '.join(stack))
-    print('='*50)
-    print('get_files_in_directory')
-    print('='*50)
-    for key, value in get_files_in_directory.counter.items():
-        if key == 'stack':
-            print('STACK')
-            for val in value:
-                print(f'    {val}')
-        else:
-            print(f'{key=}, {value=}')
-    print('-'*50)
-    print()
-    print()
-    print()
-
-    return files
-
-
-get_files_in_directory.counter = {}
+    """Returns the names of the files in directory. See listing.DirectoryListing"""
+    return listing.listing.get_files(directory, suffix=suffix)
 
 
 def open_path_in_default_program(path):
@@ -79,18 +36,22 @@ class ColorsList(list):
         return sorted(new_color_list)
 
     def get_base_colors(self):
+        import matplotlib.colors as mcolors
         return self._filter_color_list(mcolors.BASE_COLORS)
 
     def get_tableau_colors(self):
+        import matplotlib.colors as mcolors
         return self._filter_color_list(mcolors.TABLEAU_COLORS)
 
     def get_css4_colors(self):
+        import matplotlib.colors as mcolors
         return self._filter_color_list(mcolors.CSS4_COLORS)
 
 
 class MarkerList(list):
     def __init__(self):
         list.__init__(self)
+        import matplotlib.markers as markers
         temp_list = markers.MarkerStyle.markers.keys()
         self.marker_to_description = {}
         self.description_to_marker = {}
@@ -107,4 +68,16 @@ class MarkerList(list):
         return self.marker_to_description.get(marker, marker)
 
     def get_marker(self, description):
-        return self.description_to_marker.get(description, description)
\ No newline at end of file
+        return self.description_to_marker.get(description, description)
+
+
+@functools.lru_cache(maxsize=None)
+def get_colors_list():
+    """Returns a ColorsList that is shared by all callers. matplotlib is imported on the first call"""
+    return ColorsList()
+
+
+@functools.lru_cache(maxsize=None)
+def get_marker_list():
+    """Returns a MarkerList that is shared by all callers. matplotlib is imported on the first call"""
+    return MarkerList()
@@ -0,0 +1,84 @@
+import concurrent.futures
+import logging
+import os
+
+logger = logging.getLogger(__file__)
+
+REQUIRED_SUFFIXES = ['.sensorinfo', '.metadata', '.deliverynote', '.hex']
+STAT_WORKERS = 16
+MAX_ROWS_IN_MESSAGE = 15
+
+
+class ValidationReport:
+    """Result from validate_packages"""
+
+    def __init__(self, nr_packages=0, sharkweb_checked=False):
+        self.nr_packages = nr_packages
+        self.sharkweb_checked = sharkweb_checked
+        self.missing_suffixes = {}
+        self.missing_files = {}
+        self.missing_in_sharkweb = []
+
+    @property
+    def ok(self):
+        return not (self.missing_suffixes or self.missing_files or self.missing_in_sharkweb)
+
+    @property
+    def problem_keys(self):
+        return sorted(set(self.missing_suffixes) | set(self.missing_files) | set(self.missing_in_sharkweb))
+
+    @staticmethod
+    def _limit(lines, max_rows):
+        if len(lines) <= max_rows:
+            return lines
+        return lines[:max_rows] + [f'    ... och {len(lines) - max_rows} till']
+
+    def get_message(self, max_rows=MAX_ROWS_IN_MESSAGE):
+        if self.ok:
+            return ''
+        parts = [f'{len(self.problem_keys)} av {self.nr_packages} valda paket har brister.']
+        if self.missing_suffixes:
+            lines = [f'    {key}: {", ".join(suffixes)}' for key, suffixes in sorted(self.missing_suffixes.items())]
+            parts.append('Filer saknas i paketet:\n' + '\n'.join(self._limit(lines, max_rows)))
+        if self.missing_files:
+            lines = [f'    {key}: {", ".join(names)}' for key, names in sorted(self.missing_files.items())]
+            parts.append('Filer har tagits bort sedan sökningen:\n' + '\n'.join(self._limit(lines, max_rows)))
+        if self.missing_in_sharkweb:
+            lines = [f'    {key}' for key in sorted(self.missing_in_sharkweb)]
+            parts.append('Hittas inte i SHARKweb-uttaget:\n' + '\n'.join(self._limit(lines, max_rows)))
+        return '\n\n'.join(parts)
+
+
+def get_missing_suffixes(pack, required_suffixes=REQUIRED_SUFFIXES):
+    suffixes = {path.suffix for path in pack.files}
+    return [suffix for suffix in required_suffixes if suffix not in suffixes]
+
+
+def _get_missing_files(pack):
+    return [path.name for path in pack.files if not os.path.exists(path)]
+
+
+def validate_packages(packs, sharkweb_index=None, required_suffixes=REQUIRED_SUFFIXES, workers=STAT_WORKERS):
+    """
+    Checks the packages before delivery:
+        - all required companion files (required_suffixes) are present in the package
+        - the files in the package still exist on disk (checked in a thread pool)
+        - there is a visit with the same ship and date in the SHARKweb extract (dict lookup in the index)
+    :return: ValidationReport
+    """
+    packs = list(packs)
+    report = ValidationReport(nr_packages=len(packs), sharkweb_checked=sharkweb_index is not None)
+    for pack in packs:
+        missing = get_missing_suffixes(pack, required_suffixes)
+        if missing:
+            report.missing_suffixes[pack.key] = missing
+        if sharkweb_index is not None and not sharkweb_index.find_for_package(pack.key):
+            report.missing_in_sharkweb.append(pack.key)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        for pack, missing_files in zip(packs, executor.map(_get_missing_files, packs)):
+            if missing_files:
+                report.missing_files[pack.key] = missing_files
+    if not report.ok:
+        logger.warning(f'Validation: {len(report.problem_keys)} of {report.nr_packages} packages have problems')
+    return report
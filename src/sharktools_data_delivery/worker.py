@@ -0,0 +1,31 @@
+import queue
+import threading
+
+
+class WorkerThread(threading.Thread):
+    """
+    Base class for work done in a daemon thread. Progress is put on self.queue so that the GUI can
+    poll it with get_messages() and after(). cancel() sets self._cancel_event, which run() in the
+    subclass checks (or passes on) to stop early.
+    """
+
+    def __init__(self):
+        threading.Thread.__init__(self, daemon=True)
+        self.queue = queue.Queue()
+        self._cancel_event = threading.Event()
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    def get_messages(self):
+        """Returns all messages currently on the queue without blocking"""
+        messages = []
+        while True:
+            try:
+                messages.append(self.queue.get_nowait())
+            except queue.Empty:
+                return messages
@@ -0,0 +1,51 @@
+import pathlib
+
+import pytest
+
+from sharktools_data_delivery import package_index
+from sharktools_data_delivery import scanner
+
+
+class FakePackage:
+    """Stands in for a file_explorer package: the files with the same key (name up to the first dot)"""
+
+    def __init__(self, key, files):
+        self.key = key
+        self.files = files
+
+    def __getitem__(self, item):
+        return [path for path in self.files if path.suffix == f'.{item}']
+
+    def __len__(self):
+        return len(self.files)
+
+    def get_file_path(self, suffix):
+        paths = self[suffix.lstrip('.')]
+        return paths[0] if paths else None
+
+
+def group_files(files):
+    packages = {}
+    for path in files:
+        path = pathlib.Path(path)
+        packages.setdefault(path.name.split('.')[0], []).append(path)
+    return [FakePackage(key, sorted(paths)) for key, paths in packages.items()]
+
+
+@pytest.fixture
+def fake_grouping(monkeypatch):
+    """Groups files by key without file_explorer"""
+    monkeypatch.setattr(scanner, 'group_files', group_files)
+    monkeypatch.setattr(package_index, 'group_files', group_files)
+    return group_files
+
+
+def make_files(root, rel_paths, content=b'data'):
+    """Creates the files (relative posix paths) under root and returns their paths"""
+    paths = []
+    for rel_path in rel_paths:
+        path = pathlib.Path(root, rel_path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(content if isinstance(content, bytes) else content(rel_path))
+        paths.append(path)
+    return paths
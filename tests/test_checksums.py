@@ -0,0 +1,80 @@
+import hashlib
+
+import pytest
+
+from sharktools_data_delivery import checksums
+from sharktools_data_delivery.checksums import CHECKSUMS_FILE_NAME
+from sharktools_data_delivery.checksums import ChecksumCache
+from sharktools_data_delivery.checksums import compute_checksums
+from sharktools_data_delivery.checksums import create_checksum_file
+from sharktools_data_delivery.checksums import sha256_file
+
+from .conftest import make_files
+
+
+def sha(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def test_sha256_file(tmp_path):
+    path, = make_files(tmp_path, ['a.txt'], content=b'x' * 1000)
+    assert sha256_file(path, buffer_size=64) == sha(b'x' * 1000)
+
+
+def test_checksum_file(tmp_path):
+    # The temp file of an interrupted run is excluded, other .tmp files are delivered files
+    make_files(tmp_path, ['a.txt', 'sub/b.txt', 'manifest.json', 'c.tmp', f'{CHECKSUMS_FILE_NAME}.tmp'])
+    report = create_checksum_file(tmp_path, exclude_names=['manifest.json'])
+    lines = (tmp_path / CHECKSUMS_FILE_NAME).read_text().splitlines()
+    assert lines == [f'{sha(b"data")}  a.txt', f'{sha(b"data")}  c.tmp', f'{sha(b"data")}  sub/b.txt']
+    assert (report.nr_hashed, report.nr_bytes_hashed) == (3, 12)
+
+
+def test_cache_is_used_until_the_file_changes(tmp_path):
+    paths = make_files(tmp_path / 'files', ['a.txt', 'b.txt'])
+    cache = ChecksumCache(tmp_path / 'cache.sqlite')
+    report = compute_checksums(paths, cache=cache)
+    assert (report.nr_cached, report.nr_hashed) == (0, 2)
+    report = compute_checksums(paths, cache=cache)
+    assert (report.nr_cached, report.nr_hashed) == (2, 0)
+    paths[0].write_bytes(b'changed content')
+    report = compute_checksums(paths, cache=cache)
+    assert (report.nr_cached, report.nr_hashed) == (1, 1)
+    assert report.checksums[str(paths[0])] == sha(b'changed content')
+
+
+def test_known_checksums_are_not_computed(tmp_path, monkeypatch):
+    paths = make_files(tmp_path, ['a.txt', 'b.txt'])
+    hashed = []
+    monkeypatch.setattr(checksums, 'sha256_file', lambda path: hashed.append(path) or sha(b'data'))
+    report = compute_checksums(paths, known={str(paths[0]): 'known', str(tmp_path / 'removed'): 'x'})
+    assert hashed == [str(paths[1])]
+    assert report.checksums == {str(paths[0]): 'known', str(paths[1]): sha(b'data')}
+    assert report.summary().startswith('2 filer: 1 beräknade vid placering')
+
+
+def test_unreadable_file_is_reported(tmp_path, monkeypatch):
+    paths = make_files(tmp_path, ['a.txt'])
+
+    def fail(path):
+        raise PermissionError(13, 'Permission denied', path)
+
+    monkeypatch.setattr(checksums, 'sha256_file', fail)
+    report = compute_checksums(paths)
+    assert list(report.errors) == [str(paths[0])]
+    assert report.checksums == {}
+
+
+def test_cache_queries_are_chunked(tmp_path, monkeypatch):
+    monkeypatch.setattr(checksums, '_QUERY_CHUNK_SIZE', 2)
+    paths = make_files(tmp_path / 'files', [f'{i}.txt' for i in range(5)])
+    cache = ChecksumCache(tmp_path / 'cache.sqlite')
+    compute_checksums(paths, cache=cache)
+    assert compute_checksums(paths, cache=cache).nr_cached == 5
+
+
+@pytest.mark.parametrize('workers', [1, 4])
+def test_workers(tmp_path, workers):
+    paths = make_files(tmp_path, [f'{i}.txt' for i in range(10)], content=lambda rel_path: rel_path.encode())
+    report = compute_checksums(paths, workers=workers)
+    assert report.checksums == {str(path): sha(path.name.encode()) for path in paths}
@@ -0,0 +1,213 @@
+import os
+import shutil
+import sys
+import threading
+import types
+
+import pytest
+
+from sharktools_data_delivery import checksums
+from sharktools_data_delivery.delivery import DeliveryEngine
+from sharktools_data_delivery.staging import WORK_DIRECTORY_NAME
+
+from .conftest import FakePackage
+from .conftest import make_files
+
+KEYS = ['SBE09_1387_20230110_1204_77SE_00_0123',
+        'SBE09_1387_20230111_1204_77SE_00_0124',
+        'SBE09_1387_20230112_1204_77SE_00_0125']
+NOTE_HEADER = 'DELIVERY NOTE'
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    """Replaces ctd_processing with a module that copies the files and writes a delivery note"""
+    calls = []
+
+    def create_dv_delivery_for_packages(packs, output_dir, overwrite=False, **metadata):
+        calls.append(([pack.key for pack in packs], overwrite))
+        note = os.path.join(output_dir, 'delivery_note.txt')
+        if not overwrite and os.path.exists(note):
+            raise FileExistsError(note)
+        with open(note, 'w') as fid:
+            fid.write('\n'.join([NOTE_HEADER] + [pack.key for pack in packs]))
+        for pack in packs:
+            for path in pack.files:
+                shutil.copy2(path, os.path.join(output_dir, path.name))
+
+    module = types.ModuleType('ctd_processing')
+    module.create_dv_delivery_for_packages = create_dv_delivery_for_packages
+    monkeypatch.setitem(sys.modules, 'ctd_processing', module)
+    return calls
+
+
+def make_packs(root):
+    return [FakePackage(key, make_files(root, [f'{key}.txt', f'{key}.hex'])) for key in KEYS]
+
+
+def read_note(output_dir):
+    return (output_dir / 'delivery_note.txt').read_text().splitlines()
+
+
+def test_packages_are_delivered_separately(tmp_path, calls):
+    output_dir = tmp_path / 'out'
+    output_dir.mkdir()
+    packs = make_packs(tmp_path / 'src')
+    errors = DeliveryEngine(output_dir, workers=2).deliver(packs)
+    assert errors == {}
+    assert sorted(calls) == [([key], True) for key in KEYS]
+    assert read_note(output_dir)[0] == NOTE_HEADER
+    assert sorted(read_note(output_dir)[1:]) == KEYS
+    assert (output_dir / f'{KEYS[0]}.hex').read_bytes() == b'data'
+    assert not (output_dir / WORK_DIRECTORY_NAME / 'staging').exists()
+
+
+def test_existing_package_files_are_not_overwritten(tmp_path, calls):
+    output_dir = tmp_path / 'out'
+    output_dir.mkdir()
+    packs = make_packs(tmp_path / 'src')
+    DeliveryEngine(output_dir).deliver(packs)
+    errors = DeliveryEngine(output_dir).deliver(packs)
+    assert set(errors) == set(KEYS)
+    assert all(error.startswith('Fil finns redan') for error in errors.values())
+    assert DeliveryEngine(output_dir, overwrite=True).deliver(packs) == {}
+
+
+def test_cancel_stops_between_packages(tmp_path, calls, monkeypatch):
+    output_dir = tmp_path / 'out'
+    output_dir.mkdir()
+    packs = make_packs(tmp_path / 'src')
+    started = threading.Event()
+    release = threading.Event()
+    create = sys.modules['ctd_processing'].create_dv_delivery_for_packages
+
+    def create_after_release(packs, output_dir, **kwargs):
+        if packs[0].key != KEYS[0]:
+            started.set()
+            release.wait(5)
+        create(packs, output_dir, **kwargs)
+
+    monkeypatch.setattr(sys.modules['ctd_processing'], 'create_dv_delivery_for_packages', create_after_release)
+    cancel_event = threading.Event()
+    results = DeliveryEngine(output_dir, workers=1).run(packs, cancel_event=cancel_event)
+    assert next(results) == (KEYS[0], None)
+    # The second package is being delivered when the delivery is cancelled
+    assert started.wait(5)
+    cancel_event.set()
+    release.set()
+    assert list(results) == []
+    assert [keys for keys, overwrite in calls] == [KEYS[:1], KEYS[1:2]]
+    assert read_note(output_dir) == [NOTE_HEADER, KEYS[0]]
+    assert not (output_dir / f'{KEYS[1]}.txt').exists()
+
+
+def test_incremental_delivers_changed_packages_only(tmp_path, calls):
+    output_dir = tmp_path / 'out'
+    output_dir.mkdir()
+    packs = make_packs(tmp_path / 'src')
+    assert DeliveryEngine(output_dir, incremental=True).deliver(packs[:2]) == {}
+    packs[1].files[0].write_bytes(b'changed')
+    calls.clear()
+    assert DeliveryEngine(output_dir, incremental=True).deliver(packs) == {}
+    assert DeliveryEngine(output_dir, incremental=True).deliver(packs) == {}
+    assert sorted(calls) == [([KEYS[1]], True), ([KEYS[2]], True)]
+    assert (output_dir / packs[1].files[0].name).read_bytes() == b'changed'
+    # The delivery note describes all packages, also the unchanged package that was not delivered again
+    assert read_note(output_dir)[0] == NOTE_HEADER
+    assert sorted(read_note(output_dir)[1:]) == KEYS
+
+
+def test_incremental_does_not_overwrite_files_of_new_packages(tmp_path, calls):
+    output_dir = tmp_path / 'out'
+    output_dir.mkdir()
+    packs = make_packs(tmp_path / 'src')
+    assert DeliveryEngine(output_dir, incremental=True).deliver(packs[:2]) == {}
+    packs[1].files[0].write_bytes(b'changed')
+    make_files(output_dir, [packs[2].files[0].name], content=b'not from a delivery')
+    errors = DeliveryEngine(output_dir, incremental=True).deliver(packs)
+    assert list(errors) == [KEYS[2]]
+    assert (output_dir / packs[2].files[0].name).read_bytes() == b'not from a delivery'
+    assert (output_dir / packs[1].files[0].name).read_bytes() == b'changed'
+    assert sorted(read_note(output_dir)[1:]) == KEYS[:2]
+
+
+def test_delivery_note_lists_packages_of_earlier_deliveries(tmp_path, calls):
+    output_dir = tmp_path / 'out'
+    output_dir.mkdir()
+    packs = make_packs(tmp_path / 'src')
+    DeliveryEngine(output_dir).deliver(packs[:1])
+    DeliveryEngine(output_dir).deliver(packs[1:])
+    assert read_note(output_dir) == [NOTE_HEADER] + KEYS
+
+
+def test_overwrite_does_not_write_through_links_to_source_files(tmp_path, calls):
+    output_dir = tmp_path / 'out'
+    output_dir.mkdir()
+    packs = make_packs(tmp_path / 'src')
+    source = packs[0].files[0]
+    target = output_dir / source.name
+    assert DeliveryEngine(output_dir, placement='hardlink').deliver(packs) == {}
+    assert os.path.samefile(source, target)
+    # Copy without placement over the hardlinks of the earlier delivery
+    assert DeliveryEngine(output_dir, overwrite=True).deliver(packs) == {}
+    assert not os.path.samefile(source, target)
+    target.write_bytes(b'changed in the delivery')
+    assert source.read_bytes() == b'data'
+
+
+def test_auto_placement_does_not_hardlink(tmp_path, calls):
+    output_dir = tmp_path / 'out'
+    output_dir.mkdir()
+    packs = make_packs(tmp_path / 'src')
+    engine = DeliveryEngine(output_dir, placement='auto')
+    assert engine.deliver(packs) == {}
+    assert not any(os.path.samefile(path, output_dir / path.name) for pack in packs for path in pack.files)
+    assert 'hardlink' not in engine.placer.report.files
+
+
+def test_work_directory_is_not_in_checksums(tmp_path, calls, monkeypatch):
+    monkeypatch.setattr(checksums, 'DEFAULT_CACHE_PATH', tmp_path / 'checksums.sqlite')
+    output_dir = tmp_path / 'out'
+    output_dir.mkdir()
+    make_files(output_dir / WORK_DIRECTORY_NAME, ['left_over.txt'])
+    engine = DeliveryEngine(output_dir, checksums=True)
+    engine.deliver(make_packs(tmp_path / 'src'))
+    names = [line.split('  ')[1] for line in (output_dir / 'checksums.sha256').read_text().splitlines()]
+    assert 'delivery_note.txt' in names
+    assert not any(name.startswith(WORK_DIRECTORY_NAME) for name in names)
+
+
+def test_unchanged_packages_without_parts_are_delivered_again(tmp_path, calls):
+    output_dir = tmp_path / 'out'
+    output_dir.mkdir()
+    packs = make_packs(tmp_path / 'src')
+    DeliveryEngine(output_dir, incremental=True).deliver(packs)
+    shutil.rmtree(output_dir / WORK_DIRECTORY_NAME / 'parts' / KEYS[0])
+    calls.clear()
+    engine = DeliveryEngine(output_dir, incremental=True)
+    plan = engine.plan(packs)
+    assert [pack.key for pack in plan.changed] == KEYS[:1]
+    assert dict(engine.run(packs, plan=plan)) == {KEYS[0]: None}
+    assert sorted(read_note(output_dir)[1:]) == KEYS
+
+
+def test_only_unchanged_copies_are_placed(tmp_path, calls, monkeypatch):
+    output_dir = tmp_path / 'out'
+    output_dir.mkdir()
+    packs = make_packs(tmp_path / 'src')
+    copy2 = shutil.copy2
+
+    def copy(source, target):
+        # A copy without the mtime of the source, e.g. a file that has been processed, is kept
+        if source.suffix == '.txt':
+            return shutil.copyfile(source, target)
+        return copy2(source, target)
+
+    monkeypatch.setattr(shutil, 'copy2', copy)
+    engine = DeliveryEngine(output_dir, placement='hardlink')
+    assert engine.deliver(packs) == {}
+    for pack in packs:
+        txt, hex_file = sorted(pack.files, key=lambda path: path.suffix != '.txt')
+        assert not os.path.samefile(txt, output_dir / txt.name)
+        assert os.path.samefile(hex_file, output_dir / hex_file.name)
+    assert engine.placer.report.files == {'hardlink': (3, 12)}
@@ -0,0 +1,137 @@
+import gc
+import threading
+
+import pytest
+
+from sharktools_data_delivery.events import EventBus
+from sharktools_data_delivery.events import InvalidEventType
+
+
+class Page:
+
+    def __init__(self, calls, name):
+        self.calls = calls
+        self.name = name
+
+    def on_select(self, data, **kwargs):
+        self.calls.append((self.name, data))
+
+
+def test_handlers_are_called_by_priority_and_subscription_order():
+    bus = EventBus()
+    calls = []
+
+    def first(data):
+        calls.append('first')
+
+    def second(data):
+        calls.append('second')
+
+    def before(data):
+        calls.append('before')
+
+    def after(data):
+        calls.append('after')
+
+    bus.subscribe('select_platform', after, after=True)
+    bus.subscribe('select_platform', first)
+    bus.subscribe('select_platform', second)
+    bus.subscribe('select_platform', before, before=True)
+    bus.post_event('select_platform', None)
+    assert calls == ['before', 'first', 'second', 'after']
+    bus.unsubscribe('select_platform', first)
+    calls.clear()
+    bus.post_event('select_platform', None)
+    assert calls == ['before', 'second', 'after']
+
+
+def test_unknown_event_type():
+    with pytest.raises(InvalidEventType):
+        EventBus().subscribe('unknown', print)
+
+
+def test_bound_methods_are_held_weakly():
+    bus = EventBus()
+    calls = []
+    page = Page(calls, 'page')
+    bus.subscribe('select_platform', page.on_select)
+    bus.post_event('select_platform', '77SE')
+    assert calls == [('page', '77SE')]
+    del page
+    gc.collect()
+    bus.post_event('select_platform', '34AR')
+    assert calls == [('page', '77SE')]
+    assert bus.nr_subscribers('select_platform') == 0
+
+
+def test_method_of_new_instance_replaces_the_old_subscription():
+    bus = EventBus()
+    calls = []
+    old = Page(calls, 'old')
+    new = Page(calls, 'new')
+    bus.subscribe('select_platform', old.on_select)
+    bus.subscribe('select_platform', new.on_select)
+    bus.post_event('select_platform', '77SE')
+    assert calls == [('new', '77SE')]
+
+
+def test_threaded_handler_passes_result_on():
+    bus = EventBus()
+    done = threading.Event()
+    results = []
+
+    def work(data):
+        return data * 2
+
+    def on_result(result):
+        results.append(result)
+        done.set()
+
+    bus.subscribe('select_platform', work, threaded=True, on_result=on_result)
+    bus.post_event('select_platform', 21)
+    assert done.wait(5)
+    assert results == [42]
+    bus.shutdown()
+
+
+def test_coalesced_events_are_dispatched_once_with_the_latest_data():
+    bus = EventBus()
+    calls = []
+    bus.subscribe('change_year', calls.append)
+    bus.set_coalescing('change_year', 10000)
+    for year in ['2021', '2022', '2023']:
+        bus.post_event('change_year', year)
+    assert calls == []
+    bus.flush()
+    assert calls == ['2023']
+    bus.flush()
+    assert calls == ['2023']
+
+
+def test_coalescing_window_is_timed():
+    bus = EventBus()
+    done = threading.Event()
+    calls = []
+
+    def on_change_year(data):
+        calls.append(data)
+        done.set()
+
+    bus.subscribe('change_year', on_change_year)
+    bus.set_coalescing('change_year', 20)
+    bus.post_event('change_year', '2022')
+    bus.post_event('change_year', '2023')
+    assert done.wait(5)
+    assert calls == ['2023']
+
+
+def test_turning_coalescing_off_dispatches_pending_events():
+    bus = EventBus()
+    calls = []
+    bus.subscribe('change_year', calls.append)
+    bus.set_coalescing('change_year', 10000)
+    bus.post_event('change_year', '2023')
+    bus.set_coalescing('change_year', None)
+    assert calls == ['2023']
+    bus.post_event('change_year', '2024')
+    assert calls == ['2023', '2024']
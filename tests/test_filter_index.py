@@ -0,0 +1,53 @@
+from sharktools_data_delivery.filter_index import PackageFilterIndex
+
+KEYS = ['SBE09_1387_20230110_1204_77SE_00_0123',
+        'SBE09_1387_20230111_0830_77SE_00_0124',
+        'SBE09_1387_20220505_1000_34AR_01_0012',
+        'SBE911_0745_20230601_1200_34AR_02_0456']
+
+
+def make_index():
+    index = PackageFilterIndex()
+    for key in KEYS:
+        index.add(key, file_name=f'{key}.txt')
+    index.add('not_a_package_key')
+    return index
+
+
+def test_years_and_ships():
+    index = make_index()
+    assert len(index) == 5
+    assert index.get_years() == ['2022', '2023']
+    assert index.get_ships() == ['34AR', '77SE']
+    assert index.get_ships('2022') == ['34AR']
+    assert index.get_sernos('2023', '77SE') == ['0123', '0124']
+    assert index.get_keys('2023', '77SE') == set(KEYS[:2])
+
+
+def test_search():
+    index = make_index()
+    assert index.search() is None
+    assert index.search('2023 77se') == set(KEYS[:2])
+    assert index.search('77SE, 012') == set(KEYS[:2])
+    assert index.search('0124') == {KEYS[1]}
+    assert index.search('not_a') == {'not_a_package_key'}
+    assert index.search(f'{KEYS[3]}.t') == {KEYS[3]}
+    assert index.search('2023', ship='34AR') == {KEYS[3]}
+    assert index.search('', year='2022') == {KEYS[2]}
+    assert index.search('77se 2022') == set()
+
+
+def test_remove_and_update():
+    index = make_index()
+    assert index.search('77se') == set(KEYS[:2])
+    index.remove(KEYS[0])
+    index.remove('missing')
+    assert KEYS[0] not in index
+    assert index.search('77se') == {KEYS[1]}
+    index.remove(KEYS[1])
+    assert index.get_ships('2023') == ['34AR']
+    index.add(KEYS[3], file_name='renamed.txt')
+    assert index.search('renamed') == {KEYS[3]}
+    assert index.search(f'{KEYS[3]}.txt') == set()
+    index.clear()
+    assert len(index) == 0 and index.get_years() == []
@@ -0,0 +1,81 @@
+import os
+import time
+
+from sharktools_data_delivery.listing import DirectoryListing
+from sharktools_data_delivery.listing import ListingMetrics
+
+from .conftest import make_files
+
+
+def set_old_mtime(directory, age=60):
+    old = time.time() - age
+    os.utime(directory, (old, old))
+
+
+def make_listing(**kwargs):
+    metrics = ListingMetrics()
+    return DirectoryListing(metrics_hook=metrics, **kwargs), metrics
+
+
+def test_listing_with_suffix(tmp_path):
+    make_files(tmp_path, ['a.txt', 'b.cnv', 'sub/c.txt'])
+    listing, metrics = make_listing()
+    assert sorted(listing.get_files(tmp_path)) == ['a.txt', 'b.cnv']
+    assert listing.get_files(tmp_path, suffix='.txt') == ['a.txt']
+    assert listing.get_files(tmp_path / 'missing') == []
+
+
+def test_unchanged_directory_is_cached(tmp_path):
+    make_files(tmp_path, ['a.txt'])
+    set_old_mtime(tmp_path)
+    listing, metrics = make_listing()
+    listing.get_files(tmp_path)
+    listing.get_files(tmp_path)
+    assert (metrics.calls[str(tmp_path)], metrics.hits[str(tmp_path)]) == (2, 1)
+
+
+def test_recently_changed_directory_is_not_cached(tmp_path):
+    make_files(tmp_path, ['a.txt'])
+    listing, metrics = make_listing()
+    listing.get_files(tmp_path)
+    listing.get_files(tmp_path)
+    assert metrics.hits[str(tmp_path)] == 0
+
+
+def test_changed_mtime_invalidates(tmp_path):
+    make_files(tmp_path, ['a.txt'])
+    set_old_mtime(tmp_path, age=120)
+    listing, metrics = make_listing()
+    assert listing.get_files(tmp_path) == ['a.txt']
+    make_files(tmp_path, ['b.txt'])
+    set_old_mtime(tmp_path, age=60)
+    assert sorted(listing.get_files(tmp_path)) == ['a.txt', 'b.txt']
+    assert metrics.hits[str(tmp_path)] == 0
+
+
+def test_invalidate(tmp_path):
+    make_files(tmp_path, ['a.txt'])
+    set_old_mtime(tmp_path)
+    listing, metrics = make_listing()
+    listing.get_files(tmp_path)
+    listing.get_files(tmp_path, suffix='.txt')
+    listing.invalidate(tmp_path)
+    listing.get_files(tmp_path)
+    listing.get_files(tmp_path, suffix='.txt')
+    assert metrics.hits[str(tmp_path)] == 0
+
+
+def test_least_recently_used_is_evicted(tmp_path):
+    directories = [tmp_path / name for name in 'abc']
+    for directory in directories:
+        make_files(directory, ['a.txt'])
+        set_old_mtime(directory)
+    listing, metrics = make_listing(max_size=2)
+    for directory in directories[:2]:
+        listing.get_files(directory)
+    listing.get_files(directories[0])
+    listing.get_files(directories[2])
+    listing.get_files(directories[0])
+    listing.get_files(directories[1])
+    assert metrics.hits[str(directories[0])] == 2
+    assert metrics.hits[str(directories[1])] == 0
@@ -0,0 +1,67 @@
+from sharktools_data_delivery.manifest import DeliveryManifest
+from sharktools_data_delivery.manifest import MANIFEST_FILE_NAME
+
+from .conftest import FakePackage
+from .conftest import make_files
+
+KEYS = ['SBE09_1387_20230110_1204_77SE_00_0123', 'SBE09_1387_20230111_1204_77SE_00_0124']
+
+
+def make_packs(root):
+    return [FakePackage(key, make_files(root, [f'{key}.txt', f'{key}.hex'])) for key in KEYS]
+
+
+def deliver(output_dir, packs):
+    manifest = DeliveryManifest(output_dir)
+    plan = manifest.get_plan(packs)
+    for pack in plan.to_deliver:
+        manifest.set_package_state(pack.key, plan.states[pack.key])
+    manifest.save()
+    return plan
+
+
+def keys(packs):
+    return [pack.key for pack in packs]
+
+
+def test_plan_without_manifest_delivers_all(tmp_path):
+    packs = make_packs(tmp_path / 'src')
+    plan = DeliveryManifest(tmp_path).get_plan(packs)
+    assert (keys(plan.added), plan.changed, plan.unchanged) == (KEYS, [], [])
+
+
+def test_plan_after_delivery(tmp_path):
+    packs = make_packs(tmp_path / 'src')
+    deliver(tmp_path, packs)
+    packs[1].files[0].write_bytes(b'changed')
+    new_pack = FakePackage('SBE09_1387_20230112_1204_77SE_00_0125',
+                           make_files(tmp_path / 'src', ['SBE09_1387_20230112_1204_77SE_00_0125.txt']))
+    plan = DeliveryManifest(tmp_path).get_plan(packs + [new_pack])
+    assert keys(plan.added) == [new_pack.key]
+    assert keys(plan.changed) == KEYS[1:]
+    assert keys(plan.unchanged) == KEYS[:1]
+    assert plan.summary() == '1 nya, 1 ändrade och 1 oförändrade paket'
+
+
+def test_touched_file_with_same_content_is_unchanged(tmp_path):
+    packs = make_packs(tmp_path / 'src')
+    deliver(tmp_path, packs)
+    packs[0].files[0].write_bytes(b'data')
+    plan = DeliveryManifest(tmp_path).get_plan(packs)
+    assert keys(plan.unchanged) == KEYS
+
+
+def test_checksum_is_reused_for_unchanged_files(tmp_path, monkeypatch):
+    packs = make_packs(tmp_path / 'src')
+    deliver(tmp_path, packs)
+    monkeypatch.setattr('sharktools_data_delivery.manifest.sha256_file', lambda path: 1 / 0)
+    plan = DeliveryManifest(tmp_path).get_plan(packs)
+    assert keys(plan.unchanged) == KEYS
+
+
+def test_unreadable_manifest_delivers_all(tmp_path):
+    packs = make_packs(tmp_path / 'src')
+    deliver(tmp_path, packs)
+    (tmp_path / MANIFEST_FILE_NAME).write_text('{not json')
+    plan = DeliveryManifest(tmp_path).get_plan(packs)
+    assert keys(plan.added) == KEYS
@@ -0,0 +1,87 @@
+import errno
+import os
+
+import pytest
+
+from sharktools_data_delivery.mirror import MirrorCache
+from sharktools_data_delivery.mirror import MirrorSyncer
+
+from .conftest import make_files
+
+
+def make_mirror(tmp_path, **kwargs):
+    server_root = tmp_path / 'srv'
+    make_files(server_root, ['2022/a.txt', '2023/b.txt', '2023/c.hex'], content=lambda rel_path: rel_path.encode())
+    return MirrorCache(server_root, mirror_directory=tmp_path / 'mirror', **kwargs)
+
+
+def sync(mirror):
+    return [error for done, total, rel_path, error in mirror.sync() if error]
+
+
+def test_sync_copies_new_files(tmp_path):
+    mirror = make_mirror(tmp_path)
+    plan = mirror.plan()
+    assert plan.to_copy == ['2022/a.txt', '2023/b.txt', '2023/c.hex']
+    assert sync(mirror) == []
+    assert (mirror.local_root / '2023/c.hex').read_bytes() == b'2023/c.hex'
+    plan = mirror.plan()
+    assert (plan.to_copy, plan.to_remove, plan.nr_unchanged) == ([], [], 3)
+
+
+def test_sync_updates_changed_and_removed_files(tmp_path):
+    mirror = make_mirror(tmp_path)
+    sync(mirror)
+    (mirror.server_root / '2023/b.txt').write_bytes(b'changed')
+    (mirror.server_root / '2022/a.txt').unlink()
+    plan = mirror.plan()
+    assert (plan.to_copy, plan.to_remove) == (['2023/b.txt'], ['2022/a.txt'])
+    assert sync(mirror) == []
+    assert (mirror.local_root / '2023/b.txt').read_bytes() == b'changed'
+    assert not (mirror.local_root / '2022/a.txt').exists()
+
+
+def test_compare_checksum_finds_same_size_changes(tmp_path):
+    mirror = make_mirror(tmp_path, compare='checksum')
+    sync(mirror)
+    path = mirror.server_root / '2023/b.txt'
+    stat = path.stat()
+    path.write_bytes(b'2023/B.txt')
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert mirror.plan().to_copy == ['2023/b.txt']
+
+
+def test_files_under_directory_that_can_not_be_listed_are_kept(tmp_path, monkeypatch):
+    mirror = make_mirror(tmp_path)
+    sync(mirror)
+    failing = str(mirror.server_root / '2023')
+    scandir = os.scandir
+
+    def scandir_with_error(path):
+        if str(path) == failing:
+            raise OSError(errno.EIO, 'Input/output error', path)
+        return scandir(path)
+
+    monkeypatch.setattr(os, 'scandir', scandir_with_error)
+    plan = mirror.plan()
+    assert plan.failed_directories == ['2023']
+    assert (plan.to_copy, plan.to_remove) == ([], [])
+    assert sync(mirror) == []
+    assert (mirror.local_root / '2023/b.txt').exists()
+
+
+def test_server_root_that_can_not_be_listed_raises(tmp_path):
+    mirror = make_mirror(tmp_path)
+    sync(mirror)
+    mirror.server_root.rename(tmp_path / 'unreachable')
+    with pytest.raises(OSError):
+        mirror.plan()
+
+
+def test_syncer_puts_progress_on_queue(tmp_path):
+    syncer = MirrorSyncer(make_mirror(tmp_path))
+    syncer.start()
+    syncer.join(10)
+    kinds = [message.kind for message in syncer.get_messages()]
+    assert kinds == ['plan', 'file', 'file', 'file', 'done']
+    assert syncer.get_messages() == []
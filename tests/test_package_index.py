@@ -0,0 +1,47 @@
+import os
+
+from sharktools_data_delivery.package_index import PackageIndex
+
+from .conftest import make_files
+
+KEY = 'SBE09_1387_20230110_1204_77SE_00_0123'
+
+
+def get_files(packs):
+    return {pack.key: sorted(str(path) for path in pack.files) for pack in packs}
+
+
+def test_get_packages(tmp_path, fake_grouping):
+    root = tmp_path / 'root'
+    make_files(root, [f'data/{KEY}.txt', f'raw/{KEY}.hex'])
+    index = PackageIndex(tmp_path / 'index.sqlite')
+    assert get_files(index.get_packages(root)) == {KEY: [str(root / 'data' / f'{KEY}.txt'),
+                                                         str(root / 'raw' / f'{KEY}.hex')]}
+
+
+def test_get_packages_only_returns_files_in_directory(tmp_path, fake_grouping):
+    root_a = tmp_path / 'A'
+    root_b = tmp_path / 'B'
+    make_files(root_a, [f'{KEY}.txt', f'{KEY}.hex'])
+    make_files(root_b, [f'{KEY}.txt', f'{KEY}.hex'])
+    index = PackageIndex(tmp_path / 'index.sqlite')
+    index.get_packages(root_a)
+    assert get_files(index.get_packages(root_b)) == {KEY: [str(root_b / f'{KEY}.hex'), str(root_b / f'{KEY}.txt')]}
+    assert get_files(index.get_packages(root_a)) == {KEY: [str(root_a / f'{KEY}.hex'), str(root_a / f'{KEY}.txt')]}
+
+
+def test_get_packages_not_recursive(tmp_path, fake_grouping):
+    make_files(tmp_path / 'root', [f'{KEY}.txt', f'sub/{KEY}.hex'])
+    index = PackageIndex(tmp_path / 'index.sqlite')
+    root = tmp_path / 'root'
+    index.get_packages(root)
+    assert get_files(index.get_packages(root, recursive=False)) == {KEY: [str(root / f'{KEY}.txt')]}
+
+
+def test_removed_file_is_removed_from_package(tmp_path, fake_grouping):
+    root = tmp_path / 'root'
+    txt, hex_ = make_files(root, [f'{KEY}.txt', f'{KEY}.hex'])
+    index = PackageIndex(tmp_path / 'index.sqlite')
+    index.get_packages(root)
+    os.remove(hex_)
+    assert get_files(index.get_packages(root)) == {KEY: [str(txt)]}
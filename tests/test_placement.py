@@ -0,0 +1,76 @@
+import errno
+import os
+
+import pytest
+
+from sharktools_data_delivery import placement
+from sharktools_data_delivery.placement import BUFFERED
+from sharktools_data_delivery.placement import FilePlacer
+from sharktools_data_delivery.placement import HARDLINK
+from sharktools_data_delivery.placement import PlacementError
+from sharktools_data_delivery.placement import REFLINK
+from sharktools_data_delivery.placement import get_strategies
+
+from .conftest import make_files
+
+
+def fail_with(error_number, calls):
+    def func(source, target):
+        calls.append(target)
+        raise OSError(error_number, os.strerror(error_number))
+    return func
+
+
+def test_get_strategies():
+    assert get_strategies('auto', default=[REFLINK]) == [REFLINK]
+    assert get_strategies(HARDLINK) == [HARDLINK, BUFFERED]
+    assert get_strategies(REFLINK, fallback=()) == [REFLINK]
+    with pytest.raises(ValueError):
+        get_strategies('unknown')
+
+
+def test_unsupported_strategy_falls_back_and_is_not_tried_again(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setitem(placement._FUNCTIONS, REFLINK, fail_with(errno.EXDEV, calls))
+    sources = make_files(tmp_path / 'src', ['a.txt', 'b.txt'])
+    old = 1_600_000_000
+    os.utime(sources[0], (old, old))
+    (tmp_path / 'out').mkdir()
+    placer = FilePlacer([REFLINK, BUFFERED])
+    for source in sources:
+        assert placer.place(source, tmp_path / 'out' / source.name) == BUFFERED
+    assert len(calls) == 1
+    assert placer.get_strategy(sources[0], tmp_path / 'out') == BUFFERED
+    target = tmp_path / 'out' / 'a.txt'
+    assert target.read_bytes() == b'data' and not os.path.samefile(sources[0], target)
+    assert int(target.stat().st_mtime) == old
+    assert placer.report.files == {BUFFERED: (2, 8)}
+    assert not list((tmp_path / 'out').glob('*.place-tmp'))
+
+
+def test_other_errors_are_raised(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setitem(placement._FUNCTIONS, REFLINK, fail_with(errno.ENOSPC, calls))
+    source, = make_files(tmp_path / 'src', ['a.txt'])
+    placer = FilePlacer([REFLINK, BUFFERED])
+    with pytest.raises(OSError):
+        placer.place(source, tmp_path / 'a.txt')
+    assert placer.is_supported(source, tmp_path)
+
+
+def test_no_supported_strategy(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setitem(placement._FUNCTIONS, REFLINK, fail_with(errno.EOPNOTSUPP, calls))
+    source, = make_files(tmp_path / 'src', ['a.txt'])
+    placer = FilePlacer([REFLINK])
+    with pytest.raises(PlacementError):
+        placer.place(source, tmp_path / 'a.txt')
+    assert not placer.is_supported(source, tmp_path)
+    assert not (tmp_path / 'a.txt').exists()
+
+
+def test_hardlink_replaces_target(tmp_path):
+    source, = make_files(tmp_path / 'src', ['a.txt'])
+    target, = make_files(tmp_path / 'out', ['a.txt'], content=b'copy')
+    assert FilePlacer([HARDLINK]).place(source, target) == HARDLINK
+    assert os.path.samefile(source, target)
@@ -0,0 +1,66 @@
+import json
+import os
+import time
+
+import pytest
+
+from sharktools_data_delivery.saves import FileLock
+from sharktools_data_delivery.saves import SettingsStore
+
+
+def read(path):
+    with open(path) as fid:
+        return json.load(fid)
+
+
+def test_changes_are_written_once_after_the_delay(tmp_path, monkeypatch):
+    path = tmp_path / 'saves.json'
+    store = SettingsStore(path, save_delay=0.05)
+    writes = []
+    replace = os.replace
+    monkeypatch.setattr(os, 'replace', lambda *args: writes.append(args) or replace(*args))
+    store.set('a', 1)
+    store.set('b', 2)
+    store.set('a', 3)
+    assert not path.exists()
+    time.sleep(0.3)
+    assert read(path) == {'a': 3, 'b': 2}
+    assert len(writes) == 1
+
+
+def test_flush_keeps_keys_changed_by_other_stores(tmp_path):
+    path = tmp_path / 'saves.json'
+    path.write_text(json.dumps({'ctd': 'old', 'other': 'old'}))
+    store = SettingsStore(path, save_delay=60)
+    assert store.get('ctd') == 'old'
+    other = SettingsStore(path, save_delay=60)
+    other.set('other', 'new')
+    other.flush()
+    store.set('ctd', 'new')
+    store.flush()
+    assert read(path) == {'ctd': 'new', 'other': 'new'}
+    assert store.get('other') == 'new'
+    assert not list(tmp_path.glob('*.tmp')) and not list(tmp_path.glob('*.lock'))
+
+
+def test_unreadable_file_gives_empty_settings(tmp_path):
+    path = tmp_path / 'saves.json'
+    path.write_text('{not json')
+    assert SettingsStore(path).get('ctd', 'default') == 'default'
+
+
+def test_stale_lock_is_removed(tmp_path):
+    lock_path = tmp_path / 'saves.json.lock'
+    lock_path.write_text('123')
+    old = time.time() - 120
+    os.utime(lock_path, (old, old))
+    with FileLock(lock_path, timeout=1, stale_after=60):
+        assert lock_path.read_text() == str(os.getpid())
+    assert not lock_path.exists()
+
+
+def test_lock_times_out(tmp_path):
+    lock_path = tmp_path / 'saves.json.lock'
+    lock_path.write_text('123')
+    with pytest.raises(TimeoutError):
+        FileLock(lock_path, timeout=0.1, stale_after=60).acquire()
@@ -0,0 +1,71 @@
+import pytest
+
+from sharktools_data_delivery import scanner
+from sharktools_data_delivery.package_index import PackageIndex
+from sharktools_data_delivery.scanner import ScanError
+from sharktools_data_delivery.scanner import iter_package_batches_for_roots
+
+from .conftest import make_files
+
+KEY = 'SBE09_1387_20230110_1204_77SE_00_0123'
+OTHER_KEY = 'SBE09_1387_20230111_1204_77SE_00_0124'
+
+
+def scan(roots, index=None):
+    packs = {}
+    for done, total, packages in iter_package_batches_for_roots(roots, index=index):
+        for pack in packages:
+            packs[pack.key] = pack
+    return packs
+
+
+def make_roots(tmp_path):
+    root_a = tmp_path / 'A'
+    root_b = tmp_path / 'B'
+    make_files(root_a, [f'2023/{KEY}.txt', f'2023/{KEY}.hex'])
+    make_files(root_b, [f'2023/{KEY}.txt', f'2023/{OTHER_KEY}.txt'])
+    return root_a, root_b
+
+
+def test_first_root_takes_precedence(tmp_path, fake_grouping):
+    root_a, root_b = make_roots(tmp_path)
+    packs = scan([root_a, root_b])
+    assert {path.parent.parent for path in packs[KEY].files} == {root_a}
+    assert packs[OTHER_KEY].files[0].parent.parent == root_b
+    packs = scan([root_b, root_a])
+    assert {path.parent.parent for path in packs[KEY].files} == {root_b}
+
+
+def test_single_root_with_shared_index(tmp_path, fake_grouping):
+    root_a, root_b = make_roots(tmp_path)
+    index = PackageIndex(tmp_path / 'index.sqlite')
+    scan([root_a], index=index)
+    packs = scan([root_b], index=index)
+    assert all(path.is_relative_to(root_b) for pack in packs.values() for path in pack.files)
+
+
+def test_several_roots_with_shared_index(tmp_path, fake_grouping):
+    root_a, root_b = make_roots(tmp_path)
+    index = PackageIndex(tmp_path / 'index.sqlite')
+    scan([root_b], index=index)
+    packs = scan([root_a, root_b], index=index)
+    assert {path.parent.parent for path in packs[KEY].files} == {root_a}
+    assert len(packs[KEY].files) == 2
+
+
+def test_error_in_one_root_is_raised(tmp_path, fake_grouping, monkeypatch):
+    root_a, root_b = make_roots(tmp_path)
+    iter_package_batches = scanner.iter_package_batches
+
+    def fake_iter_package_batches(root, cancel_event=None, **kwargs):
+        if root == root_a:
+            raise OSError('walk failed')
+        # Root B finishes after the error of root A has been received
+        cancel_event.wait(5)
+        yield from iter_package_batches(root, **kwargs)
+
+    monkeypatch.setattr(scanner, 'iter_package_batches', fake_iter_package_batches)
+    # One group per root so that the roots are scanned concurrently
+    monkeypatch.setattr(scanner, 'get_root_groups', lambda roots: [[(rank, root)] for rank, root in enumerate(roots)])
+    with pytest.raises(ScanError, match='walk failed'):
+        scan([root_a, root_b])
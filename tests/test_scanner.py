@@ -0,0 +1,48 @@
+from sharktools_data_delivery.scanner import PackageCollector
+from sharktools_data_delivery.scanner import get_scan_chunks
+from sharktools_data_delivery.scanner import iter_package_batches
+
+from .conftest import FakePackage
+from .conftest import make_files
+
+KEY = 'SBE09_1387_20230110_1204_77SE_00_0123'
+
+
+def test_scan_chunks_split_single_year_root(tmp_path):
+    make_files(tmp_path, [f'2023/{sub}/{KEY}.{sub}' for sub in ['data', 'cnv', 'raw']])
+    chunks = get_scan_chunks(tmp_path)
+    assert chunks == [(tmp_path, False),
+                      (tmp_path / '2023', False),
+                      (tmp_path / '2023' / 'cnv', True),
+                      (tmp_path / '2023' / 'data', True),
+                      (tmp_path / '2023' / 'raw', True)]
+
+
+def test_scan_chunks_stop_at_min_chunks(tmp_path):
+    make_files(tmp_path, [f'{year}/{sub}/{KEY}.txt' for year in range(2000, 2010) for sub in ['a', 'b']])
+    chunks = get_scan_chunks(tmp_path, min_chunks=5)
+    assert chunks == [(tmp_path, False)] + [(tmp_path / str(year), True) for year in range(2000, 2010)]
+
+
+def test_scan_chunks_skip_exclude_directory(tmp_path):
+    make_files(tmp_path, [f'2023/temp/{KEY}.txt', f'2023/data/{KEY}.txt'])
+    directories = [directory for directory, recursive in get_scan_chunks(tmp_path)]
+    assert tmp_path / '2023' / 'temp' not in directories
+
+
+def test_collector_merges_packages_from_several_chunks(tmp_path, fake_grouping):
+    txt, hex_ = make_files(tmp_path, [f'data/{KEY}.txt', f'raw/{KEY}.hex'])
+    collector = PackageCollector()
+    assert collector.add([FakePackage(KEY, [txt])])[0].files == [txt]
+    merged = collector.add([FakePackage(KEY, [hex_])])
+    assert len(merged) == 1
+    assert sorted(merged[0].files) == sorted([txt, hex_])
+
+
+def test_iter_package_batches_streams_chunks(tmp_path, fake_grouping):
+    make_files(tmp_path, [f'2023/{sub}/{KEY}.{sub}' for sub in ['data', 'cnv', 'raw']])
+    batches = list(iter_package_batches(tmp_path))
+    assert len(batches) == 5
+    assert [total for done, total, packages in batches] == [5] * 5
+    packs = {pack.key: pack for done, total, packages in batches for pack in packages}
+    assert len(packs[KEY].files) == 3
@@ -0,0 +1,74 @@
+import pytest
+
+from sharktools_data_delivery.package_key import parse_package_key
+from sharktools_data_delivery.sharkweb import SharkwebFormatError
+from sharktools_data_delivery.sharkweb import SharkwebIndex
+
+HEADER = 'platform_code\tstation_name\tsample_date\tvisit_id\tparameter\tvalue\n'
+ROWS = ['77SE\tBY15\t2023-01-10\t1\tTEMP\t4.1\n',
+        '77SE\tBY15\t2023-01-10\t1\tSALT\t7.2\n',
+        '77SE\tBY31\t2023-01-11\t2\tTEMP\t3.9\n',
+        '77SE\tBY15\t2023-01-10\t1\tDOXY\t8.0\n',
+        '34AR\tANHOLT E\t2023-01-10\t3\tTEMP\t5.0\n',
+        'too\tshort\n']
+
+
+def test_parse_package_key():
+    info = parse_package_key('SBE09_1387_20230110_1204_77se_00_0123')
+    assert (info.instrument, info.instrument_serial, info.year, info.date, info.time) == \
+           ('SBE09', '1387', '2023', '20230110', '1204')
+    assert (info.ship, info.cruise, info.serno) == ('77SE', '00', '0123')
+
+
+def test_parse_package_key_with_underscore_in_instrument():
+    info = parse_package_key('SBE_09_1387_20230110_1204_77SE_00_0123')
+    assert (info.instrument, info.ship) == ('SBE_09', '77SE')
+
+
+def test_parse_package_key_with_other_format():
+    info = parse_package_key('some_other_file')
+    assert info.key == 'some_other_file'
+    assert info.year == info.ship == ''
+
+
+@pytest.fixture
+def sharkweb_file(tmp_path):
+    path = tmp_path / 'sharkweb.txt'
+    path.write_text(HEADER + ''.join(ROWS), encoding='cp1252')
+    return path
+
+
+def test_index_and_rows(sharkweb_file, tmp_path):
+    index = SharkwebIndex(sharkweb_file, cache_directory=tmp_path / 'cache')
+    assert len(index) == 3
+    key = ('77SE', 'BY15', '20230110', '1')
+    assert index.find('77se', '2023-01-10') == [key]
+    assert index.find_for_package('SBE09_1387_20230110_1204_77SE_00_0123') == [key]
+    assert index.find_for_package('unknown') == []
+    assert [row['parameter'] for row in index.iter_rows(key)] == ['TEMP', 'SALT', 'DOXY']
+
+
+def test_index_is_cached_until_the_file_changes(sharkweb_file, tmp_path, monkeypatch):
+    SharkwebIndex(sharkweb_file, cache_directory=tmp_path / 'cache')
+    monkeypatch.setattr(SharkwebIndex, '_build', lambda self: 1 / 0)
+    assert len(SharkwebIndex(sharkweb_file, cache_directory=tmp_path / 'cache')) == 3
+    with open(sharkweb_file, 'a') as fid:
+        fid.write('77SE\tBY5\t2023-01-12\t4\tTEMP\t2.0\n')
+    with pytest.raises(ZeroDivisionError):
+        SharkwebIndex(sharkweb_file, cache_directory=tmp_path / 'cache')
+
+
+def test_index_is_used_if_the_cache_can_not_be_written(sharkweb_file, tmp_path):
+    # A file where the cache directory should be
+    cache_directory = tmp_path / 'cache'
+    cache_directory.write_text('')
+    index = SharkwebIndex(sharkweb_file, cache_directory=cache_directory)
+    assert len(index) == 3
+    assert index.find('77SE', '2023-01-11') == [('77SE', 'BY31', '20230111', '2')]
+
+
+def test_missing_columns(tmp_path):
+    path = tmp_path / 'sharkweb.txt'
+    path.write_text('a\tb\n1\t2\n')
+    with pytest.raises(SharkwebFormatError):
+        SharkwebIndex(path, cache_directory=None)
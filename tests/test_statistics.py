@@ -0,0 +1,45 @@
+from sharktools_data_delivery.statistics import SuffixStatistics
+from sharktools_data_delivery.statistics import format_bytes
+from sharktools_data_delivery.statistics import get_package_statistics
+from sharktools_data_delivery.statistics import get_statistics_for_packs
+from sharktools_data_delivery.statistics import sort_suffixes
+
+from .conftest import FakePackage
+from .conftest import make_files
+
+
+def test_package_statistics(tmp_path):
+    files = make_files(tmp_path, ['a.txt', 'a.cnv', 'a_2.cnv'], content=b'12345')
+    pack = FakePackage('a', files + [tmp_path / 'removed.hex'])
+    assert get_package_statistics(pack) == {'.txt': (1, 5), '.cnv': (2, 10), '.hex': (1, 0)}
+
+
+def test_add_and_remove_update_totals():
+    stat = SuffixStatistics()
+    stat.add('a', {'.txt': (1, 10), '.cnv': (1, 100)})
+    stat.add('b', {'.txt': (1, 20)})
+    assert (stat.total_nr_files, stat.total_nr_bytes) == (3, 130)
+    stat.add('a', {'.txt': (1, 15)})
+    assert (stat.nr_files['.txt'], stat.nr_bytes['.txt']) == (2, 35)
+    assert stat.suffixes == ['.txt']
+    stat.remove('b')
+    stat.remove('missing')
+    assert len(stat) == 1 and 'a' in stat and 'b' not in stat
+    assert (stat.total_nr_files, stat.total_nr_bytes) == (1, 15)
+
+
+def test_statistics_for_packs(tmp_path):
+    packs = [FakePackage(key, make_files(tmp_path, [f'{key}.txt', f'{key}.hex'])) for key in ['a', 'b']]
+    stat = get_statistics_for_packs(packs)
+    assert stat.suffixes == ['.txt', '.hex']
+    assert stat.total_nr_bytes == 16
+
+
+def test_sort_suffixes():
+    assert sort_suffixes(['.zzz', '.hex', '.abc', '.txt']) == ['.txt', '.hex', '.abc', '.zzz']
+
+
+def test_format_bytes():
+    assert format_bytes(512) == '512 B'
+    assert format_bytes(1536) == '1.5 kB'
+    assert format_bytes(3 * 1024**4) == '3072.0 GB'